@@ -45,6 +45,12 @@ setup(name='tap-quickbooks',
         'dev': [
             'pytest>=7.0.0',
             'pre-commit>=2.17.0',
+        ],
+        'fast': [
+            'orjson>=3.0.0',
+        ],
+        'streaming': [
+            'ijson>=3.1',
         ]
     },
 )
@@ -6,10 +6,14 @@ from singer import metadata, metrics
 import tap_quickbooks.quickbooks as quickbooks
 from tap_quickbooks.sync import (sync_stream, get_stream_version)
 from tap_quickbooks.quickbooks import Quickbooks
+from tap_quickbooks.quickbooks.batch import QueryBatch
+from tap_quickbooks.quickbooks.cdc import ChangeFeed
 from tap_quickbooks.quickbooks.exceptions import (
     TapQuickbooksException, TapQuickbooksQuotaExceededException)
 import threading
 from tap_quickbooks.util import cleanup
+from tap_quickbooks.writer import MessageWriter
+from tap_quickbooks.scheduler import StreamScheduler
 import atexit
 
 from hotglue_singer_sdk.tap_base import Tap
@@ -60,6 +64,14 @@ def build_state(raw_state, catalog):
         elif replication_method == 'FULL_TABLE' and version is None:
             state = singer.write_bookmark(state, tap_stream_id, 'version', version)
 
+        # Preserve the checkpoint of an interrupted full table (report) sync,
+        # and the table version it was writing, so that the sync resumes.
+        checkpoint = singer.get_bookmark(raw_state, tap_stream_id, 'checkpoint')
+        if checkpoint is not None and not catalog_metadata.get((), {}).get('replication-key'):
+            state = singer.write_bookmark(state, tap_stream_id, 'checkpoint', checkpoint)
+            state = singer.write_bookmark(
+                state, tap_stream_id, 'version', checkpoint.get('version', version))
+
     return state
 
 # pylint: disable=undefined-variable
@@ -170,6 +182,62 @@ def do_discover(qb):
     result = {'streams': entries}
     json.dump(result, sys.stdout, indent=4)
 
+def sync_catalog_entry(qb, catalog_entry, state, state_passed, writer):
+    stream_version = get_stream_version(catalog_entry, state)
+    stream = catalog_entry['stream']
+    stream_alias = catalog_entry.get('stream_alias')
+    stream_name = catalog_entry["tap_stream_id"]
+    activate_version_message = singer.ActivateVersionMessage(
+        stream=(stream_alias or stream), version=stream_version)
+
+    catalog_metadata = metadata.to_map(catalog_entry['metadata'])
+    replication_key = catalog_metadata.get((), {}).get('replication-key')
+
+    state["current_stream"] = stream_name
+    writer.write_state(state)
+    key_properties = metadata.to_map(catalog_entry['metadata']).get((), {}).get('table-key-properties')
+    writer.write_schema(
+        stream,
+        catalog_entry['schema'],
+        key_properties,
+        replication_key,
+        stream_alias)
+
+    job_id = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'JobID')
+    if job_id:
+        with metrics.record_counter(stream) as counter:
+            # Remove Job info from state once we complete this resumed query. One of a few cases could have occurred:
+            # 1. The job succeeded, in which case make JobHighestBookmarkSeen the new bookmark
+            # 2. The job partially completed, in which case make JobHighestBookmarkSeen the new bookmark, or
+            #    existing bookmark if no bookmark exists for the Job.
+            # 3. The job completely failed, in which case maintain the existing bookmark, or None if no bookmark
+            state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('JobID', None)
+            state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('BatchIDs', None)
+            bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
+                                                 .pop('JobHighestBookmarkSeen', None)
+            existing_bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
+                                                          .pop(replication_key, None)
+            state = singer.write_bookmark(
+                state,
+                catalog_entry['tap_stream_id'],
+                replication_key,
+                bookmark or existing_bookmark) # If job is removed, reset to existing bookmark or None
+            writer.write_state(state)
+    else:
+        # Tables with a replication_key or an empty bookmark will emit an
+        # activate_version at the beginning of their sync
+        bookmark_is_empty = state.get('bookmarks', {}).get(
+            catalog_entry['tap_stream_id']) is None
+
+        if replication_key or bookmark_is_empty:
+            writer.write_message(activate_version_message)
+            state = singer.write_bookmark(state,
+                                          catalog_entry['tap_stream_id'],
+                                          'version',
+                                          stream_version)
+        counter_value = sync_stream(qb, catalog_entry, state, state_passed, writer)
+        LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter_value)
+
 def do_sync(qb, catalog, state, state_passed):
     starting_stream = state.get("current_stream")
 
@@ -178,17 +246,14 @@ def do_sync(qb, catalog, state, state_passed):
     else:
         LOGGER.info("Starting sync")
 
+    if qb.output_buffer_size is None:
+        writer = MessageWriter()
+    else:
+        writer = MessageWriter(buffer_size=qb.output_buffer_size)
+    catalog_entries = []
+
     for catalog_entry in catalog["streams"]:
-        stream_version = get_stream_version(catalog_entry, state)
-        stream = catalog_entry['stream']
-        stream_alias = catalog_entry.get('stream_alias')
         stream_name = catalog_entry["tap_stream_id"]
-        activate_version_message = singer.ActivateVersionMessage(
-            stream=(stream_alias or stream), version=stream_version)
-
-        catalog_metadata = metadata.to_map(catalog_entry['metadata'])
-        replication_key = catalog_metadata.get((), {}).get('replication-key')
-
         mdata = metadata.to_map(catalog_entry['metadata'])
 
         if not stream_is_selected(mdata):
@@ -205,53 +270,29 @@ def do_sync(qb, catalog, state, state_passed):
         else:
             LOGGER.info("%s: Starting", stream_name)
 
-        state["current_stream"] = stream_name
-        singer.write_state(state)
-        key_properties = metadata.to_map(catalog_entry['metadata']).get((), {}).get('table-key-properties')
-        singer.write_schema(
-            stream,
-            catalog_entry['schema'],
-            key_properties,
-            replication_key,
-            stream_alias)
-
-        job_id = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'JobID')
-        if job_id:
-            with metrics.record_counter(stream) as counter:
-                # Remove Job info from state once we complete this resumed query. One of a few cases could have occurred:
-                # 1. The job succeeded, in which case make JobHighestBookmarkSeen the new bookmark
-                # 2. The job partially completed, in which case make JobHighestBookmarkSeen the new bookmark, or
-                #    existing bookmark if no bookmark exists for the Job.
-                # 3. The job completely failed, in which case maintain the existing bookmark, or None if no bookmark
-                state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('JobID', None)
-                state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}).pop('BatchIDs', None)
-                bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
-                                                     .pop('JobHighestBookmarkSeen', None)
-                existing_bookmark = state.get('bookmarks', {}).get(catalog_entry['tap_stream_id'], {}) \
-                                                              .pop(replication_key, None)
-                state = singer.write_bookmark(
-                    state,
-                    catalog_entry['tap_stream_id'],
-                    replication_key,
-                    bookmark or existing_bookmark) # If job is removed, reset to existing bookmark or None
-                singer.write_state(state)
+        catalog_entries.append(catalog_entry)
+
+    if qb.cdc_sync:
+        qb.change_feed = ChangeFeed(qb, catalog_entries, state)
+    if qb.batch_lookup_streams:
+        qb.query_batch = QueryBatch(qb, catalog_entries, state)
+
+    try:
+        if qb.max_concurrent_streams > 1 and len(catalog_entries) > 1:
+            scheduler = StreamScheduler(writer, state, catalog_entries, qb.max_concurrent_streams)
+            scheduler.run(
+                lambda catalog_entry, stream_state, stream_writer: sync_catalog_entry(
+                    qb, catalog_entry, stream_state, state_passed, stream_writer))
         else:
-            # Tables with a replication_key or an empty bookmark will emit an
-            # activate_version at the beginning of their sync
-            bookmark_is_empty = state.get('bookmarks', {}).get(
-                catalog_entry['tap_stream_id']) is None
-
-            if replication_key or bookmark_is_empty:
-                singer.write_message(activate_version_message)
-                state = singer.write_bookmark(state,
-                                              catalog_entry['tap_stream_id'],
-                                              'version',
-                                              stream_version)
-            counter_value = sync_stream(qb, catalog_entry, state, state_passed)
-            LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter_value)
-
-    state["current_stream"] = None
-    singer.write_state(state)
+            for catalog_entry in catalog_entries:
+                sync_catalog_entry(qb, catalog_entry, state, state_passed, writer)
+
+        state["current_stream"] = None
+        writer.write_state(state)
+    finally:
+        # Records buffered after the last STATE message still go out when a
+        # stream fails.
+        writer.flush()
     LOGGER.info("Finished sync")
 
 class QuickbooksTap(Tap):
@@ -278,6 +319,27 @@ class QuickbooksTap(Tap):
         th.Property("gl_basic_fields", th.BooleanType),
         th.Property("hg_sync_output", th.StringType),
         th.Property("report_periods", th.IntegerType),
+        th.Property("max_concurrent_streams", th.IntegerType),
+        th.Property("query_prefetch_pages", th.IntegerType),
+        th.Property("query_page_size", th.IntegerType),
+        th.Property("adaptive_page_size", th.BooleanType),
+        th.Property("request_timeout", th.NumberType),
+        th.Property("verify_pagination", th.BooleanType),
+        th.Property("backfill_windows", th.IntegerType),
+        th.Property("backfill_workers", th.IntegerType),
+        th.Property("output_buffer_size", th.IntegerType),
+        th.Property("report_concurrency", th.IntegerType),
+        th.Property("rate_limit_per_minute", th.IntegerType),
+        th.Property("max_concurrent_requests", th.IntegerType),
+        th.Property("max_concurrent_reports", th.IntegerType),
+        th.Property("report_density_dir", th.StringType),
+        th.Property("query_window_days", th.IntegerType),
+        th.Property("state_checkpoint_records", th.IntegerType),
+        th.Property("state_checkpoint_seconds", th.IntegerType),
+        th.Property("keyset_pagination", th.BooleanType),
+        th.Property("cdc_sync", th.BooleanType),
+        th.Property("batch_lookup_streams", th.BooleanType),
+        th.Property("single_pass_deleted", th.BooleanType),
     ).to_dict()
     
     @classmethod
@@ -309,6 +371,27 @@ class QuickbooksTap(Tap):
             gl_basic_fields=config.get('gl_basic_fields', False),
             hg_sync_output=config.get('hg_sync_output'),
             report_periods=config.get('report_periods'),
+            max_concurrent_streams=config.get('max_concurrent_streams'),
+            query_prefetch_pages=config.get('query_prefetch_pages'),
+            query_page_size=config.get('query_page_size'),
+            adaptive_page_size=config.get('adaptive_page_size', False),
+            request_timeout=config.get('request_timeout'),
+            verify_pagination=config.get('verify_pagination', False),
+            backfill_windows=config.get('backfill_windows'),
+            backfill_workers=config.get('backfill_workers'),
+            output_buffer_size=config.get('output_buffer_size'),
+            report_concurrency=config.get('report_concurrency'),
+            rate_limit_per_minute=config.get('rate_limit_per_minute'),
+            max_concurrent_requests=config.get('max_concurrent_requests'),
+            max_concurrent_reports=config.get('max_concurrent_reports'),
+            report_density_dir=config.get('report_density_dir'),
+            query_window_days=config.get('query_window_days'),
+            state_checkpoint_records=config.get('state_checkpoint_records'),
+            state_checkpoint_seconds=config.get('state_checkpoint_seconds'),
+            keyset_pagination=config.get('keyset_pagination', False),
+            cdc_sync=config.get('cdc_sync', False),
+            batch_lookup_streams=config.get('batch_lookup_streams', False),
+            single_pass_deleted=config.get('single_pass_deleted', False),
         )
         try:
             qb.login()
@@ -327,6 +410,14 @@ class QuickbooksTap(Tap):
                 qb.login_timer.cancel()
                 LOGGER.info("Main login timer canceled.")
             qb.sync_finished = True
+            reuse = qb.connection_reuse_stats()
+            if reuse["requests"]:
+                LOGGER.info(
+                    "Sent %s requests over %s pooled connections (%s reused).",
+                    reuse["requests"], reuse["connections"], reuse["reused"])
+            if qb.rate_limiter.waited_seconds:
+                LOGGER.info("Paced requests for %.1f seconds to stay within the rate limit.",
+                            qb.rate_limiter.waited_seconds)
 
             for thread in threading.enumerate():
                 if isinstance(thread, threading.Timer):
@@ -5,7 +5,8 @@ import threading
 import time
 import backoff
 import requests
-from requests.exceptions import RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError, RequestException
 from hotglue_etl_exceptions import InvalidCredentialsError
 import singer
 import singer.utils as singer_utils
@@ -23,12 +24,20 @@ from tap_quickbooks.quickbooks.reportstreams.DailyCashFlowReport import DailyCas
 from tap_quickbooks.quickbooks.reportstreams.MonthlyCashFlowReport import MonthlyCashFlowReport
 from tap_quickbooks.quickbooks.reportstreams.TransactionListReport import TransactionListReport
 from tap_quickbooks.quickbooks.reportstreams.ARAgingSummaryReport import ARAgingSummaryReport
+from tap_quickbooks.quickbooks.reportstreams.BaseReport import ReportRecords
 from tap_quickbooks.util import save_api_usage
 
-from tap_quickbooks.quickbooks.rest import Rest
+from tap_quickbooks.quickbooks.rest import Rest, is_query_timeout
+from tap_quickbooks.quickbooks.report_planner import DensityProfile
+from tap_quickbooks.quickbooks.rate_limit import (
+    RateLimiter,
+    retry_after,
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_MAX_CONCURRENT_REPORTS)
 from tap_quickbooks.quickbooks.exceptions import (
     TapQuickbooksException,
-    TapQuickbooksQuotaExceededException)
+    TapQuickbooksQuotaExceededException,
+    RetriableApiError)
 
 LOGGER = singer.get_logger()
 
@@ -37,6 +46,20 @@ REFRESH_TOKEN_EXPIRATION_PERIOD = 900
 
 REST_API_TYPE = "REST"
 
+# Report periods fetched in parallel by the GeneralLedger report streams.
+DEFAULT_REPORT_CONCURRENCY = 10
+
+# Incremental streams emit their safe bookmark as STATE at most this often
+# while syncing, counted in records or in seconds, whichever comes first.
+# Only windowed, keyset and sharded backfill queries have such a bookmark;
+# the default query is unsorted, so its bookmark is only written at the end.
+DEFAULT_STATE_CHECKPOINT_RECORDS = 10000
+DEFAULT_STATE_CHECKPOINT_SECONDS = 60
+
+# Seconds a request may wait to connect, or for each read of its response,
+# before it fails with a Timeout.
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 300
+
 
 def log_backoff_attempt(details):
     LOGGER.info("ConnectionError detected, triggering backoff: %d try", details.get("tries"))
@@ -289,9 +312,6 @@ def field_to_property_schema(field, mdata):  # pylint:disable=too-many-branches
 
     return property_schema, mdata
 
-class RetriableApiError(Exception):
-    pass
-
 class Quickbooks():
     # pylint: disable=too-many-instance-attributes,too-many-arguments
     def __init__(self,
@@ -314,7 +334,28 @@ class Quickbooks():
                  gl_basic_fields = None,
                  hg_sync_output = None,
                  realm_id = None,
-                 report_periods = None):
+                 report_periods = None,
+                 max_concurrent_streams = None,
+                 query_prefetch_pages = None,
+                 query_page_size = None,
+                 adaptive_page_size = None,
+                 request_timeout = None,
+                 verify_pagination = None,
+                 backfill_windows = None,
+                 backfill_workers = None,
+                 output_buffer_size = None,
+                 report_concurrency = None,
+                 rate_limit_per_minute = None,
+                 max_concurrent_requests = None,
+                 max_concurrent_reports = None,
+                 report_density_dir = None,
+                 query_window_days = None,
+                 state_checkpoint_records = None,
+                 state_checkpoint_seconds = None,
+                 keyset_pagination = None,
+                 cdc_sync = None,
+                 batch_lookup_streams = None,
+                 single_pass_deleted = None):
         
         if not realm_id:
             raise TapQuickbooksException("The 'realmId' is missing from the configuration file. It is a required field and cannot be empty.")
@@ -327,16 +368,62 @@ class Quickbooks():
         self.gl_daily = gl_daily
         self.gl_basic_fields = gl_basic_fields
         self.include_deleted = include_deleted
+        self.single_pass_deleted = single_pass_deleted is True
         self.realm_id = realm_id
         self.refresh_token = refresh_token
         self.token = token
         self.qb_client_id = qb_client_id
         self.qb_client_secret = qb_client_secret
-        self.session = requests.Session()
         self.access_token = None
         self.hg_sync_output = hg_sync_output
         self.sync_finished = False
         self.report_periods = report_periods
+        self.max_concurrent_streams = int(max_concurrent_streams or 1)
+        self.query_prefetch_pages = int(query_prefetch_pages or 0)
+        self.query_page_size = query_page_size
+        self.adaptive_page_size = adaptive_page_size is True
+        self.request_timeout = float(request_timeout or DEFAULT_REQUEST_TIMEOUT_SECONDS)
+        self.verify_pagination = verify_pagination is True
+        self.backfill_windows = int(backfill_windows or 1)
+        self.backfill_workers = int(backfill_workers or self.backfill_windows)
+        self.output_buffer_size = None if output_buffer_size is None else int(output_buffer_size)
+        self.report_concurrency = int(report_concurrency or DEFAULT_REPORT_CONCURRENCY)
+        self.query_window_days = int(query_window_days) if query_window_days else None
+        self.keyset_pagination = keyset_pagination is True
+        self.cdc_sync = cdc_sync is True
+        self.batch_lookup_streams = batch_lookup_streams is True
+        # Set by do_sync when cdc_sync or batch_lookup_streams is on; see
+        # ChangeFeed and QueryBatch.
+        self.change_feed = None
+        self.query_batch = None
+        self.state_checkpoint_records = int(state_checkpoint_records or DEFAULT_STATE_CHECKPOINT_RECORDS)
+        self.state_checkpoint_seconds = float(state_checkpoint_seconds or DEFAULT_STATE_CHECKPOINT_SECONDS)
+        if (state_checkpoint_records or state_checkpoint_seconds) and not (
+                self.query_window_days or self.keyset_pagination or self.backfill_windows > 1):
+            raise TapQuickbooksException(
+                "'state_checkpoint_records' and 'state_checkpoint_seconds' only apply with "
+                "'query_window_days', 'keyset_pagination' or 'backfill_windows'.")
+        # Row counts of GL and P&L detail periods from earlier runs, used to
+        # pre-size report date ranges. Only kept in memory without a directory.
+        self.density_profile = DensityProfile.for_realm(report_density_dir, realm_id) \
+            if report_density_dir else DensityProfile()
+
+        # One pooled session carries both entity queries and report requests.
+        # The pool must hold a connection for every request that can be in
+        # flight at once, otherwise the extras are closed after each use.
+        pool_size = max(self.report_concurrency, self.query_prefetch_pages, self.backfill_workers) \
+            * self.max_concurrent_streams
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Shared by entity queries and report requests, which all count
+        # towards the same per-realm limits.
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=int(rate_limit_per_minute or DEFAULT_REQUESTS_PER_MINUTE),
+            max_concurrent_requests=int(max_concurrent_requests) if max_concurrent_requests else None,
+            max_concurrent_reports=int(max_concurrent_reports or DEFAULT_MAX_CONCURRENT_REPORTS))
 
         self.base_url = "https://sandbox-quickbooks.api.intuit.com/v3/company/" if is_sandbox is True else 'https://quickbooks.api.intuit.com/v3/company/'
 
@@ -357,6 +444,8 @@ class Quickbooks():
                 isinstance(select_fields_by_default, str) and select_fields_by_default.lower() == 'true')
         self.default_start_date = default_start_date
         self.rest_requests_attempted = 0
+        # Requests are counted from every thread that sends them.
+        self._quota_lock = threading.Lock()
         self.jobs_completed = 0
         self.login_timer = None
         self.data_url = "{}/services/data/v41.0/{}"
@@ -401,20 +490,31 @@ class Quickbooks():
 
     # pylint: disable=too-many-arguments
     @backoff.on_exception(backoff.expo,
-                          (requests.exceptions.ConnectionError,RetriableApiError),
+                          (requests.exceptions.ConnectionError,requests.exceptions.Timeout,RetriableApiError),
                           max_tries=10,
                           factor=2,
                           on_backoff=log_backoff_attempt)
     def _make_request(self, http_method, url, headers=None, body=None, stream=False, params=None, sink_name=None):
-        if http_method == "GET":
-            LOGGER.info("Making %s request to %s with params: %s", http_method, url, params)
-            resp = self.session.get(url, headers=headers, stream=stream, params=params)
-        elif http_method == "POST":
-            LOGGER.info("Making %s request to %s with body %s", http_method, url, body)
-            resp = self.session.post(url, headers=headers, data=body)
-        else:
+        return self._request_once(http_method, url, headers=headers, body=body, stream=stream,
+                                  params=params, sink_name=sink_name)
+
+    # pylint: disable=too-many-arguments
+    def _request_once(self, http_method, url, headers=None, body=None, stream=False, params=None, sink_name=None):
+        '''Sends the request without retrying it, for callers that react to
+        the first failure themselves.'''
+        if http_method not in ("GET", "POST"):
             raise TapQuickbooksException("Unsupported HTTP method")
 
+        # Only calls to the company API count towards the realm's limits;
+        # token refreshes go to the OAuth host.
+        if url.startswith(self.instance_url):
+            with self.rate_limiter.request():
+                resp = self._send_request(http_method, url, headers, body, stream, params)
+            if resp.status_code == 429:
+                self.rate_limiter.throttle(retry_after(resp))
+        else:
+            resp = self._send_request(http_method, url, headers, body, stream, params)
+
         try:
             save_api_usage(
                 http_method,
@@ -427,12 +527,19 @@ class Quickbooks():
         except Exception as e:
             LOGGER.error("Error saving API usage: %s", str(e))
 
+        if resp.status_code == 429:
+            # The rate limiter holds the retry back until the pause is over.
+            raise RetriableApiError(resp.text, response=resp)
         if resp.status_code in [400, 500]:
             intuit_tid = resp.headers.get('intuit_tid', 'N/A')
             LOGGER.error("Request failed with status %s, intuit_tid: %s, response: %s", resp.status_code, intuit_tid, resp.text)
             if "Authorization Failure" in resp.text:
                 self.login()
-            raise RetriableApiError(resp.text)
+            if is_query_timeout(resp):
+                # The same query would only time out again, so it is not
+                # retried here; Rest narrows its date range instead.
+                raise HTTPError(resp.text, response=resp)
+            raise RetriableApiError(resp.text, response=resp)
         try:
             resp.raise_for_status()
         except RequestException as ex:
@@ -441,11 +548,39 @@ class Quickbooks():
             raise ex
 
         if resp.headers.get('Sforce-Limit-Info') is not None:
-            self.rest_requests_attempted += 1
-            self.check_rest_quota_usage(resp.headers)
+            with self._quota_lock:
+                self.rest_requests_attempted += 1
+                self.check_rest_quota_usage(resp.headers)
 
         return resp
 
+    def _send_request(self, http_method, url, headers, body, stream, params):
+        if http_method == "GET":
+            LOGGER.info("Making %s request to %s with params: %s", http_method, url, params)
+            return self.session.get(url, headers=headers, stream=stream, params=params,
+                                    timeout=self.request_timeout)
+
+        LOGGER.info("Making %s request to %s with body %s", http_method, url, body)
+        return self.session.post(url, headers=headers, data=body, timeout=self.request_timeout)
+
+    def connection_reuse_stats(self):
+        """Returns how many requests the pooled session has sent and how many
+        connections it had to open for them."""
+        requests_sent = 0
+        connections_opened = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    connections_opened += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "connections": connections_opened,
+            "reused": max(requests_sent - connections_opened, 0),
+        }
+
     def login(self):
         if self.is_sandbox:
             login_url = 'https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer'
@@ -536,7 +671,8 @@ class Quickbooks():
                                     catalog_entry['tap_stream_id'],
                                     replication_key) or self.default_start_date)
 
-    def _build_query_string(self, catalog_entry, start_date, end_date=None, order_by_clause=True):
+    def _build_query_string(self, catalog_entry, start_date, end_date=None, order_by_clause=False,
+                            inclusive_start=False):
         selected_properties = self._get_selected_properties(catalog_entry)
 
         query = "SELECT {} FROM {}".format("*", catalog_entry['stream'])
@@ -545,17 +681,18 @@ class Quickbooks():
         replication_key = catalog_metadata.get((), {}).get('replication-key')
 
         if replication_key:
-            where_clause = " WHERE {} >  '{}' ".format(
+            where_clause = " WHERE {} {}  '{}' ".format(
                 replication_key,
+                ">=" if inclusive_start else ">",
                 start_date)
             if end_date:
-                end_date_clause = " AND {} <= {}".format(replication_key, end_date)
+                end_date_clause = " AND {} <= '{}'".format(replication_key, end_date)
             else:
                 end_date_clause = ""
 
-            # order_by = " ORDERBY {} ASC".format(replication_key)
-            # if order_by_clause:
-            #   return query + where_clause + end_date_clause + order_by
+            if order_by_clause:
+                order_by = " ORDERBY {} ASC".format(replication_key)
+                return query + where_clause + end_date_clause + order_by
 
             return query + where_clause + end_date_clause
         else:
@@ -575,15 +712,16 @@ class Quickbooks():
 
         if self.reports_full_sync:
             state_passed = None
+        checkpoint = singer.get_bookmark(state, catalog_entry["tap_stream_id"], "checkpoint")
 
         if catalog_entry["stream"] == "BalanceSheetReport":
             reader = BalanceSheetReport(self, start_date, None)
         elif catalog_entry["stream"] == "MonthlyBalanceSheetReport":
             reader = MonthlyBalanceSheetReport(self, start_date, None)
         elif catalog_entry["stream"] == "GeneralLedgerAccrualReport":
-            reader = GeneralLedgerAccrualReport(self, start_date, self.report_periods, state_passed)
+            reader = GeneralLedgerAccrualReport(self, start_date, self.report_periods, state_passed, checkpoint)
         elif catalog_entry["stream"] == "GeneralLedgerCashReport":
-            reader = GeneralLedgerCashReport(self, start_date, self.report_periods, state_passed)
+            reader = GeneralLedgerCashReport(self, start_date, self.report_periods, state_passed, checkpoint)
         elif catalog_entry["stream"] == "CashFlowReport":
             reader = CashFlowReport(self, start_date, None)
         elif catalog_entry["stream"] == "DailyCashFlowReport":
@@ -595,7 +733,7 @@ class Quickbooks():
         elif catalog_entry["stream"] == "TransactionListReport":
             reader = TransactionListReport(self, start_date, None)
         elif catalog_entry["stream"] == "ProfitAndLossReport":
-            reader = ProfitAndLossReport(self, start_date, self.report_periods, state_passed)
+            reader = ProfitAndLossReport(self, start_date, self.report_periods, state_passed, checkpoint)
         else:
-            reader = ProfitAndLossDetailReport(self, start_date, self.report_periods, state_passed)
-        return reader.sync(catalog_entry)
+            reader = ProfitAndLossDetailReport(self, start_date, self.report_periods, state_passed, checkpoint)
+        return ReportRecords(reader, catalog_entry)
@@ -0,0 +1,113 @@
+import json
+import threading
+
+import singer
+from requests.exceptions import RequestException
+
+from tap_quickbooks.quickbooks.exceptions import RetriableApiError
+from tap_quickbooks.quickbooks.rest import Rest
+
+LOGGER = singer.get_logger()
+
+# Lookup entities small enough to be read with one query each.
+BATCH_STREAMS = {
+    "Term", "Class", "PaymentMethod", "CustomerType", "Department", "TaxRate", "TaxCode", "CompanyCurrency",
+}
+# The batch endpoint takes at most this many operations per request.
+MAX_BATCH_ITEMS = 30
+# Rows a single batched query asks for; a stream that fills it is paged
+# through the regular query instead.
+BATCH_QUERY_MAX_RESULTS = 1000
+
+
+class QueryBatch():
+    '''Reads small lookup streams through the batch endpoint, packing the
+    query of up to MAX_BATCH_ITEMS of them into each request.
+
+    The first stream to ask triggers the requests for all of them, with the
+    same queries Rest would page through (including the inactive records
+    query when deleted records are synced). Each stream then gets its own
+    results. A stream whose query filled a whole page, or failed, is left to
+    the regular query, as are all the streams of a batch request that failed
+    as a whole.
+    '''
+
+    def __init__(self, qb, catalog_entries, state):
+        self.qb = qb
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._results = None
+        self._queries = {}
+
+        rest = Rest(qb)
+        for catalog_entry in catalog_entries:
+            stream = catalog_entry['stream']
+            if stream not in BATCH_STREAMS:
+                continue
+            query = qb._build_query_string(catalog_entry, qb.get_start_date(state, catalog_entry))
+            self._queries[stream] = [rest._with_active_filter(query, active_filter)
+                                     for active_filter in rest._active_filters(stream)]
+
+    def covers(self, stream):
+        return stream in self._queries
+
+    def records(self, catalog_entry):
+        '''Returns the stream's records, or None when it has to be queried
+        instead.'''
+        stream = catalog_entry['stream']
+        if not self.covers(stream):
+            return None
+        with self._lock:
+            if self._results is None:
+                self._results = self._fetch()
+        return self._results.get(stream)
+
+    def _fetch(self):
+        items = []
+        for stream, queries in self._queries.items():
+            for query in queries:
+                items.append((stream, query))
+
+        pages = {}
+        for offset in range(0, len(items), MAX_BATCH_ITEMS):
+            chunk = items[offset:offset + MAX_BATCH_ITEMS]
+            try:
+                responses = self._request([query for _, query in chunk])
+            except (RequestException, RetriableApiError) as ex:
+                LOGGER.warning("Batch request failed, using queries instead: %s", ex)
+                responses = {}
+            for index, (stream, _) in enumerate(chunk):
+                pages.setdefault(stream, []).append(responses.get(str(index)))
+
+        results = {}
+        for stream, stream_pages in pages.items():
+            if any(page is None or len(page) >= BATCH_QUERY_MAX_RESULTS for page in stream_pages):
+                LOGGER.info("%s did not fit in a batched query, using queries", stream)
+                continue
+            results[stream] = [rec for page in stream_pages for rec in page]
+
+        LOGGER.info("Fetched %s streams in %s batch requests", len(results), self.requests)
+        return results
+
+    def _request(self, queries):
+        '''Runs queries in one batch request and returns the records of each
+        successful one by its index, as a string.'''
+        self.requests += 1
+        url = f"{self.qb.instance_url}/batch?minorversion=75"
+        headers = {**self.qb._get_standard_headers(),
+                   "Accept": "application/json",
+                   "Content-Type": "application/json"}
+        body = {"BatchItemRequest": [
+            {"bId": str(index), "Query": f"{query} STARTPOSITION 1 MAXRESULTS {BATCH_QUERY_MAX_RESULTS}"}
+            for index, query in enumerate(queries)]}
+        resp = self.qb._make_request('POST', url, headers=headers, body=json.dumps(body))
+
+        records = {}
+        for item in resp.json().get("BatchItemResponse", []):
+            if "Fault" in item:
+                LOGGER.warning("Batched query %s failed: %s", item.get("bId"), item["Fault"])
+                continue
+            query_response = item.get("QueryResponse", {})
+            records[item.get("bId")] = [
+                rec for value in query_response.values() if isinstance(value, list) for rec in value]
+        return records
@@ -0,0 +1,128 @@
+import datetime
+import threading
+
+import singer
+import singer.utils as singer_utils
+from singer import metadata
+
+from tap_quickbooks.quickbooks.rest import DELETED_EXCLUDED_ENTITIES
+
+LOGGER = singer.get_logger()
+
+# Entities the ChangeDataCapture endpoint reports changes for.
+CDC_ENTITIES = {
+    "Account", "Bill", "BillPayment", "Budget", "Class", "CreditMemo", "Customer", "Department",
+    "Deposit", "Employee", "Estimate", "Invoice", "Item", "JournalCode", "JournalEntry", "Payment",
+    "PaymentMethod", "Purchase", "PurchaseOrder", "RefundReceipt", "SalesReceipt", "TaxAgency", "Term",
+    "TimeActivity", "Transfer", "Vendor", "VendorCredit",
+}
+# changedSince may not be further back than this.
+CDC_MAX_LOOKBACK = datetime.timedelta(days=30)
+# A response holding this many objects may have been cut short.
+CDC_MAX_RESULTS = 1000
+
+
+class ChangeFeed():
+    '''Serves the changes of many incremental entity streams from shared
+    ChangeDataCapture requests instead of one query per stream.
+
+    The first stream to ask triggers a single CDC call for every covered
+    entity, changed since the earliest of their start dates; each stream then
+    gets its own entity's records changed after its own start date. When a
+    response may have been truncated the entities are split in two and asked
+    for again, and an entity that is too large on its own is left to the
+    regular query, as are streams starting further back than CDC allows.
+
+    Deleted and inactive entities are only kept with include_deleted, like
+    the regular query; deleted ones carry only their Id and MetaData, so they
+    are marked Active = false. Entities without an Active field, those in
+    DELETED_EXCLUDED_ENTITIES, have no way to mark a deletion, so their
+    deleted records are dropped just as the regular query never returns them.
+    '''
+
+    def __init__(self, qb, catalog_entries, state):
+        self.qb = qb
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._changes = None
+        self._starts = {}
+
+        oldest = singer_utils.now() - CDC_MAX_LOOKBACK
+        for catalog_entry in catalog_entries:
+            catalog_metadata = metadata.to_map(catalog_entry['metadata'])
+            if not catalog_metadata.get((), {}).get('replication-key'):
+                continue
+            if catalog_entry['stream'] not in CDC_ENTITIES:
+                continue
+            start_date = singer_utils.strptime_with_tz(qb.get_start_date(state, catalog_entry))
+            if start_date < oldest:
+                LOGGER.info("%s starts before the change data capture window, using queries",
+                            catalog_entry['stream'])
+                continue
+            self._starts[catalog_entry['stream']] = start_date
+
+    def covers(self, stream):
+        return stream in self._starts
+
+    def records(self, catalog_entry):
+        '''Returns the records changed since the stream's start date, or None
+        when the stream has to be queried instead.'''
+        stream = catalog_entry['stream']
+        if not self.covers(stream):
+            return None
+        with self._lock:
+            if self._changes is None:
+                self._changes = self._fetch()
+        changes = self._changes.get(stream)
+        if changes is None:
+            return None
+
+        start_date = self._starts[stream]
+        return [rec for rec in (self._prepare(stream, rec) for rec in changes)
+                if rec is not None
+                and singer_utils.strptime_with_tz(rec["MetaData"]["LastUpdatedTime"]) > start_date]
+
+    def _prepare(self, stream, rec):
+        deleted = rec.get("status") == "Deleted"
+        if deleted and stream in DELETED_EXCLUDED_ENTITIES:
+            return None
+        if not self.qb.include_deleted and (deleted or rec.get("Active") is False):
+            return None
+        if deleted:
+            rec = {**rec, "Active": False}
+        return rec
+
+    def _fetch(self):
+        since = singer_utils.strftime(min(self._starts.values()))
+        changes = {}
+        pending = [sorted(self._starts)]
+        while pending:
+            entities = pending.pop()
+            response = self._request(entities, since)
+            if sum(len(records) for records in response.values()) >= CDC_MAX_RESULTS:
+                if len(entities) == 1:
+                    LOGGER.info("Too many %s changes for change data capture, using queries", entities[0])
+                    continue
+                middle = len(entities) // 2
+                pending += [entities[middle:], entities[:middle]]
+                continue
+            for entity in entities:
+                changes[entity] = response.get(entity, [])
+
+        LOGGER.info("Fetched changes of %s streams in %s change data capture requests",
+                    len(changes), self.requests)
+        return changes
+
+    def _request(self, entities, since):
+        self.requests += 1
+        url = f"{self.qb.instance_url}/cdc"
+        headers = {**self.qb._get_standard_headers(), "Accept": "application/json"}
+        params = {"entities": ",".join(entities), "changedSince": since, "minorversion": "75"}
+        resp = self.qb._make_request('GET', url, headers=headers, params=params)
+
+        records = {}
+        for cdc_response in resp.json().get("CDCResponse", []):
+            for query_response in cdc_response.get("QueryResponse", []):
+                for entity in entities:
+                    records.setdefault(entity, []).extend(query_response.get(entity, []))
+        return records
@@ -0,0 +1,85 @@
+class _StitchedRow():
+    __slots__ = ("cells", "categories")
+
+    def __init__(self, cells, categories):
+        self.cells = cells
+        self.categories = categories
+
+
+class ColumnStitcher():
+    '''Joins report rows that were fetched in several requests, each for a
+    slice of the columns, back into whole rows.
+
+    Every batch repeats the identity columns, whose values key a row. The
+    primary batch defines which rows exist and their order; rows of the
+    other batches fill in their columns on the first row with the same key
+    that the batch has not filled yet, so duplicate keys pair up in order.
+    Rows of other batches without a match are dropped.
+
+    Rows hold their cells in a list indexed by column position and each key
+    keeps a list of its rows plus, per batch, a cursor to the next unfilled
+    one, so stitching is linear in the number of rows.
+    '''
+
+    def __init__(self, identity_columns):
+        self.identity_columns = list(identity_columns)
+        self.columns = []
+        self._column_index = {}
+        self._rows_by_key = {}
+
+    @staticmethod
+    def _identity_value(cell):
+        if isinstance(cell, dict):
+            return cell.get("value", "")
+        return cell if cell is not None else ""
+
+    def add_batch(self, columns, rows, primary=False):
+        '''Adds one batch. columns names the cells of each row, and each row
+        is a list of those cells followed by its category path.'''
+        positions = []
+        for column in columns:
+            if column not in self._column_index:
+                self._column_index[column] = len(self.columns)
+                self.columns.append(column)
+            positions.append(self._column_index[column])
+
+        batch_index = {column: index for index, column in enumerate(columns)}
+        identity_indices = [batch_index.get(column) for column in self.identity_columns]
+        cursors = {}
+
+        for raw_row in rows:
+            width = min(len(raw_row) - 1, len(positions))
+            key = tuple(
+                self._identity_value(raw_row[index]) if index is not None and index < width else ""
+                for index in identity_indices)
+            categories = raw_row[-1] or []
+
+            if primary:
+                cells = [None] * len(self.columns)
+                row = _StitchedRow(cells, list(dict.fromkeys(categories)))
+                self._rows_by_key.setdefault(key, []).append(row)
+            else:
+                matches = self._rows_by_key.get(key)
+                cursor = cursors.get(key, 0)
+                if matches is None or cursor >= len(matches):
+                    continue
+                cursors[key] = cursor + 1
+                row = matches[cursor]
+                for category in categories:
+                    if category not in row.categories:
+                        row.categories.append(category)
+                cells = row.cells
+                if len(cells) < len(self.columns):
+                    cells.extend([None] * (len(self.columns) - len(cells)))
+
+            for index in range(width):
+                cells[positions[index]] = raw_row[index]
+
+    def rows(self):
+        '''Yields the stitched rows grouped by key, in the order keys first
+        appeared in the primary batch. Each row holds a cell per column
+        (None where no batch had it) followed by its category path.'''
+        width = len(self.columns)
+        for matches in self._rows_by_key.values():
+            for row in matches:
+                yield row.cells + [None] * (width - len(row.cells)) + [row.categories]
@@ -0,0 +1,124 @@
+import collections
+import concurrent.futures
+import threading
+
+import singer
+
+LOGGER = singer.get_logger()
+
+_EXHAUSTED = object()
+
+
+def ordered_map(func, items, max_workers):
+    '''Calls func on every item using a pool of worker threads and yields the
+    results in the order of items.
+
+    Unlike ThreadPoolExecutor.map, items are consumed lazily and at most
+    max_workers calls are in flight at any time, so the next calls are only
+    submitted as the oldest result is handed to the consumer. If the consumer
+    stops early, calls that have not started yet are cancelled.
+    '''
+    items = iter(items)
+    in_flight = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for item in items:
+            in_flight.append(executor.submit(func, item))
+            if len(in_flight) >= max_workers:
+                break
+
+        while in_flight:
+            result = in_flight.popleft().result()
+            for item in items:
+                in_flight.append(executor.submit(func, item))
+                break
+            yield result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class AIMDController():
+    '''Additive-increase/multiplicative-decrease limit on the number of
+    requests in flight.
+
+    Every request that comes back in time grows the limit by 1 / limit, so
+    a full window of good responses adds one slot. Overload signals (429s,
+    504s, oversized answers or responses slower than latency_target) halve
+    it. Requests started before the last decrease carry an older epoch and
+    cannot halve the limit again, so one burst of failures from the same
+    window only counts once. begin() stamps the calling thread with the
+    current epoch, which record_* calls on that thread then default to.
+    '''
+
+    def __init__(self, limit, minimum=1, maximum=None, latency_target=None):
+        self.minimum = minimum
+        self.maximum = maximum or limit
+        self.latency_target = latency_target
+        self._limit = float(min(max(limit, minimum), self.maximum))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.epoch = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def begin(self):
+        self._local.epoch = self.epoch
+        return self._local.epoch
+
+    def record_success(self, latency=None, epoch=None):
+        if self.latency_target is not None and latency is not None and latency > self.latency_target:
+            self.record_overload(epoch)
+            return
+        with self._lock:
+            self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+
+    def record_overload(self, epoch=None):
+        if epoch is None:
+            epoch = getattr(self._local, "epoch", None)
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._limit = max(self.minimum, self._limit / 2)
+            self.epoch += 1
+            LOGGER.info("Reducing concurrent requests to %s", self.limit)
+
+
+def adaptive_ordered_map(func, items, controller):
+    '''Like ordered_map, but the number of calls running at once follows
+    controller.limit and is re-read every time a call finishes.
+
+    Calls are dispatched as a sliding window: a new call starts as soon as
+    any running call finishes, even if an older one is still running, so one
+    slow call does not idle the other workers. Finished results wait for
+    their turn in a buffer of at most four times controller.maximum.
+    '''
+    items = iter(items)
+    pending = collections.deque()
+    exhausted = False
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=controller.maximum)
+    try:
+        while True:
+            # Calls that finish after this snapshot stay in it, so the wait
+            # below returns at once instead of missing them.
+            running = [future for future in pending if not future.done()]
+            while (not exhausted and len(running) < controller.limit
+                   and len(pending) < 4 * controller.maximum):
+                item = next(items, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    exhausted = True
+                    break
+                future = executor.submit(func, item)
+                pending.append(future)
+                running.append(future)
+
+            if not pending:
+                return
+            if pending[0].done():
+                yield pending.popleft().result()
+                continue
+            concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
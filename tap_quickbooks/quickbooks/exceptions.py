@@ -5,6 +5,11 @@ class TapQuickbooksException(Exception):
 class TapQuickbooksQuotaExceededException(TapQuickbooksException):
     pass
 
+class RetriableApiError(Exception):
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
 def raise_for_invalid_credentials(resp):
     def message_to_dict(input_string):
         # Split the string by commas to separate each key-value pair
@@ -0,0 +1,104 @@
+import contextlib
+import threading
+import time
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# Quickbooks allows about 500 requests per minute per realm; stay under it.
+DEFAULT_REQUESTS_PER_MINUTE = 450
+# Quickbooks allows 10 concurrent report requests per realm.
+DEFAULT_MAX_CONCURRENT_REPORTS = 10
+# Requests that may be sent back to back before pacing kicks in.
+DEFAULT_BURST = 10
+# How long requests are held back after a 429 without a usable Retry-After.
+DEFAULT_THROTTLE_SECONDS = 10
+
+
+def retry_after(response):
+    '''Returns the seconds a 429 response asks to wait in its Retry-After
+    header, or None when it gives none in seconds.'''
+    try:
+        return max(float(response.headers.get("Retry-After")), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter():
+    '''Paces requests to a Quickbooks realm from every thread of the tap.
+
+    Requests per minute are budgeted with a token bucket holding up to burst
+    tokens that refills at requests_per_minute / 60 tokens per second. Each
+    request takes a token, waiting for the bucket to refill when it is
+    empty; waiters are served in arrival order because each one reserves its
+    token (driving the bucket negative) before sleeping.
+
+    When Quickbooks throttles a request anyway, throttle() drains the bucket
+    so that no thread sends another request until the wait is over.
+
+    Concurrency is budgeted separately with semaphores: one for all requests
+    (unbounded unless max_concurrent_requests is set) and one that report
+    requests additionally hold.
+    '''
+
+    def __init__(self,
+                 requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 max_concurrent_requests=None,
+                 max_concurrent_reports=DEFAULT_MAX_CONCURRENT_REPORTS,
+                 burst=DEFAULT_BURST,
+                 clock=time.monotonic,
+                 sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self._rate = requests_per_minute / 60.0
+        self._tokens = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+        self._requests = threading.BoundedSemaphore(max_concurrent_requests) if max_concurrent_requests else None
+        self._reports = threading.BoundedSemaphore(max_concurrent_reports) if max_concurrent_reports else None
+        self.waited_seconds = 0.0
+        self.throttled = 0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def _take_token(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+            self.waited_seconds += wait
+        if wait:
+            self._sleep(wait)
+
+    def throttle(self, seconds=None):
+        '''Holds back the requests of every thread for seconds (by default
+        DEFAULT_THROTTLE_SECONDS) after Quickbooks answered with a 429.
+        Requests that take a token from now on wait out the pause; threads
+        already sleeping for a token keep their wake time.'''
+        if seconds is None:
+            seconds = DEFAULT_THROTTLE_SECONDS
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self._rate)
+            self.throttled += 1
+        LOGGER.info("Quickbooks throttled a request, pausing requests for %s seconds", seconds)
+
+    @contextlib.contextmanager
+    def request(self, report=False):
+        '''Holds a concurrency slot for the duration of the block, after
+        waiting for both a slot and a token to be available.'''
+        semaphores = [s for s in (self._requests, self._reports if report else None) if s is not None]
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            self._take_token()
+            yield
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
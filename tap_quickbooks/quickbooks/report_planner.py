@@ -0,0 +1,199 @@
+import collections
+import datetime
+import json
+import os
+import threading
+
+import singer
+
+from tap_quickbooks.quickbooks.concurrency import adaptive_ordered_map
+
+LOGGER = singer.get_logger()
+
+# Marker returned by the Reports API helpers when a period holds more rows
+# than Quickbooks will return in one response.
+TOO_MUCH_DATA = "Too much data for current period"
+
+
+def is_too_much_data(response):
+    return isinstance(response, dict) and response.get("error") == TOO_MUCH_DATA
+
+
+class DateRange(collections.namedtuple("DateRange", ["start", "end"])):
+    """An inclusive range of dates."""
+    __slots__ = ()
+
+    @property
+    def days(self):
+        return (self.end - self.start).days + 1
+
+    def halves(self):
+        """Splits the range into two adjacent halves, or returns None for a
+        single day."""
+        if self.days < 2:
+            return None
+        mid = self.start + datetime.timedelta(days=self.days // 2)
+        return DateRange(self.start, mid - datetime.timedelta(days=1)), DateRange(mid, self.end)
+
+    def params(self):
+        return {"start_date": self.start.strftime("%Y-%m-%d"), "end_date": self.end.strftime("%Y-%m-%d")}
+
+
+class RangePlanner():
+    '''Fetches report date ranges concurrently and yields (date_range,
+    response) pairs in date order.
+
+    Each range is handled on its own: when Quickbooks answers that a range
+    holds too much data, only that range is split in half and its halves
+    fetched in its place, while the responses of its neighbours are kept.
+    A single day that is still too large is yielded with its error response
+    for the caller to handle.
+
+    Ranges are fetched through adaptive_ordered_map, so the number of
+    requests in flight follows controller.limit (see AIMDController). The
+    halves of a split range are fetched by the worker that fetched the range.
+    '''
+
+    def __init__(self, fetch, controller, too_large=is_too_much_data, on_split=None):
+        self.fetch = fetch
+        self.controller = controller
+        self.too_large = too_large
+        self.on_split = on_split
+        self.splits = 0
+        self._lock = threading.Lock()
+
+    def run(self, ranges):
+        for pieces in adaptive_ordered_map(self._fetch_fitting, ranges, self.controller):
+            yield from pieces
+
+    def _fetch_fitting(self, date_range):
+        '''Fetches date_range, halving it until every piece fits. Returns the
+        (date_range, response) pairs of the pieces in date order.'''
+        response = self.fetch(date_range)
+        if not self.too_large(response) or date_range.days < 2:
+            return [(date_range, response)]
+
+        first, second = date_range.halves()
+        LOGGER.info("Too much data for %s to %s, splitting into %s to %s and %s to %s",
+                    date_range.start, date_range.end, first.start, first.end, second.start, second.end)
+        with self._lock:
+            self.splits += 1
+        if self.on_split:
+            self.on_split(date_range)
+        return self._fetch_fitting(first) + self._fetch_fitting(second)
+
+
+class DensityProfile():
+    '''Rows per day of report data learned from previous runs for one realm.
+
+    Every successful range adds its row count, spread evenly over its days,
+    and every range Quickbooks rejected as too large is remembered. The
+    smallest rejected row count is taken as the realm's row cap, and plan()
+    pre-splits ranges expected to exceed 90% of it so that they fit on the
+    first request instead of failing and being halved.
+
+    The profile is kept per report (key) in a JSON sidecar file.
+    '''
+
+    # Fraction of the learned row cap planned ranges aim for.
+    TARGET_FRACTION = 0.9
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reports = {}
+        self._too_large = collections.defaultdict(list)
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._reports = json.load(f).get("reports", {})
+            except (OSError, ValueError) as ex:
+                LOGGER.warning("Ignoring unreadable report density profile %s: %s", path, ex)
+
+    @classmethod
+    def for_realm(cls, directory, realm_id):
+        return cls(os.path.join(directory, "quickbooks_density_{}.json".format(realm_id)))
+
+    def _report(self, key):
+        return self._reports.setdefault(key, {"days": {}, "months": [], "row_cap": None})
+
+    def record(self, key, date_range, rows):
+        with self._lock:
+            report = self._report(key)
+            per_day = rows / date_range.days
+            day = date_range.start
+            months = set(report["months"])
+            while day <= date_range.end:
+                if per_day:
+                    report["days"][day.isoformat()] = per_day
+                else:
+                    report["days"].pop(day.isoformat(), None)
+                months.add(day.strftime("%Y-%m"))
+                day += datetime.timedelta(days=1)
+            report["months"] = sorted(months)
+
+    def record_too_large(self, key, date_range):
+        with self._lock:
+            self._too_large[key].append(date_range)
+
+    def estimate(self, key, date_range):
+        """Returns the expected row count of date_range, or None when part
+        of it has never been fetched."""
+        report = self._reports.get(key)
+        if report is None:
+            return None
+        months = set(report["months"])
+        days = report["days"]
+        rows = 0.0
+        day = date_range.start
+        while day <= date_range.end:
+            if day.strftime("%Y-%m") not in months:
+                return None
+            rows += days.get(day.isoformat(), 0.0)
+            day += datetime.timedelta(days=1)
+        return rows
+
+    def _update_row_cap(self, key):
+        report = self._report(key)
+        for date_range in self._too_large.pop(key, []):
+            rows = self.estimate(key, date_range)
+            if rows and (report["row_cap"] is None or rows < report["row_cap"]):
+                report["row_cap"] = rows
+
+    def plan(self, key, ranges):
+        """Yields ranges, pre-splitting those expected to hold more rows than
+        the learned row cap allows. Unknown ranges are passed through."""
+        report = self._reports.get(key)
+        row_cap = report and report.get("row_cap")
+        for date_range in ranges:
+            rows = self.estimate(key, date_range) if row_cap else None
+            target = row_cap * self.TARGET_FRACTION if row_cap else None
+            if rows is None or rows <= target:
+                yield date_range
+                continue
+
+            # Cut the range where the running row estimate would pass the
+            # target; a single day above it stays on its own.
+            piece_start = date_range.start
+            piece_rows = 0.0
+            day = date_range.start
+            while day <= date_range.end:
+                day_rows = report["days"].get(day.isoformat(), 0.0)
+                if day > piece_start and piece_rows + day_rows > target:
+                    yield DateRange(piece_start, day - datetime.timedelta(days=1))
+                    piece_start = day
+                    piece_rows = 0.0
+                piece_rows += day_rows
+                day += datetime.timedelta(days=1)
+            yield DateRange(piece_start, date_range.end)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            for key in list(self._too_large):
+                self._update_row_cap(key)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"reports": self._reports}, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,128 @@
+import tempfile
+
+import singer
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+LOGGER = singer.get_logger()
+
+# Report bodies up to this size stay in memory; larger ones spill to disk.
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+CHUNK_BYTES = 64 * 1024
+
+
+class StreamedReport():
+    '''A Reports API response parsed incrementally from a spooled copy of
+    its body.
+
+    Everything but Rows (Header, Columns) is parsed up front, in one pass
+    that also validates the whole document. Rows.Row is read lazily: each
+    iteration over get("Rows")["Row"] parses the body again and yields the
+    top level row groups one at a time, so only one group is held in memory
+    instead of the whole report.
+
+    get() answers like the dict response.json() would have returned, so
+    report streams can use either.
+    '''
+
+    def __init__(self, body):
+        self._body = body
+        self._outline, self._rows = self._read_outline()
+
+    @classmethod
+    def from_response(cls, response):
+        '''Copies the response body into a spooled temporary file and parses
+        its outline.'''
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            for chunk in response.iter_content(CHUNK_BYTES):
+                body.write(chunk)
+            body.seek(0)
+            return cls(body)
+        except Exception:
+            body.close()
+            raise
+
+    def _read_outline(self):
+        try:
+            return self._parse_outline()
+        except ijson.JSONError as ex:
+            raise ValueError("Invalid report response: {}".format(ex)) from ex
+
+    def _parse_outline(self):
+        outline = {}
+        rows = None
+        key = None
+        builder = None
+        depth = 0
+        self._body.seek(0)
+        events = ijson.parse(self._body, use_float=True)
+        for prefix, event, value in events:
+            if prefix == "" and event != "map_key":
+                if event not in ("start_map", "end_map"):
+                    raise ValueError("Report response is not a JSON object")
+                continue
+            if prefix == "" and event == "map_key":
+                key = value
+                if key == "Rows":
+                    rows = {}
+                continue
+            if key == "Rows":
+                if prefix == "Rows.Row" and event in ("null", "start_array"):
+                    rows["Row"] = _Rows(self) if event == "start_array" else None
+                continue
+
+            if builder is None:
+                builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+            if depth == 0:
+                outline[key] = builder.value
+                builder = None
+        return outline, rows
+
+    def iter_row_groups(self):
+        self._body.seek(0)
+        yield from ijson.items(self._body, "Rows.Row.item", use_float=True)
+
+    def get(self, key, default=None):
+        if key == "Rows":
+            return self._rows if self._rows is not None else default
+        return self._outline.get(key, default)
+
+    def contains(self, text):
+        '''Returns whether text appears anywhere in the raw body.'''
+        needle = text.encode("utf-8")
+        tail = b""
+        self._body.seek(0)
+        for chunk in iter(lambda: self._body.read(CHUNK_BYTES), b""):
+            if needle in tail + chunk:
+                return True
+            tail = chunk[-(len(needle) - 1):]
+        return False
+
+    def close(self):
+        self._body.close()
+
+
+def close_report(response):
+    '''Releases the spooled body of response once its rows have been read.
+    Dict responses hold nothing to release.'''
+    if isinstance(response, StreamedReport):
+        response.close()
+
+
+class _Rows():
+    '''Re-iterable view of a StreamedReport's top level rows.'''
+
+    def __init__(self, report):
+        self._report = report
+
+    def __iter__(self):
+        return self._report.iter_row_groups()
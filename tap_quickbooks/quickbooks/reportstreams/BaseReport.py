@@ -1,15 +1,23 @@
 import calendar
 import datetime
-from typing import Dict
+import time
+from typing import ClassVar, Dict
 
 import backoff
 import requests
 import singer
 
+from tap_quickbooks.quickbooks.concurrency import ordered_map
+from tap_quickbooks.quickbooks.report_planner import DateRange
+from tap_quickbooks.quickbooks.report_reader import StreamedReport, close_report
 from tap_quickbooks.quickbooks.rest_reports import QuickbooksStream, RetriableException, is_fatal_code
 
 LOGGER = singer.get_logger()
 
+# Report requests slower than this are treated as a sign of overload by the
+# adaptive concurrency controller.
+REPORT_LATENCY_TARGET_SECONDS = 60
+
 
 def _is_fatal_including_504(e: requests.exceptions.RequestException) -> bool:
     """Fatal predicate for _get_504_fatal: same as is_fatal_code but also stops on 504.
@@ -20,7 +28,29 @@ def _is_fatal_including_504(e: requests.exceptions.RequestException) -> bool:
     """
     return is_fatal_code(e) or e.response.status_code == 504
 
+class ReportRecords():
+    """Iterates the records of a report stream and exposes its checkpoint,
+    which sync_records saves to state whenever it advances."""
+
+    def __init__(self, report, catalog_entry):
+        self.report = report
+        self.catalog_entry = catalog_entry
+
+    def __iter__(self):
+        return iter(self.report.sync(self.catalog_entry))
+
+    @property
+    def checkpoint(self):
+        return self.report.checkpoint
+
+
 class BaseReportStream(QuickbooksStream):
+    # Whether flattened rows hold each cell's value (True) or the whole
+    # ColData dict, keeping ids (False).
+    row_cell_values: ClassVar[bool] = True
+    # Whether flattened rows end with the account section they belong to.
+    track_current_account: ClassVar[bool] = False
+    current_account = {}
 
     def __init__(
         self,
@@ -28,22 +58,60 @@ class BaseReportStream(QuickbooksStream):
         start_date,
         report_periods,
         state_passed=None,
+        checkpoint=None,
     ):
         self.qb = qb
         self.start_date = start_date
         self.has_number_of_periods = report_periods is not None
         self.number_of_periods = report_periods or 3
         self.state_passed = state_passed
+        # Progress of an interrupted full sync, read from state, and progress
+        # of this one: the last date range whose records have all been
+        # yielded (see _checkpointed).
+        self.resume_checkpoint = checkpoint
+        self.checkpoint = None
+
+    def _resume_start(self, start_date):
+        """Returns the day after the last completed period of an interrupted
+        full sync from the same start_date, or start_date itself."""
+        checkpoint = self.resume_checkpoint
+        if not checkpoint or checkpoint.get("start_date") != start_date.strftime("%Y-%m-%d"):
+            return start_date
+        resume_date = datetime.datetime.strptime(checkpoint["end_date"], "%Y-%m-%d") + datetime.timedelta(days=1)
+        LOGGER.info(f"Resuming {self.stream} full sync after the {checkpoint.get('granularity')} "
+                    f"period ending {checkpoint['end_date']}")
+        return resume_date if isinstance(start_date, datetime.datetime) else resume_date.date()
+
+    def _checkpointed(self, start_date, responses, granularity):
+        """Passes (date_range, response) pairs of a full sync from start_date
+        through, and marks each date range as done in checkpoint once the
+        caller asks for the next pair, i.e. has yielded all its records.
+        Streamed responses are closed at that point."""
+        for date_range, response in responses:
+            try:
+                yield date_range, response
+            finally:
+                close_report(response)
+            self.checkpoint = {
+                "start_date": start_date.strftime("%Y-%m-%d"),
+                "end_date": date_range.end.strftime("%Y-%m-%d"),
+                "granularity": granularity,
+            }
     
+    def _reports_too_much_data(self, response):
+        message = "Unable to display more data. Please reduce the date range."
+        if isinstance(response, StreamedReport):
+            return response.contains(message)
+        return message in str(response)
+
     def concurrent_get(self, report_entity, params):
         log_msg = f"Fetch {report_entity} for period {params['start_date']} to {params['end_date']}"
         LOGGER.info(log_msg)
         response = self._get(report_entity, params)
         LOGGER.info(f"COMPLETE: {log_msg}")
 
-        if "Unable to display more data. Please reduce the date range." in str(
-            response
-        ):
+        if self._reports_too_much_data(response):
+            close_report(response)
             return {
                 "error": "Too much data for current period",
                 "start_date": params["start_date"],
@@ -52,6 +120,55 @@ class BaseReportStream(QuickbooksStream):
         else:
             return response
 
+    def _recent_periods(self):
+        """Yields the date ranges of the last number_of_periods calendar
+        months, newest first; the current month ends today."""
+        end_date = datetime.date.today()
+        for _ in range(self.number_of_periods):
+            start_date = end_date.replace(day=1)
+            yield DateRange(start_date, end_date)
+            end_date = start_date - datetime.timedelta(days=1)
+
+    def _get_periods(self, report_entity, periods, params, log_name=None):
+        """Fetches report_entity for each date range in periods, up to
+        report_concurrency at a time, and yields (period, response) pairs in
+        the order of periods. Streamed responses are closed once the caller
+        asks for the next pair."""
+        def fetch(period):
+            period_params = {**params, **period.params()}
+            LOGGER.info(f"Fetch {log_name or report_entity} for period "
+                        f"{period_params['start_date']} to {period_params['end_date']}")
+            return period, self._get(report_entity=report_entity, params=period_params)
+
+        for period, response in ordered_map(fetch, periods, max_workers=self.qb.report_concurrency):
+            try:
+                yield period, response
+            finally:
+                close_report(response)
+
+    def density_key(self, params):
+        """Key of this report's entry in the realm's density profile. Row
+        counts depend on the columns requested, so the column count is part
+        of it."""
+        return "{}:{}".format(self.tap_stream_id, len(params["columns"].split(",")))
+
+    def controlled_get(self, report_entity, params):
+        """concurrent_get that reports the outcome to the stream's
+        concurrency controller: failures and "too much data" answers count
+        as overload, other responses as successes with their latency."""
+        epoch = self.concurrency_controller.begin()
+        started = time.monotonic()
+        try:
+            response = self.concurrent_get(report_entity=report_entity, params=params)
+        except Exception:
+            self.concurrency_controller.record_overload(epoch)
+            raise
+        if response.get("error"):
+            self.concurrency_controller.record_overload(epoch)
+        else:
+            self.concurrency_controller.record_success(time.monotonic() - started, epoch)
+        return response
+
     @backoff.on_exception(backoff.expo,
                           requests.exceptions.HTTPError,
                           max_tries=10,
@@ -105,25 +222,46 @@ class BaseReportStream(QuickbooksStream):
         columns.append("Categories")
         return columns
 
-    def _recursive_row_search(self, row, output, categories):
-        row_group = row.get("Rows")
-        if 'ColData' in list(row.keys()):
+    def _flatten_rows(self, row_array, categories=()):
+        """Yields the data rows nested under row_array, depth first, without
+        recursion or an intermediate list.
+
+        Each row is a list of its cells followed by the list of section
+        headers above it; rows of the same section share that list, so it
+        must not be modified. Cells are the ColData values, or the ColData
+        dicts when row_cell_values is False. With track_current_account set,
+        the ColData of the last account section header entered is appended
+        as well.
+        """
+        stack = [(iter(row_array), list(categories))]
+        while stack:
+            rows, path = stack[-1]
+            row = next(rows, None)
+            if row is None:
+                stack.pop()
+                continue
+
+            if self.track_current_account and row.get("type") == "Section":
+                header_data = (row.get("Header") or {}).get("ColData", [{}])
+                if header_data and header_data[0].get("id"):
+                    self.current_account = header_data[0]
+
             data = row.get("ColData")
-            values = [column.get("value") for column in data]
-            categories_copy = categories.copy()
-            values.append(categories_copy)
-            output.append(values.copy())
-        elif row_group is None or row_group == {}:
-            pass
-        else:
-            row_array = row_group.get("Row")
+            if data is not None:
+                values = [column.get("value") for column in data] if self.row_cell_values else list(data)
+                values.append(path)
+                if self.track_current_account:
+                    values.append(self.current_account)
+                yield values
+                continue
+
+            row_group = row.get("Rows")
+            if not row_group:
+                continue
             header = row.get("Header")
             if header is not None:
-                categories.append(header.get("ColData")[0].get("value"))
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
-            if header is not None:
-                categories.pop()
+                path = path + [header.get("ColData")[0].get("value")]
+            stack.append((iter(row_group.get("Row")), path))
 
     def _process_period(self, report_entity, log_name, start_date, end_date, merged, track_total):
         """Fetch one date chunk and accumulate rows into merged.
@@ -177,10 +315,7 @@ class BaseReportStream(QuickbooksStream):
             return
 
         columns = self._get_monthly_column_metadata(resp)
-        output = []
-        for row in row_array:
-            self._recursive_row_search(row, output, [])
-        for raw_row in output:
+        for raw_row in self._flatten_rows(row_array):
             self._merge_row_into_dict(raw_row, columns, merged, track_total)
 
     def _point_in_time_col_name(self, start_date, end_date):
@@ -224,11 +359,7 @@ class BaseReportStream(QuickbooksStream):
             return
 
         month_col = self._point_in_time_col_name(start_date, end_date)
-        output = []
-        for row in row_array:
-            self._recursive_row_search(row, output, [])
-
-        for raw_row in output:
+        for raw_row in self._flatten_rows(row_array):
             # raw_row is [account_value, total_value, categories_list]
             if len(raw_row) < 3:
                 continue
@@ -30,29 +30,6 @@ class DailyCashFlowReport(BaseReportStream):
         columns.append("Categories")
         return columns
 
-    def _recursive_row_search(self, row, output, categories):
-        row_group = row.get("Rows")
-        if 'ColData' in list(row.keys()):
-            # Write the row
-            data = row.get("ColData")
-            values = [column.get("value") for column in data]
-            categories_copy = categories.copy()
-            values.append(categories_copy)
-            values_copy = values.copy()
-            output.append(values_copy)
-        elif row_group is None or row_group == {}:
-            pass
-        else:
-            row_array = row_group.get("Row")
-            header = row.get("Header")
-            if header is not None:
-                categories.append(header.get("ColData")[0].get("value"))
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
-            if header is not None:
-                categories.pop()
-    
-
     def check_date_greater_than_months(self,date_obj):
         # Get the current date
         today = datetime.datetime.now()
@@ -116,10 +93,7 @@ class DailyCashFlowReport(BaseReportStream):
             if row_array is None:
                 return
 
-            output = []
-            categories = []
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
+            output = self._flatten_rows(row_array)
 
             # Zip columns and row data.
             for raw_row in output:
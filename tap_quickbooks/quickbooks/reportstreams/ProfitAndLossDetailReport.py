@@ -1,13 +1,15 @@
 import datetime
+import functools
 from typing import ClassVar, List
 
 import singer
 
-from tap_quickbooks.quickbooks.reportstreams.BaseReport import BaseReportStream
+from tap_quickbooks.quickbooks.concurrency import AIMDController
+from tap_quickbooks.quickbooks.report_planner import DateRange, RangePlanner, is_too_much_data
+from tap_quickbooks.quickbooks.reportstreams.BaseReport import BaseReportStream, REPORT_LATENCY_TARGET_SECONDS
 from dateutil.parser import parse
 from calendar import monthrange
 from dateutil.relativedelta import relativedelta
-import concurrent.futures
 
 LOGGER = singer.get_logger()
 
@@ -16,39 +18,10 @@ class ProfitAndLossDetailReport(BaseReportStream):
     stream: ClassVar[str] = 'ProfitAndLossDetailReport'
     key_properties: ClassVar[List[str]] = []
     replication_method: ClassVar[str] = 'FULL_TABLE'
-    current_account = {}
-    daily = False
-    weekly = False
-    use_basic_cols = False
-
-    def _recursive_row_search(self, row, output, categories):
-        row_group = row.get("Rows")
-        if row.get("type")=="Section":
-            if row.get("Header", {}).get("ColData", [{}]):
-                if row.get("Header", {}).get("ColData", [{}])[0].get("id"):
-                    self.current_account = row.get("Header", {}).get("ColData", [{}])[0]
-        if 'ColData' in list(row.keys()):
-            # Write the row
-            data = row.get("ColData")
-            values = [column for column in data]
-            categories_copy = categories.copy()
-            values.append(categories_copy)
-            values_copy = values.copy()
-            if values_copy:
-                values_copy += [self.current_account]
-            output.append(values_copy)
-        elif row_group is None or row_group == {}:
-            pass
-        else:
-            row_array = row_group.get("Row")
-            header = row.get("Header")
-            if header is not None:
-                categories.append(header.get("ColData")[0].get("value"))
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
-            if header is not None:
-                categories.pop()
-    
+    stream_rows: ClassVar[bool] = True
+    row_cell_values: ClassVar[bool] = False
+    track_current_account: ClassVar[bool] = True
+
     def clean_row(self, output, columns):
         # Zip columns and row data.
         for raw_row in output:
@@ -78,8 +51,32 @@ class ProfitAndLossDetailReport(BaseReportStream):
 
             yield cleansed_row
 
+    def _periods(self, start_date, today):
+        """Yields consecutive month sized date ranges from start_date to
+        today. Ranges that turn out to be too large are split by the
+        planner."""
+        while start_date < today:
+            _ , period_days = monthrange(start_date.year, start_date.month)
+
+            # calculate end date
+            if (today - start_date).days <= period_days:
+                end_date = today
+                last_day = today
+            else:
+                end_date = start_date + relativedelta(days=+period_days)
+                last_day = end_date - datetime.timedelta(days=1)
+
+            yield DateRange(start_date.date(), last_day.date())
+
+            # assign next start_date
+            start_date = end_date
+
+    def _fetch_range(self, params, date_range):
+        return self.controlled_get("ProfitAndLossDetail", {**params, **date_range.params()})
+
     def sync(self, catalog_entry):
-        full_sync = not self.state_passed and not self.has_number_of_periods
+        # An interrupted full sync is resumed even once state has been passed.
+        full_sync = (not self.state_passed or self.resume_checkpoint is not None) and not self.has_number_of_periods
 
         basic_cols = [
             "tx_date",
@@ -137,123 +134,74 @@ class ProfitAndLossDetailReport(BaseReportStream):
         ]
 
         if full_sync:
-            delta = 30
-            start_date = self.start_date
-            start_date = start_date.replace(tzinfo=None)
+            sync_start_date = self.start_date.replace(tzinfo=None)
+            start_date = self._resume_start(sync_start_date)
             min_time = datetime.datetime.min.time()
             today = datetime.date.today()
             today = datetime.datetime.combine(today, min_time)
-            max_requests = 1
-            fetch_cols = cols.copy()
-
-            # params for concurrent requests
-            requests_params = []
-
-            while start_date < today:
-                # get the number of days and max number of requests
-                if self.daily:
-                    period_days = 1
-                    self.daily = True
 
-                elif self.weekly:
-                    period_days = 7
-                    self.weekly = True
-                else:
-                    _ , period_days = monthrange(start_date.year, start_date.month)
-
-                
-                # initialize params
-                params = {
-                    "accounting_method": "Accrual",
-                    "columns": ",".join(fetch_cols),
-                }
-
-                # calculate end date
-                if (today - start_date).days <= period_days:
-                    end_date = today
-                    params["end_date"] = today.strftime("%Y-%m-%d")
-                else:
-                    end_date = start_date + relativedelta(days=+period_days)
-                    params["end_date"] = (
-                        end_date - datetime.timedelta(days=1)
-                    ).strftime("%Y-%m-%d")
+            params = {
+                "accounting_method": "Accrual",
+                "columns": ",".join(cols),
+            }
+            basic_params = {
+                "accounting_method": "Accrual",
+                "columns": ",".join(basic_cols),
+            }
+
+            # Periods are fetched concurrently but processed in date order on
+            # this thread, so current_account carries over as in a serial sync.
+            self.concurrency_controller = AIMDController(
+                self.qb.report_concurrency, latency_target=REPORT_LATENCY_TARGET_SECONDS)
+            density_key = self.density_key(params)
+            profile = self.qb.density_profile
+            planner = RangePlanner(functools.partial(self._fetch_range, params), self.concurrency_controller,
+                                   on_split=functools.partial(profile.record_too_large, density_key))
+
+            def fitting(responses):
+                for date_range, r in responses:
+                    if is_too_much_data(r):
+                        # Even a single day is too large; retry it with fewer columns.
+                        profile.record_too_large(density_key, date_range)
+                        r = self._fetch_range(basic_params, date_range)
+                        if is_too_much_data(r):
+                            raise Exception(r)
+                    yield date_range, r
 
-                params["start_date"] = (start_date).strftime("%Y-%m-%d")
-                requests_params.append(params.copy())
+            periods = profile.plan(density_key, self._periods(start_date, today))
+            for date_range, r in self._checkpointed(sync_start_date, fitting(planner.run(periods)), "month"):
+                # Get column metadata.
+                columns = self._get_column_metadata(r)
+                columns += ["Account"]
 
-                # assign next start_date
-                start_date = end_date
+                # Recursively get row data.
+                row_group = r.get("Rows")
+                row_array = row_group.get("Row")
 
-                # get the data
-                if len(requests_params) < max_requests and end_date < today:
+                if row_array is None:
+                    profile.record(density_key, date_range, 0)
                     continue
-                elif len(requests_params) == max_requests or end_date == today:
-                    with concurrent.futures.ThreadPoolExecutor(
-                        max_workers=max_requests
-                    ) as executor:
-                        resp = executor.map(
-                            lambda x: self.concurrent_get(
-                                report_entity="ProfitAndLossDetail", params=x
-                            ),
-                            requests_params,
-                        )
-                    requests_params = []
-
-                # parse data and set the new start_date
-                for r in resp:
-                    if r.get("error") == "Too much data for current period":
-                        start_date = datetime.datetime.strptime(
-                            r.get("start_date"), "%Y-%m-%d"
-                        )
-                        if not self.weekly and not self.daily:
-                            self.weekly = True
-                        elif self.weekly and not self.daily:
-                            self.weekly = False
-                            self.daily = True
-                        elif self.daily:
-                            self.use_basic_cols = True
-                            fetch_cols = basic_cols.copy()
-                        elif self.use_basic_cols:
-                            raise Exception(r)
-                        break
-                    else:
-                        self.weekly = False
-                        self.daily = False
 
-                        # Get column metadata.
-                        columns = self._get_column_metadata(r)
-                        columns += ["Account"]
+                # Rows are flattened as they are emitted, so streamed
+                # responses are never held in memory as a whole.
+                output_rows = 0
+                for raw_row in self._flatten_rows(row_array):
+                    output_rows += 1
+                    yield from self.clean_row((raw_row,), columns)
 
-                        # Recursively get row data.
-                        row_group = r.get("Rows")
-                        row_array = row_group.get("Row")
+                profile.record(density_key, date_range, output_rows)
 
-                        if row_array is None:
-                            continue
-
-                        output = []
-                        categories = []
-                        for row in row_array:
-                            self._recursive_row_search(row, output, categories)
-
-                        yield from self.clean_row(output, columns)
+            profile.save()
 
         else:
             LOGGER.info(f"Syncing P&L of last {self.number_of_periods} periods")
-            end_date = datetime.date.today()
-
-            for _ in range(self.number_of_periods):
-                start_date = end_date.replace(day=1)
-                params = {
-                    "start_date": start_date.strftime("%Y-%m-%d"),
-                    "end_date": end_date.strftime("%Y-%m-%d"),
-                    "accounting_method": "Accrual",
-                    "columns": ",".join(cols)
-                }
-
-                LOGGER.info(f"Fetch Journal Report for period {params['start_date']} to {params['end_date']}")
-                resp = self._get(report_entity='ProfitAndLossDetail', params=params)
+            params = {
+                "accounting_method": "Accrual",
+                "columns": ",".join(cols)
+            }
 
+            for _, resp in self._get_periods("ProfitAndLossDetail", self._recent_periods(), params,
+                                             log_name="Journal Report"):
                 # Get column metadata.
                 columns = self._get_column_metadata(resp)
                 columns += ["Account"]
@@ -263,15 +211,6 @@ class ProfitAndLossDetailReport(BaseReportStream):
                 row_array = row_group.get("Row")
 
                 if row_array is None:
-                    # Update end date
-                    end_date = start_date - datetime.timedelta(days=1)
                     continue
 
-                output = []
-                categories = []
-                for row in row_array:
-                    self._recursive_row_search(row, output, categories)
-                
-                yield from self.clean_row(output, columns)
-
-                end_date = start_date - datetime.timedelta(days=1)
+                yield from self.clean_row(self._flatten_rows(row_array), columns)
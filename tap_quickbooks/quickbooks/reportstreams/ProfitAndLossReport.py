@@ -3,6 +3,7 @@ from typing import ClassVar, Dict, List, Optional
 
 import singer
 
+from tap_quickbooks.quickbooks.report_planner import DateRange
 from tap_quickbooks.quickbooks.reportstreams.BaseReport import BaseReportStream
 from tap_quickbooks.sync import transform_data_hook
 from dateutil.parser import parse
@@ -15,7 +16,8 @@ class ProfitAndLossReport(BaseReportStream):
     stream: ClassVar[str] = 'ProfitAndLossReport'
     key_properties: ClassVar[List[str]] = []
     replication_method: ClassVar[str] = 'FULL_TABLE'
-    current_account = {}
+    row_cell_values: ClassVar[bool] = False
+    track_current_account: ClassVar[bool] = True
 
     def _get_column_metadata(self, resp):
         columns = []
@@ -27,57 +29,27 @@ class ProfitAndLossReport(BaseReportStream):
         columns.append("Categories")
         return columns
 
-    def _recursive_row_search(self, row, output, categories):
-        row_group = row.get("Rows")
-        if row.get("type")=="Section":
-            if row.get("Header", {}).get("ColData", [{}]):
-                if row.get("Header", {}).get("ColData", [{}])[0].get("id"):
-                    self.current_account = row.get("Header", {}).get("ColData", [{}])[0]
-        if 'ColData' in list(row.keys()):
-            # Write the row
-            data = row.get("ColData")
-            values = [column for column in data]
-            categories_copy = categories.copy()
-            values.append(categories_copy)
-            values_copy = values.copy()
-            if values_copy:
-                values_copy += [self.current_account]
-            output.append(values_copy)
-        elif row_group is None or row_group == {}:
-            pass
-        else:
-            row_array = row_group.get("Row")
-            header = row.get("Header")
-            if header is not None:
-                categories.append(header.get("ColData")[0].get("value"))
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
-            if header is not None:
-                categories.pop()
+    def _windows(self, start_date):
+        """Yields consecutive 31 day date ranges from start_date, the last
+        one ending today."""
+        today = datetime.date.today()
+        while start_date < today:
+            end_date = min(start_date + datetime.timedelta(30), today)
+            yield DateRange(start_date, end_date)
+            start_date = end_date + datetime.timedelta(1)
 
     def sync(self, catalog_entry):
-        full_sync = not self.state_passed and not self.has_number_of_periods
-
-        if full_sync:
-            start_date = self.start_date.date()
-            delta = 30
-
-            while start_date<datetime.date.today():
-                LOGGER.info(f"Starting full sync of P&L")
-                end_date = (start_date + datetime.timedelta(delta))
-                if end_date>datetime.date.today():
-                    end_date = datetime.date.today()
-
-                params = {
-                    "start_date": start_date.strftime("%Y-%m-%d"),
-                    "end_date": end_date.strftime("%Y-%m-%d"),
-                    "accounting_method": "Accrual"
-                }
+        # An interrupted full sync is resumed even once state has been passed.
+        full_sync = (not self.state_passed or self.resume_checkpoint is not None) and not self.has_number_of_periods
 
-                LOGGER.info(f"Fetch Profit and Loss Report for period {params['start_date']} to {params['end_date']}")
-                resp = self._get(report_entity='ProfitAndLoss', params=params)
-                start_date = end_date + datetime.timedelta(1)
+        params = {"accounting_method": "Accrual"}
 
+        if full_sync:
+            LOGGER.info(f"Starting full sync of P&L")
+            sync_start_date = self.start_date.date()
+            windows = self._windows(self._resume_start(sync_start_date))
+            responses = self._get_periods("ProfitAndLoss", windows, params, log_name="Profit and Loss Report")
+            for _, resp in self._checkpointed(sync_start_date, responses, "31 days"):
                 # Get column metadata.
                 columns = self._get_column_metadata(resp)
                 columns += ["Account"]
@@ -89,10 +61,7 @@ class ProfitAndLossReport(BaseReportStream):
                 if row_array is None:
                     continue
 
-                output = []
-                categories = []
-                for row in row_array:
-                    self._recursive_row_search(row, output, categories)
+                output = self._flatten_rows(row_array)
 
                 # Zip columns and row data.
                 for raw_row in output:
@@ -123,19 +92,8 @@ class ProfitAndLossReport(BaseReportStream):
                     yield cleansed_row
         else:
             LOGGER.info(f"Syncing P&L of last {self.number_of_periods} periods")
-            end_date = datetime.date.today()
-
-            for i in range(self.number_of_periods):
-                start_date = end_date.replace(day=1)
-                params = {
-                    "start_date": start_date.strftime("%Y-%m-%d"),
-                    "end_date": end_date.strftime("%Y-%m-%d"),
-                    "accounting_method": "Accrual"
-                }
-
-                LOGGER.info(f"Fetch PnL Report for period {params['start_date']} to {params['end_date']}")
-                resp = self._get(report_entity='ProfitAndLoss', params=params)
-
+            for _, resp in self._get_periods("ProfitAndLoss", self._recent_periods(), params,
+                                             log_name="PnL Report"):
                 # Get column metadata.
                 columns = self._get_column_metadata(resp)
                 columns += ["Account"]
@@ -145,14 +103,9 @@ class ProfitAndLossReport(BaseReportStream):
                 row_array = row_group.get("Row")
 
                 if row_array is None:
-                    # Update end date
-                    end_date = start_date - datetime.timedelta(days=1)
                     continue
 
-                output = []
-                categories = []
-                for row in row_array:
-                    self._recursive_row_search(row, output, categories)
+                output = self._flatten_rows(row_array)
 
                 # Zip columns and row data.
                 for raw_row in output:
@@ -181,4 +134,3 @@ class ProfitAndLossReport(BaseReportStream):
 
                     yield cleansed_row
 
-                end_date = start_date - datetime.timedelta(days=1)
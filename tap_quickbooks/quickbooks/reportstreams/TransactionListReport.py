@@ -14,6 +14,7 @@ class TransactionListReport(BaseReportStream):
     stream: ClassVar[str] = 'TransactionListReport'
     key_properties: ClassVar[List[str]] = []
     replication_method: ClassVar[str] = 'FULL_TABLE'
+    row_cell_values: ClassVar[bool] = False
 
     def _get_column_metadata(self, resp):
         columns = []
@@ -25,28 +26,6 @@ class TransactionListReport(BaseReportStream):
         columns.append("Categories")
         return columns
 
-    def _recursive_row_search(self, row, output, categories):
-        row_group = row.get("Rows")
-        if 'ColData' in list(row.keys()):
-            # Write the row
-            data = row.get("ColData")
-            values = [column for column in data]
-            categories_copy = categories.copy()
-            values.append(categories_copy)
-            values_copy = values.copy()
-            output.append(values_copy)
-        elif row_group is None or row_group == {}:
-            pass
-        else:
-            row_array = row_group.get("Row")
-            header = row.get("Header")
-            if header is not None:
-                categories.append(header.get("ColData")[0].get("value"))
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
-            if header is not None:
-                categories.pop()
-
     def sync(self, catalog_entry):
         LOGGER.info(f"Starting full sync of TransactionListReport")
         end_date = datetime.date.today()
@@ -99,10 +78,7 @@ class TransactionListReport(BaseReportStream):
         if row_array is None:
             return
 
-        output = []
-        categories = []
-        for row in row_array:
-            self._recursive_row_search(row, output, categories)
+        output = self._flatten_rows(row_array)
 
         # Zip columns and row data.
         for raw_row in output:
@@ -1,26 +1,466 @@
 # pylint: disable=protected-access
+import concurrent.futures
+import datetime
+import functools
+import queue
+import re
+import threading
+import time
 import singer
 import json
 import singer.utils as singer_utils
+from singer import metadata, metrics
 
-from requests.exceptions import HTTPError
-from tap_quickbooks.quickbooks.exceptions import TapQuickbooksException, raise_for_invalid_credentials
+from requests.exceptions import HTTPError, RequestException, Timeout
+from tap_quickbooks.quickbooks.exceptions import (
+    TapQuickbooksException,
+    RetriableApiError,
+    raise_for_invalid_credentials)
+from tap_quickbooks.quickbooks.concurrency import ordered_map
 
 LOGGER = singer.get_logger()
 
 MAX_RETRIES = 4
 
+DEFAULT_PAGE_SIZE = 100
+MIN_PAGE_SIZE = 25
+# The query endpoint refuses MAXRESULTS above 1000.
+MAX_PAGE_SIZE = 1000
+# Adaptive paging only grows the page size while pages come back faster than this.
+ADAPTIVE_PAGE_LATENCY_SECONDS = 10
+
+# Backfill workers hand records to the consumer in pages of this size, and may
+# run this many pages ahead of it before they block.
+BACKFILL_PAGE_SIZE = 100
+BACKFILL_QUEUED_PAGES_PER_WORKER = 4
+
+# Entities whose inactive records are not queried when include_deleted is set.
+DELETED_EXCLUDED_ENTITIES = ["Bill", "Payment", "Transfer", "CompanyInfo", "CreditMemo", "Invoice",
+                             "JournalEntry", "Preferences", "Purchase", "SalesReceipt", "TimeActivity",
+                             "BillPayment", "Estimate"]
+INACTIVE_FILTER = "Active = false"
+ALL_RECORDS_FILTER = "Active IN (true, false)"
+
+
+def is_query_timeout(response):
+    '''Whether response is the QUERY_TIMEOUT error Quickbooks returns for queries
+    that scan too much data.'''
+    try:
+        body = response.json()
+    except Exception:
+        return False
+    return isinstance(body, list) and bool(body) and body[0].get("errorCode") == "QUERY_TIMEOUT"
+
+
+class PageSizer():
+    '''Holds the MAXRESULTS used for entity query pages.
+
+    With adaptive set, the page size doubles toward MAX_PAGE_SIZE for every
+    page that comes back full within ADAPTIVE_PAGE_LATENCY_SECONDS, and is
+    halved on timeouts, server errors and QUERY_TIMEOUT. Pages may be fetched from several
+    threads, so updates are serialized.'''
+
+    def __init__(self, page_size=None, adaptive=False):
+        self.page_size = min(max(int(page_size or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+
+    def record(self, requested_size, returned_size, latency):
+        if not self.adaptive or returned_size < requested_size:
+            return
+        with self._lock:
+            if requested_size >= self.page_size and latency < ADAPTIVE_PAGE_LATENCY_SECONDS:
+                self.page_size = min(self.page_size * 2, MAX_PAGE_SIZE)
+
+    def shrink(self, requested_size):
+        '''Halves the page size below requested_size. Returns False when adaptive
+        paging is off or the page size is already at its minimum.'''
+        if not self.adaptive:
+            return False
+        with self._lock:
+            if requested_size <= MIN_PAGE_SIZE:
+                return False
+            self.page_size = max(min(self.page_size, requested_size // 2), MIN_PAGE_SIZE)
+            return True
+
+
+class PageCursor():
+    '''Tracks the 1-based STARTPOSITION of entity query pages.
+
+    reserve() hands out the position of the next page and moves past it, so
+    consecutive pages always cover adjacent ranges no matter how the page size
+    changes. With verify set, check() compares every page with the one before
+    it and report() logs what was found as metrics:
+
+      * pagination_id_overlaps - Ids returned by both of two consecutive pages
+      * pagination_gaps - non-empty pages that followed a short page, which
+        means rows moved between requests
+      * pagination_missing_records - records the COUNT(*) probe reported but
+        no page returned
+    '''
+
+    def __init__(self, stream, verify=False):
+        self.stream = stream
+        self.verify = verify
+        self.position = 1
+        self.records_seen = 0
+        self.overlaps = 0
+        self.gaps = 0
+        self._previous_ids = set()
+        self._short_page_seen = False
+
+    def reserve(self, page_size):
+        position = self.position
+        self.position += page_size
+        return position
+
+    def check(self, position, page_size, records):
+        self.records_seen += len(records)
+        if not self.verify:
+            return
+
+        ids = {rec.get("Id") for rec in records}
+        overlap = ids & self._previous_ids
+        if overlap:
+            LOGGER.warning("%s page at position %s repeats %s Ids of the previous page",
+                           self.stream, position, len(overlap))
+            self.overlaps += len(overlap)
+        if records and self._short_page_seen:
+            LOGGER.warning("%s page at position %s returned records after a short page", self.stream, position)
+            self.gaps += 1
+        if len(records) < page_size:
+            self._short_page_seen = True
+        self._previous_ids = ids
+
+    def report(self, expected_total=None):
+        if not self.verify:
+            return
+
+        tags = {metrics.Tag.endpoint: self.stream}
+        metrics.log(LOGGER, metrics.Point('counter', 'pagination_id_overlaps', self.overlaps, tags))
+        metrics.log(LOGGER, metrics.Point('counter', 'pagination_gaps', self.gaps, tags))
+        if expected_total is not None:
+            missing = max(expected_total - self.records_seen, 0)
+            metrics.log(LOGGER, metrics.Point('counter', 'pagination_missing_records', missing, tags))
+
+
+class ShardedBackfill():
+    '''Iterates the records of consecutive LastUpdatedTime windows that are
+    queried concurrently by a pool of worker threads.
+
+    Records are yielded in whatever order the windows produce them. Because of
+    that, the bookmark must not follow the records: `watermark` is instead the
+    end of the last window for which that window and every window before it
+    have been fully yielded. sync_records writes it as the bookmark whenever it
+    advances, as signalled by `manages_bookmark`.
+
+    Workers hand over records a page at a time through a bounded queue, so a
+    slow consumer holds back the workers instead of buffering whole windows.
+    '''
+
+    manages_bookmark = True
+
+    def __init__(self, rest, catalog_entry, windows, max_workers):
+        self.rest = rest
+        self.catalog_entry = catalog_entry
+        self.windows = windows
+        self.max_workers = max_workers
+        self.watermark = None
+
+    def __iter__(self):
+        results = queue.Queue(maxsize=self.max_workers * BACKFILL_QUEUED_PAGES_PER_WORKER)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def run(index, start_date, end_date):
+            try:
+                page = []
+                for rec in self.rest._query_window(self.catalog_entry, start_date, end_date):
+                    page.append(rec)
+                    if len(page) >= BACKFILL_PAGE_SIZE:
+                        put(("records", index, page))
+                        page = []
+                    if stop.is_set():
+                        return
+                put(("records", index, page))
+                put(("done", index, None))
+            except Exception as ex:  # pylint: disable=broad-except
+                put(("error", index, ex))
+
+        completed = [False] * len(self.windows)
+        next_window = 0
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for index, (start_date, end_date) in enumerate(self.windows):
+                executor.submit(run, index, start_date, end_date)
+
+            while next_window < len(self.windows):
+                kind, index, payload = results.get()
+                if kind == "error":
+                    raise payload
+                if kind == "records":
+                    yield from payload
+                    continue
+
+                completed[index] = True
+                while next_window < len(self.windows) and completed[next_window]:
+                    self.watermark = singer_utils.strftime(self.windows[next_window][1])
+                    next_window += 1
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class KeysetQuery():
+    '''Pages through an incremental query in replication key order, starting
+    every page from the last key seen instead of at a growing STARTPOSITION,
+    so deep pages cost the same as the first one.
+
+    The query language has no OR, so the (LastUpdatedTime, Id) key cannot be
+    put in the WHERE clause. Each page instead asks for the records at or
+    after the cursor time, sorted by time, and skips the Ids it already
+    yielded at exactly that time. When a whole page is taken up by such
+    records, the rest of that time's records are paged through on their own,
+    ordered by Id.
+
+    Records arrive sorted, so once a later time has been seen every record of
+    the earlier ones has been yielded. `watermark` is the latest such time,
+    updated after every page; like ShardedBackfill it is safe to checkpoint.
+    When include_deleted reads the inactive records in a second pass, the
+    watermark only starts to advance in that pass, since resuming from it
+    must not skip them; single_pass_deleted avoids that. Once every pass is
+    done it is the latest time any of them reached.
+
+    A page that hits QUERY_TIMEOUT is asked for again up to the middle of the
+    remaining time range, halving it like _query_window does, and paging
+    goes on past that bound once it has been read.
+    '''
+
+    manages_bookmark = True
+
+    def __init__(self, rest, catalog_entry, start_date):
+        self.rest = rest
+        self.catalog_entry = catalog_entry
+        self.start_date = start_date
+        self.watermark = None
+        catalog_metadata = metadata.to_map(catalog_entry['metadata'])
+        self.replication_key = catalog_metadata.get((), {}).get('replication-key')
+
+    def __iter__(self):
+        stream = self.catalog_entry['stream']
+        active_filters = self.rest._active_filters(stream)
+        last_cursors = []
+        for index, active_filter in enumerate(active_filters):
+            last_cursor = yield from self._keyset_pass(
+                functools.partial(self.rest._with_active_filter, active_filter=active_filter),
+                checkpoint=index == len(active_filters) - 1)
+            if last_cursor is not None:
+                last_cursors.append(last_cursor)
+
+        # Every pass is done, so the latest key any of them reached is safe.
+        if last_cursors:
+            self.watermark = max(last_cursors, key=singer_utils.strptime_with_tz)
+
+    def _replication_value(self, rec):
+        value = rec
+        for key in self.replication_key.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        return value
+
+    def _fetch(self, query, position):
+        stream = self.catalog_entry['stream']
+        page_size = self.rest.page_sizer.page_size
+        params = {"query": query, "minorversion": "75"}
+        headers = {"Accept": "application/json", "Content-Type": "application/json"}
+        url = f"{self.rest.qb.instance_url}/query"
+        return self.rest._fetch_page(url, headers, params, query, stream, position, page_size), page_size
+
+    def _keyset_pass(self, to_query, checkpoint):
+        '''Yields the records of one active filter pass. Returns the replication
+        key of the last record, or None when there were none.'''
+        stream = self.catalog_entry['stream']
+        cursor = self.start_date
+        cursor_time = singer_utils.strptime_with_tz(cursor)
+        # Ids yielded with a replication key equal to the cursor.
+        seen = set()
+        # Upper bound of the pages while a QUERY_TIMEOUT keeps them narrowed.
+        window_end = None
+
+        while True:
+            query = to_query(self.rest.qb._build_query_string(
+                self.catalog_entry, cursor,
+                singer_utils.strftime(window_end) if window_end else None,
+                order_by_clause=True, inclusive_start=bool(seen)))
+            try:
+                records, page_size = self._fetch(query, 1)
+            except (HTTPError, RetriableApiError) as ex:
+                window_end = self.rest._split_timed_out_window(
+                    ex, stream, cursor_time, window_end or singer_utils.now())
+                continue
+
+            fresh = 0
+            completed = None
+            for rec in records:
+                value = self._replication_value(rec)
+                rec_time = singer_utils.strptime_with_tz(value)
+                if rec_time > cursor_time:
+                    if seen:
+                        completed = cursor
+                    cursor, cursor_time, seen = value, rec_time, set()
+                elif rec.get("Id") in seen:
+                    continue
+                seen.add(rec.get("Id"))
+                fresh += 1
+                yield rec
+
+            if checkpoint and completed:
+                self.watermark = completed
+            if len(records) < page_size:
+                if window_end is None:
+                    return cursor if cursor != self.start_date or seen else None
+                # Everything up to the end of the narrowed window has been
+                # read, so go on after it without an upper bound again.
+                cursor, cursor_time, seen = singer_utils.strftime(window_end), window_end, set()
+                window_end = None
+                if checkpoint:
+                    self.watermark = cursor
+                continue
+            if not fresh:
+                yield from self._drain_ties(to_query, cursor, seen)
+                if checkpoint:
+                    self.watermark = cursor
+                seen = set()
+
+    def _drain_ties(self, to_query, cursor, seen):
+        '''Yields the records with a replication key equal to cursor that are
+        not in seen, paging by STARTPOSITION in Id order.'''
+        query = to_query("SELECT * FROM {} WHERE {} = '{}' ORDERBY Id ASC".format(
+            self.catalog_entry['stream'], self.replication_key, cursor))
+        position = 1
+        while True:
+            records, page_size = self._fetch(query, position)
+            for rec in records:
+                if rec.get("Id") not in seen:
+                    seen.add(rec.get("Id"))
+                    yield rec
+            if len(records) < page_size:
+                return
+            position += page_size
+
+
 class Rest():
 
     def __init__(self, qb):
         self.qb = qb
+        self.page_sizer = PageSizer(qb.query_page_size, qb.adaptive_page_size)
 
     def query(self, catalog_entry, state):
         start_date = self.qb.get_start_date(state, catalog_entry)
+
+        catalog_metadata = metadata.to_map(catalog_entry['metadata'])
+        replication_key = catalog_metadata.get((), {}).get('replication-key')
+        bookmark = singer.get_bookmark(state, catalog_entry['tap_stream_id'], replication_key)
+        if self.qb.query_batch:
+            batched = self.qb.query_batch.records(catalog_entry)
+            if batched is not None:
+                return batched
+        if self.qb.change_feed and replication_key:
+            changes = self.qb.change_feed.records(catalog_entry)
+            if changes is not None:
+                return changes
+        if self.qb.backfill_windows > 1 and replication_key and bookmark is None:
+            return self._sharded_backfill(catalog_entry, start_date)
+        if self.qb.keyset_pagination and replication_key:
+            return KeysetQuery(self, catalog_entry, start_date)
+        if self.qb.query_window_days and replication_key:
+            return self._windowed_query(catalog_entry, start_date)
+
         query = self.qb._build_query_string(catalog_entry, start_date)
 
         return self._query_recur(query, catalog_entry, start_date)
 
+    def _sharded_backfill(self, catalog_entry, start_date_str):
+        '''Splits [start_date, now] into backfill_windows LastUpdatedTime windows
+        of equal length and queries them concurrently.'''
+        start_date = singer_utils.strptime_with_tz(start_date_str)
+        end_date = singer_utils.now()
+        window_count = self.qb.backfill_windows
+        step = (end_date - start_date) / window_count
+        bounds = [start_date + step * i for i in range(window_count)] + [end_date]
+        windows = list(zip(bounds[:-1], bounds[1:]))
+
+        LOGGER.info("Backfilling %s in %s windows with %s workers",
+                    catalog_entry['stream'], window_count, self.qb.backfill_workers)
+        return ShardedBackfill(self, catalog_entry, windows, self.qb.backfill_workers)
+
+    def _windowed_query(self, catalog_entry, start_date_str):
+        '''Queries [start_date, now] in consecutive LastUpdatedTime windows of
+        query_window_days, one after the other.
+
+        The query itself is unsorted, but every window is fully consumed before
+        the next one starts, so the end of the last finished window is a safe
+        bookmark that sync_records can checkpoint while the stream is still
+        running.'''
+        start_date = singer_utils.strptime_with_tz(start_date_str)
+        end_date = singer_utils.now()
+        step = datetime.timedelta(days=self.qb.query_window_days)
+        bounds = [start_date]
+        while bounds[-1] + step < end_date:
+            bounds.append(bounds[-1] + step)
+        bounds.append(end_date)
+        windows = list(zip(bounds[:-1], bounds[1:]))
+
+        LOGGER.info("Querying %s in %s windows of %s days",
+                    catalog_entry['stream'], len(windows), self.qb.query_window_days)
+        return ShardedBackfill(self, catalog_entry, windows, 1)
+
+    def _query_window(self, catalog_entry, start_date, end_date):
+        '''Yields the records with start_date < LastUpdatedTime <= end_date.
+
+        A window that hits QUERY_TIMEOUT is split in half and each half queried
+        in turn, like _query_recur does for open-ended queries.'''
+        query = self.qb._build_query_string(catalog_entry,
+                                            singer_utils.strftime(start_date),
+                                            singer_utils.strftime(end_date))
+        params = {
+            "query": query,
+            "minorversion": "75"
+        }
+        url = f"{self.qb.instance_url}/query"
+        headers = self.qb._get_standard_headers()
+
+        try:
+            yield from self._sync_records(url, headers, params, catalog_entry['stream'])
+        except (HTTPError, RetriableApiError) as ex:
+            middle = self._split_timed_out_window(ex, catalog_entry['stream'], start_date, end_date)
+            yield from self._query_window(catalog_entry, start_date, middle)
+            yield from self._query_window(catalog_entry, middle, end_date)
+
+    @staticmethod
+    def _split_timed_out_window(ex, stream, start_date, end_date):
+        '''Returns the middle of the window a query failed over with ex, to
+        query each half in turn. Errors other than QUERY_TIMEOUT are raised, as
+        is a timeout over a window that cannot be halved any further.'''
+        if not is_query_timeout(ex.response):
+            raise_for_invalid_credentials(ex.response)
+            raise ex
+
+        half_range = (end_date - start_date) / 2
+        if half_range.days == 0:
+            raise TapQuickbooksException(
+                "Attempting to query by 0 day range, this would cause infinite looping.") from ex
+
+        LOGGER.info("Quickbooks returned QUERY_TIMEOUT querying %s from %s to %s, splitting the window",
+                    stream, start_date, end_date)
+        return start_date + half_range
+
     # pylint: disable=too-many-arguments
     def _query_recur(
             self,
@@ -62,10 +502,9 @@ class Rest():
                         retries=retries):
                     yield record
 
-        except HTTPError as ex:
+        except (HTTPError, RetriableApiError) as ex:
             try:
-                response = ex.response.json()
-                if isinstance(response, list) and response[0].get("errorCode") == "QUERY_TIMEOUT":
+                if is_query_timeout(ex.response):
                     start_date = singer_utils.strptime_with_tz(start_date_str)
                     day_range = (end_date - start_date).days
                     LOGGER.info(
@@ -105,52 +544,168 @@ class Rest():
         headers["Accept"] = "application/json"
         headers["Content-Type"] = "application/json"
 
-        excluded_entities = ["Bill", "Payment", "Transfer", "CompanyInfo", "CreditMemo", "Invoice",
-                            "JournalEntry", "Preferences", "Purchase", "SalesReceipt", "TimeActivity", "BillPayment","Estimate"]
-        
         query = params['query']
 
-        def sync_records(query, is_deleted=False):            
-            offset = 0
-            max = 100
-            page = 0
+        def sync_records(query, is_deleted=False):
+            if self.qb.query_prefetch_pages > 1:
+                yield from self._prefetch_records(url, headers, params, query, stream, is_deleted)
+                return
 
-            while True:
-                headers.update(self.qb._get_standard_headers())
-                params['query'] = f"{query}  STARTPOSITION {offset} MAXRESULTS {max}"
-                resp = self.qb._make_request('GET', url, headers=headers, params=params)
-                resp_json = resp.json()
+            cursor = PageCursor(stream, self.qb.verify_pagination)
+            expected_total = self._count_records(url, headers, params, query) if cursor.verify else None
 
-                # Establish number of records returned.
-                count = resp_json['QueryResponse'].get('maxResults', 0)
+            while True:
+                page_size = self.page_sizer.page_size
+                position = cursor.reserve(page_size)
+                records = self._fetch_page(url, headers, params, query, stream, position, page_size)
+                cursor.check(position, page_size, records)
 
                 # Make sure there is at least one record.
-                if count == 0:
+                if not records:
                     if is_deleted:
-                        LOGGER.info(f"Response (deleted) with no data {resp_json}")
+                        LOGGER.info(f"Response (deleted) with no data for {stream} at position {position}")
                     else:
-                        LOGGER.info(f"Response with no data {resp_json}")
-                    break;
-
-                page += 1
-                records = resp_json['QueryResponse'][stream];
+                        LOGGER.info(f"Response with no data for {stream} at position {position}")
+                    break
 
-                for _, rec in enumerate(records):
+                for rec in records:
                     yield rec
-                
-                if count < max:
-                    break;
 
-                offset = (max * page) + 1
-        
+                if len(records) < page_size:
+                    break
+
+            cursor.report(expected_total)
+
+        # fetch all active records, then all deleted records (or both at once)
+        for active_filter in self._active_filters(stream):
+            yield from sync_records(self._with_active_filter(query, active_filter),
+                                    is_deleted=active_filter == INACTIVE_FILTER)
+
+    def _active_filters(self, stream):
+        '''Returns the Active predicates of the passes that read the records of
+        stream, None standing for the unfiltered query.
 
-        # first fetch all active records
-        yield from sync_records(query)
+        With include_deleted the unfiltered (active only) pass is followed by a
+        pass over the inactive records, unless single_pass_deleted asks for
+        both at once.'''
+        if not self.qb.include_deleted or stream in DELETED_EXCLUDED_ENTITIES:
+            return [None]
+        if self.qb.single_pass_deleted:
+            return [ALL_RECORDS_FILTER]
+        return [None, INACTIVE_FILTER]
 
-        # then fetch all deleted records
-        if self.qb.include_deleted and stream not in excluded_entities:
-            if "WHERE" in query:
-                query_deleted = query.replace("WHERE", "where Active = false and")
+    @staticmethod
+    def _with_active_filter(query, active_filter):
+        if active_filter is None:
+            return query
+        if "WHERE" in query:
+            return query.replace("WHERE", f"where {active_filter} and")
+        return f"{query} where {active_filter}"
+
+    def _count_records(self, url, headers, params, query):
+        '''Runs the COUNT(*) form of query and returns the reported totalCount.'''
+        count_query = re.sub(r"^SELECT \* FROM", "SELECT COUNT(*) FROM", query, flags=re.IGNORECASE)
+        headers = {**headers, **self.qb._get_standard_headers()}
+        params = {**params, "query": count_query}
+        resp = self.qb._make_request('GET', url, headers=headers, params=params)
+        return resp.json()['QueryResponse'].get('totalCount', 0)
+
+    def _fetch_page(self, url, headers, params, query, stream, start_position, max_results):
+        '''Fetches the max_results records of query starting at start_position.
+
+        Headers and params are copied so pages can be fetched from several
+        threads at once. In adaptive mode the page is requested once without
+        retries: a timeout, server error or QUERY_TIMEOUT shrinks the page size
+        and the same range is fetched again in smaller pieces, while other
+        errors are retried as usual. Once the page size cannot shrink any
+        further the error is raised, and on a QUERY_TIMEOUT the caller
+        (_query_recur, _query_window or KeysetQuery) splits the date range
+        instead.'''
+        headers = {**headers, **self.qb._get_standard_headers()}
+        params = {**params, "query": f"{query}  STARTPOSITION {start_position} MAXRESULTS {max_results}"}
+
+        request_start = time.monotonic()
+        try:
+            if self.page_sizer.adaptive:
+                resp = self.qb._request_once('GET', url, headers=headers, params=params)
             else:
-                query_deleted = f"{query} where Active = false" 
-            yield from sync_records(query_deleted, is_deleted=True)
+                resp = self.qb._make_request('GET', url, headers=headers, params=params)
+        except (RequestException, RetriableApiError) as ex:
+            if self._is_page_size_error(ex) and self.page_sizer.shrink(max_results):
+                LOGGER.info("Shrinking %s page size to %s after: %s", stream, self.page_sizer.page_size, ex)
+                records = []
+                position = start_position
+                end_position = start_position + max_results
+                while position < end_position:
+                    size = min(self.page_sizer.page_size, end_position - position)
+                    page = self._fetch_page(url, headers, params, query, stream, position, size)
+                    records.extend(page)
+                    if len(page) < size:
+                        break
+                    position += size
+                return records
+            if not self.page_sizer.adaptive or isinstance(ex, HTTPError) or self._is_page_size_error(ex):
+                raise
+            # A smaller page would not help, so retry like any other request.
+            request_start = time.monotonic()
+            resp = self.qb._make_request('GET', url, headers=headers, params=params)
+
+        records = resp.json()['QueryResponse'].get(stream, [])
+        self.page_sizer.record(max_results, len(records), time.monotonic() - request_start)
+        return records
+
+    def _prefetch_records(self, url, headers, params, query, stream, is_deleted=False):
+        '''Pages through query keeping several page requests in flight.
+
+        The total is probed first with a COUNT(*) query so every page position
+        is known up front. Pages are still yielded in offset order. Rows created
+        while paging can push the total past the probed count, so paging
+        continues one page at a time for as long as the last page is full.'''
+        total = self._count_records(url, headers, params, query)
+
+        if total == 0:
+            if is_deleted:
+                LOGGER.info(f"Count query (deleted) returned no data for {stream}")
+            else:
+                LOGGER.info(f"Count query returned no data for {stream}")
+            return
+
+        LOGGER.info("Prefetching %s %s records, %s pages in flight", total, stream, self.qb.query_prefetch_pages)
+
+        cursor = PageCursor(stream, self.qb.verify_pagination)
+
+        # Page sizes are read as pages are submitted so adaptive sizing applies
+        # to the pages still ahead of the window.
+        def pages():
+            while cursor.position <= total:
+                page_size = self.page_sizer.page_size
+                yield cursor.reserve(page_size), page_size
+
+        records, page_size = [], 0
+        for (position, page_size), records in ordered_map(
+                lambda page: (page, self._fetch_page(url, headers, params, query, stream, *page)),
+                pages(),
+                self.qb.query_prefetch_pages):
+            cursor.check(position, page_size, records)
+            yield from records
+
+        while len(records) == page_size:
+            page_size = self.page_sizer.page_size
+            position = cursor.reserve(page_size)
+            records = self._fetch_page(url, headers, params, query, stream, position, page_size)
+            cursor.check(position, page_size, records)
+            yield from records
+
+        cursor.report(total)
+
+    @staticmethod
+    def _is_page_size_error(ex):
+        '''Whether a failed page request is worth retrying with a smaller page:
+        timeouts, server errors and QUERY_TIMEOUT, but not throttling or
+        invalid queries.'''
+        if isinstance(ex, Timeout):
+            return True
+        response = getattr(ex, "response", None)
+        if response is None:
+            return False
+        return response.status_code >= 500 or is_query_timeout(response)
@@ -5,8 +5,9 @@ import attr
 import backoff
 import requests
 import singer
-import time
 
+from tap_quickbooks.quickbooks.rate_limit import retry_after
+from tap_quickbooks.quickbooks.report_reader import StreamedReport, ijson
 from tap_quickbooks.util import save_api_usage
 
 LOGGER = singer.get_logger()
@@ -25,32 +26,61 @@ class RetriableException(Exception):
 class QuickbooksStream:
 
     api_minor_version: ClassVar[int] = 40
+    # Set by streams that adapt their request concurrency; told about 429s
+    # and 504s as they happen, before backoff retries them.
+    concurrency_controller = None
+    # Streams whose responses can be large set this to parse them with
+    # StreamedReport instead of response.json() when ijson is installed.
+    stream_rows: ClassVar[bool] = False
 
     def _get_abs_path(self, path: str) -> str:
         return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
     def _execute_request(self, report_entity: str, params: Optional[Dict] = None) -> Dict:
         '''Performs the raw HTTP GET to the Quickbooks Reports API, raises on error,
-        and returns the parsed JSON. No backoff — callers add their own decorator.'''
+        and returns the parsed JSON, or a StreamedReport for streams with
+        stream_rows set. No backoff — callers add their own decorator.'''
         url = f"{self.qb.instance_url}/reports/{report_entity}"
         headers = self.qb._get_standard_headers()
 
         if params:
             params.update({"minorversion": self.api_minor_version})
 
-        response = requests.get(url, headers=headers, params=params)
+        streamed = self.stream_rows and ijson is not None
+        report = None
+        with self.qb.rate_limiter.request(report=True):
+            response = self.qb.session.get(url, headers=headers, params=params, stream=streamed,
+                                           timeout=self.qb.request_timeout)
+            if streamed:
+                try:
+                    if response.ok:
+                        report = StreamedReport.from_response(response)
+                    else:
+                        # Read the error body so it can still be logged and
+                        # raised once the connection is back in the pool.
+                        response.content
+                except ValueError as ex:
+                    raise RetriableException(f"Invalid json response: {ex}")
+                finally:
+                    response.close()
 
         try:
             save_api_usage("GET", url, params, None, response, self.stream)
         except Exception as e:
             LOGGER.error("Error saving API usage: %s", str(e))
 
+        if response.status_code in (429, 504) and self.concurrency_controller is not None:
+            self.concurrency_controller.record_overload()
+
         if response.status_code == 429:
-            # quickbooks: HTTP Status Code 429 happens when throttling occurs. 
-            # Wait 60 seconds before retrying the request.
-            time.sleep(60)
+            # Quickbooks is throttling the realm: hold back every request,
+            # not just this one, before backoff retries it.
+            self.qb.rate_limiter.throttle(retry_after(response))
         response.raise_for_status()
 
+        if report is not None:
+            return report
+
         # handle random empty responses or not valid json responses
         try:
             res_json = response.json()
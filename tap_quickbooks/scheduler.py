@@ -0,0 +1,100 @@
+import concurrent.futures
+import copy
+import threading
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class StreamWriter():
+    """Writer handed to a single stream while it syncs on a worker thread.
+
+    Messages are forwarded to the shared writer as-is. State written by the
+    stream is its own private copy, so it is merged into the global state by
+    the scheduler before being emitted.
+    """
+
+    def __init__(self, scheduler, tap_stream_id):
+        self.scheduler = scheduler
+        self.tap_stream_id = tap_stream_id
+
+    def write_message(self, message):
+        self.scheduler.writer.write_message(message)
+
+    def write_schema(self, *args, **kwargs):
+        self.scheduler.writer.write_schema(*args, **kwargs)
+
+    def write_state(self, state):
+        self.scheduler.merge_state(self.tap_stream_id, state)
+
+
+class StreamScheduler():
+    """Runs independent streams on a bounded pool of worker threads.
+
+    Each stream syncs against a private copy of its own bookmarks. Whenever a
+    stream writes state, its bookmarks are merged into the global state and
+    the whole state is emitted through the shared writer.
+
+    `current_stream` always points at the first stream, in catalog order, that
+    has not completed yet. Every stream before it is fully synced, so a run
+    resumed from that state (serially or concurrently) never skips work.
+    """
+
+    def __init__(self, writer, state, catalog_entries, max_workers):
+        self.writer = writer
+        self.state = state
+        self.catalog_entries = catalog_entries
+        self.max_workers = max_workers
+        self.pending = [entry['tap_stream_id'] for entry in catalog_entries]
+        self._lock = threading.Lock()
+
+    def _stream_state(self, tap_stream_id):
+        bookmark = self.state.get('bookmarks', {}).get(tap_stream_id)
+        stream_state = {'bookmarks': {}}
+        if bookmark is not None:
+            stream_state['bookmarks'][tap_stream_id] = copy.deepcopy(bookmark)
+        return stream_state
+
+    def merge_state(self, tap_stream_id, stream_state):
+        with self._lock:
+            bookmark = stream_state.get('bookmarks', {}).get(tap_stream_id)
+            bookmarks = self.state.setdefault('bookmarks', {})
+            if bookmark is None:
+                bookmarks.pop(tap_stream_id, None)
+            else:
+                bookmarks[tap_stream_id] = copy.deepcopy(bookmark)
+            self.state['current_stream'] = self.pending[0] if self.pending else None
+            self.writer.write_state(self.state)
+
+    def _complete(self, tap_stream_id, stream_state):
+        with self._lock:
+            self.pending.remove(tap_stream_id)
+        self.merge_state(tap_stream_id, stream_state)
+
+    def _run_stream(self, sync_func, catalog_entry):
+        tap_stream_id = catalog_entry['tap_stream_id']
+        stream_state = self._stream_state(tap_stream_id)
+        sync_func(catalog_entry, stream_state, StreamWriter(self, tap_stream_id))
+        self._complete(tap_stream_id, stream_state)
+
+    def run(self, sync_func):
+        """Calls sync_func(catalog_entry, stream_state, writer) for every stream.
+
+        The first failure cancels streams that have not started yet and is
+        re-raised once the streams already running have finished.
+        """
+        LOGGER.info("Syncing %s streams with %s workers", len(self.catalog_entries), self.max_workers)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [
+                executor.submit(self._run_stream, sync_func, catalog_entry)
+                for catalog_entry in self.catalog_entries
+            ]
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+            for future in futures:
+                if future in done and future.exception() is not None:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise future.exception()
+        finally:
+            executor.shutdown(wait=True)
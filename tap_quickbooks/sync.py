@@ -1,10 +1,11 @@
+import datetime
 import os
 import time
 import singer
 import singer.utils as singer_utils
 from singer import Transformer, metadata, metrics
+from singer.transform import string_to_datetime
 from requests.exceptions import RequestException
-from jsonpath_ng import jsonpath, parse
 import math
 import json
 import requests
@@ -14,6 +15,10 @@ from tap_quickbooks.util import save_api_usage
 
 LOGGER = singer.get_logger()
 
+# Number of records between writes of an incremental stream's running max
+# replication key to state.
+BOOKMARK_FLUSH_INTERVAL = 1000
+
 
 # __null__ = ""
 # pylint: disable=unused-argument
@@ -44,6 +49,246 @@ def transform_data_hook(data, typ, schema):
     return result
 
 
+def compile_transformer(schema):
+    """Compiles a stream schema into a function that transforms one record.
+
+    The result is the same as Transformer(pre_hook=transform_data_hook)
+    .transform(record, schema), but the schema is walked once up front
+    instead of on every record. Records that do not match the schema are
+    handed to the singer Transformer so the error raised is unchanged."""
+    compiled = _compile_schema(schema, {})
+
+    def transform_record(rec):
+        success, result = compiled(rec)
+        if success:
+            return result
+        with Transformer(pre_hook=transform_data_hook) as transformer:
+            return transformer.transform(rec, schema)
+
+    return transform_record
+
+
+def _compile_schema(schema, compiled):
+    # Mirrors Transformer.transform_recur. Quickbooks schemas share sub
+    # schemas (e.g. string_type), so compiled nodes are memoized by identity.
+    key = id(schema)
+    if key in compiled:
+        return compiled[key]
+
+    if "anyOf" in schema:
+        subschemas = [_compile_schema(subschema, compiled) for subschema in schema["anyOf"]]
+
+        def transform_anyof(data):
+            for subschema in subschemas:
+                success, result = subschema(data)
+                if success:
+                    return success, result
+            return False, None
+
+        node = transform_anyof
+    elif "type" not in schema:
+        def transform_untyped(data):
+            return True, data
+
+        node = transform_untyped
+    else:
+        types = schema["type"]
+        if not isinstance(types, list):
+            types = [types]
+        if "null" in types:
+            types = [typ for typ in types if typ != "null"] + ["null"]
+        attempts = [_compile_type(schema, typ, compiled) for typ in types]
+
+        if len(attempts) == 1:
+            node = attempts[0]
+        else:
+            def transform_types(data):
+                for attempt in attempts:
+                    success, result = attempt(data)
+                    if success:
+                        return success, result
+                return False, None
+
+            node = transform_types
+
+    compiled[key] = node
+    return node
+
+
+def _compile_type(schema, typ, compiled):
+    # Mirrors transform_data_hook followed by Transformer._transform for a
+    # single type of a schema.
+    integer_typed = 'integer' in schema.get('type', [])
+    nullable = "null" in schema['type']
+
+    def pre_hook(data):
+        if isinstance(data, dict):
+            return json.dumps(data)
+        if data == '0.0' and integer_typed:
+            return '0'
+        if data == "" and nullable:
+            return None
+        return data
+
+    if typ == "null":
+        def transform_null(data):
+            data = pre_hook(data)
+            if data is None or data == "":
+                return True, None
+            return False, None
+
+        return transform_null
+
+    if schema.get("format") == "date-time":
+        def transform_datetime(data):
+            data = pre_hook(data)
+            if data is None or data == "":
+                return False, None
+            data = string_to_datetime(data)
+            if data is None:
+                return False, None
+            return True, data
+
+        return transform_datetime
+
+    if typ == "object":
+        if schema.get("patternProperties"):
+            # Not produced by discovery; leave these to the singer Transformer.
+            def transform_pattern_object(data):
+                with Transformer(pre_hook=transform_data_hook) as transformer:
+                    return transformer.transform_recur(data, schema, [])
+
+            return transform_pattern_object
+
+        properties = [
+            (name, _compile_schema(subschema, compiled))
+            for name, subschema in schema.get("properties", {}).items()
+        ]
+
+        def transform_object(data):
+            if not isinstance(data, dict):
+                return False, None
+            result = {}
+            success = True
+            for name, transform_property in properties:
+                property_success, result[name] = transform_property(data.get(name))
+                success = success and property_success
+            return success, result
+
+        return transform_object
+
+    if typ == "array":
+        items = _compile_schema(schema["items"], compiled) if "items" in schema else None
+
+        def transform_array(data):
+            data = pre_hook(data)
+            if items is None:
+                raise KeyError("items")
+            if not isinstance(data, list):
+                return False, None
+            result = []
+            success = True
+            for row in data:
+                row_success, row_result = items(row)
+                success = success and row_success
+                result.append(row_result)
+            return success, result
+
+        return transform_array
+
+    if typ == "string":
+        def transform_string(data):
+            data = pre_hook(data)
+            if data is None:
+                return False, None
+            try:
+                return True, str(data)
+            except Exception:
+                return False, None
+
+        return transform_string
+
+    if typ in ("integer", "number"):
+        cast = int if typ == "integer" else float
+
+        def transform_numeric(data):
+            data = pre_hook(data)
+            if isinstance(data, str):
+                data = data.replace(",", "")
+            try:
+                return True, cast(data)
+            except Exception:
+                return False, None
+
+        return transform_numeric
+
+    if typ == "boolean":
+        def transform_boolean(data):
+            data = pre_hook(data)
+            if isinstance(data, str) and data.lower() == "false":
+                return True, False
+            try:
+                return True, bool(data)
+            except Exception:
+                return False, None
+
+        return transform_boolean
+
+    def transform_unknown(data):
+        return False, None
+
+    return transform_unknown
+
+
+def replication_key_getter(replication_key):
+    """Compiles a dotted replication key such as MetaData.LastUpdatedTime into
+    a function that reads it from a raw record, or returns None."""
+    path = replication_key.split(".")
+
+    def get_replication_key(rec):
+        value = rec
+        for key in path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    return get_replication_key
+
+
+def parse_replication_key_value(value):
+    """Parses a replication key value into an aware datetime.
+
+    Quickbooks timestamps are plain ISO 8601, which datetime parses natively;
+    anything else goes through the slower singer parser."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return singer_utils.strptime_with_tz(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+class ThroughputCounter(metrics.Counter):
+    """A record counter whose log lines also carry the rate, in records per
+    second, since the previous log line."""
+
+    def _pop(self):
+        elapsed = time.time() - self.last_log_time
+        tags = dict(self.tags)
+        tags["records_per_second"] = round(self.value / elapsed, 1) if elapsed > 0 else None
+        metrics.log(self.logger, metrics.Point('counter', self.metric, self.value, tags))
+        self.value = 0
+        self.last_log_time = time.time()
+
+
+def record_counter(endpoint):
+    return ThroughputCounter(metrics.Metric.record_count, {metrics.Tag.endpoint: endpoint})
+
+
 def get_stream_version(catalog_entry, state):
     tap_stream_id = catalog_entry['tap_stream_id']
     catalog_metadata = metadata.to_map(catalog_entry['metadata'])
@@ -59,14 +304,14 @@ def get_stream_version(catalog_entry, state):
     return int(time.time() * 1000)
 
 
-def sync_stream(qb, catalog_entry, state, state_passed):
+def sync_stream(qb, catalog_entry, state, state_passed, writer):
     stream = catalog_entry['stream']
     counter_value = 0
 
-    with metrics.record_counter(stream) as counter:
+    with record_counter(stream) as counter:
         try:
-            sync_records(qb, catalog_entry, state, counter, state_passed)
-            singer.write_state(state)
+            sync_records(qb, catalog_entry, state, counter, state_passed, writer)
+            writer.write_state(state)
         except RequestException as ex:
             response_message = ex.response.text if (ex.response is not None and hasattr(ex.response, "text")) else ""
             status_code = ex.response.status_code if ex.response is not None else ""
@@ -86,7 +331,7 @@ def sync_stream(qb, catalog_entry, state, state_passed):
     return counter_value
 
 
-def sync_records(qb, catalog_entry, state, counter, state_passed):
+def sync_records(qb, catalog_entry, state, counter, state_passed, writer):
     chunked_bookmark = singer_utils.strptime_with_tz(qb.get_start_date(state, catalog_entry))
     stream = catalog_entry['stream']
     schema = catalog_entry['schema']
@@ -94,6 +339,11 @@ def sync_records(qb, catalog_entry, state, counter, state_passed):
     catalog_metadata = metadata.to_map(catalog_entry['metadata'])
     replication_key = catalog_metadata.get((), {}).get('replication-key')
     stream_version = get_stream_version(catalog_entry, state)
+    # A resumed report sync continues the version of the interrupted one, so
+    # activating it keeps the records that run already wrote.
+    resumed_checkpoint = singer.get_bookmark(state, catalog_entry['tap_stream_id'], 'checkpoint')
+    if not replication_key and resumed_checkpoint:
+        stream_version = resumed_checkpoint.get('version', stream_version)
     activate_version_message = singer.ActivateVersionMessage(stream=(stream_alias or stream),
                                                              version=stream_version)
 
@@ -101,13 +351,43 @@ def sync_records(qb, catalog_entry, state, counter, state_passed):
 
     LOGGER.info('Syncing Quickbooks data for stream %s', stream)
 
-    previous_max_replication_key = None;
+    # The bookmark is kept as a running max and only written to state every
+    # BOOKMARK_FLUSH_INTERVAL records and once the stream is done.
+    get_replication_key = replication_key_getter(replication_key) if replication_key else None
+    max_replication_key_value = None
+    bookmark = None
+    records_since_flush = 0
+
+    transform_record = compile_transformer(schema)
 
     query_func = qb.query
     if stream.endswith("Report"):
         query_func = qb.query_report
 
-    for rec in query_func(catalog_entry, state, state_passed):
+    records = query_func(catalog_entry, state, state_passed)
+    # Some queries (e.g. sharded backfills) yield records out of order and
+    # track the safe bookmark themselves.
+    manages_bookmark = getattr(records, "manages_bookmark", False)
+    watermark = None
+    # Their watermark is safe to resume from, so it is also emitted as STATE
+    # while the stream runs, every state_checkpoint_records records or
+    # state_checkpoint_seconds seconds once it has advanced.
+    emitted_watermark = None
+    records_since_state = 0
+    last_state_time = time.monotonic()
+    # Report streams expose the last date range whose records have all been
+    # yielded; state is emitted whenever it advances so that an interrupted
+    # run can resume after it.
+    checkpointed = hasattr(records, "checkpoint")
+    checkpoint = None
+
+    for rec in records:
+        if checkpointed and records.checkpoint != checkpoint:
+            checkpoint = records.checkpoint
+            state = singer.write_bookmark(
+                state, catalog_entry['tap_stream_id'], 'checkpoint', {**checkpoint, 'version': stream_version})
+            writer.write_state(state)
+
         #Check if it is Attachable stream with a downloadable file
         if stream == 'Attachable' and "TempDownloadUri" in rec:
             file_name = rec["FileName"]
@@ -121,11 +401,14 @@ def sync_records(qb, catalog_entry, state, counter, state_passed):
             download_file(
                 rec["TempDownloadUri"], os.path.join(qb.hg_sync_output or "", file_name)
             )
+        if get_replication_key:
+            # Read before transforming, which serializes MetaData to a string.
+            original_replication_key_value = get_replication_key(rec)
+
         counter.increment()
-        with Transformer(pre_hook=transform_data_hook) as transformer:
-            rec = transformer.transform(rec, schema)
+        rec = transform_record(rec)
 
-        singer.write_message(
+        writer.write_message(
             singer.RecordMessage(
                 stream=(
                         stream_alias or stream),
@@ -133,34 +416,53 @@ def sync_records(qb, catalog_entry, state, counter, state_passed):
                 version=stream_version,
                 time_extracted=start_time))
 
-        if replication_key:
-            jsonpath_expression = parse(f"$.{replication_key}")
-            _rec = {'MetaData': json.loads(rec.get('MetaData', "{}"))}
-            match = jsonpath_expression.find(_rec)
-            original_replication_key_value = ""
-            if replication_key and len(match) > 0:
-                original_replication_key_value = match[0].value
-                replication_key_value = singer_utils.strptime_with_tz(original_replication_key_value)
-            else:
-                replication_key_value = None
-
-            # Before writing a bookmark, make sure Quickbooks has not given us a
+        if replication_key and manages_bookmark:
+            if records.watermark != watermark:
+                watermark = records.watermark
+                state = singer.write_bookmark(
+                    state, catalog_entry['tap_stream_id'], replication_key, watermark)
+
+            records_since_state += 1
+            if watermark != emitted_watermark and (
+                    records_since_state >= qb.state_checkpoint_records
+                    or time.monotonic() - last_state_time >= qb.state_checkpoint_seconds):
+                writer.write_state(state)
+                emitted_watermark = watermark
+                records_since_state = 0
+                last_state_time = time.monotonic()
+        elif replication_key:
+            replication_key_value = parse_replication_key_value(original_replication_key_value)
+
+            # Before moving the bookmark, make sure Quickbooks has not given us a
             # record with one outside our range
-            if previous_max_replication_key is None or (
-                    replication_key_value and replication_key_value <= start_time and replication_key_value > previous_max_replication_key
+            if max_replication_key_value is None or (
+                    replication_key_value and replication_key_value <= start_time and replication_key_value > max_replication_key_value
             ):
+                bookmark = original_replication_key_value or ""
+                max_replication_key_value = replication_key_value
+
+            records_since_flush += 1
+            if records_since_flush >= BOOKMARK_FLUSH_INTERVAL:
                 state = singer.write_bookmark(
-                    state,
-                    catalog_entry['tap_stream_id'],
-                    replication_key,
-                    original_replication_key_value)
-                previous_max_replication_key = replication_key_value
+                    state, catalog_entry['tap_stream_id'], replication_key, bookmark)
+                records_since_flush = 0
 
             # Tables with no replication_key will send an
             # activate_version message for the next sync
 
+    if replication_key and not manages_bookmark and records_since_flush:
+        state = singer.write_bookmark(
+            state, catalog_entry['tap_stream_id'], replication_key, bookmark)
+
+    if replication_key and manages_bookmark and records.watermark != watermark:
+        state = singer.write_bookmark(
+            state, catalog_entry['tap_stream_id'], replication_key, records.watermark)
+
+    if checkpointed:
+        state = singer.clear_bookmark(state, catalog_entry['tap_stream_id'], 'checkpoint')
+
     if not replication_key:
-        singer.write_message(activate_version_message)
+        writer.write_message(activate_version_message)
         state = singer.write_bookmark(
             state, catalog_entry['tap_stream_id'], 'version', None)
 
@@ -0,0 +1,84 @@
+import sys
+import threading
+
+import singer
+from singer.messages import format_message
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Characters of encoded messages collected before they are written to stdout.
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+def encode_message(message):
+    """Encodes a Singer message as one line of JSON.
+
+    orjson is used when it is installed. Messages it cannot encode (e.g.
+    Decimal values) fall back to singer's encoder."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(message.asdict()).decode("utf-8") + "\n"
+        except TypeError:
+            pass
+    return format_message(message) + "\n"
+
+
+class MessageWriter():
+    """Writes Singer messages to stdout.
+
+    Every write goes through a single lock so that streams synced on worker
+    threads never interleave partial lines on stdout, and so that each
+    stream's messages keep the order in which that stream produced them.
+
+    Encoded messages are collected into chunks of about buffer_size bytes
+    before being written. STATE messages flush the buffer so that state is
+    never emitted ahead of the records it covers being on stdout. A
+    buffer_size of 0 writes every message as soon as it is produced.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, output=None):
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._buffered_size = 0
+        self.buffer_size = buffer_size
+        self._output = output
+
+    def write_message(self, message):
+        line = encode_message(message)
+        with self._lock:
+            self._buffer.append(line)
+            self._buffered_size += len(line)
+            if isinstance(message, singer.StateMessage) or self._buffered_size >= self.buffer_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        output = self._output or sys.stdout
+        output.write("".join(self._buffer))
+        output.flush()
+        self._buffer = []
+        self._buffered_size = 0
+
+    def write_schema(self, stream_name, schema, key_properties, bookmark_properties=None, stream_alias=None):
+        if isinstance(key_properties, (str, bytes)):
+            key_properties = [key_properties]
+        if not isinstance(key_properties, list):
+            raise Exception("key_properties must be a string or list of strings")
+
+        self.write_message(
+            singer.SchemaMessage(
+                stream=(stream_alias or stream_name),
+                schema=schema,
+                key_properties=key_properties,
+                bookmark_properties=bookmark_properties))
+
+    def write_state(self, state):
+        self.write_message(singer.StateMessage(value=state))
@@ -7,6 +7,7 @@ from unittest.mock import MagicMock
 
 import pytest
 
+from tap_quickbooks.quickbooks.report_planner import DensityProfile
 from tap_quickbooks.quickbooks.reportstreams.GeneralLedgerAccrualReport import (
     GeneralLedgerAccrualReport,
 )
@@ -66,6 +67,8 @@ def mock_qb():
     qb.gl_full_sync = False
     qb.gl_daily = False
     qb.gl_weekly = False
+    qb.report_concurrency = 10
+    qb.density_profile = DensityProfile()
     return qb
 
 
@@ -0,0 +1,121 @@
+"""Unit tests for reading lookup streams through the batch endpoint."""
+
+import functools
+import json
+import re
+from unittest.mock import MagicMock
+
+import requests
+
+from tap_quickbooks.quickbooks import Quickbooks
+from tap_quickbooks.quickbooks.batch import BATCH_QUERY_MAX_RESULTS, MAX_BATCH_ITEMS, QueryBatch
+from tap_quickbooks.quickbooks.rest import Rest
+
+
+def _catalog_entry(stream, replication_key="MetaData.LastUpdatedTime"):
+    return {
+        "stream": stream,
+        "tap_stream_id": stream,
+        "metadata": [{"breadcrumb": [], "metadata": {"replication-key": replication_key}}],
+    }
+
+
+class FakeBatchApi:
+    """Answers batch requests with a fixed number of records per entity.
+    Inactive records queries return a single record."""
+
+    def __init__(self, sizes, failing=()):
+        self.sizes = sizes
+        self.failing = failing
+        self.bodies = []
+
+    def __call__(self, method, url, headers=None, body=None, **kwargs):
+        body = json.loads(body)
+        self.bodies.append(body)
+        items = []
+        for request in body["BatchItemRequest"]:
+            stream = re.match(r"SELECT \* FROM (\w+)", request["Query"]).group(1)
+            if stream in self.failing:
+                items.append({"bId": request["bId"], "Fault": {"Error": [{"Message": "failed"}]}})
+                continue
+            deleted = "Active = false" in request["Query"]
+            count = 1 if deleted else self.sizes.get(stream, 0)
+            records = [{"Id": "{}-{}-{}".format(stream, "deleted" if deleted else "active", i)} for i in range(count)]
+            items.append({"bId": request["bId"], "QueryResponse": {stream: records} if records else {}})
+        response = MagicMock()
+        response.json.return_value = {"BatchItemResponse": items}
+        return response
+
+
+def _batch(api, streams, include_deleted=False):
+    qb = MagicMock()
+    qb.include_deleted = include_deleted
+    qb.single_pass_deleted = False
+    qb.instance_url = "https://qbo/v3/company/1"
+    qb._get_standard_headers.return_value = {"Authorization": "Bearer token"}
+    qb._make_request.side_effect = api
+    qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+    qb._build_query_string = functools.partial(Quickbooks._build_query_string, qb)
+    return QueryBatch(qb, [_catalog_entry(stream) for stream in streams], {})
+
+
+class TestQueryBatch:
+    def test_one_request_serves_every_lookup_stream(self):
+        api = FakeBatchApi({"Term": 2, "Class": 1, "TaxRate": 3})
+        batch = _batch(api, ["Term", "Class", "TaxRate", "Invoice"])
+
+        assert len(batch.records(_catalog_entry("Term"))) == 2
+        assert len(batch.records(_catalog_entry("TaxRate"))) == 3
+        assert batch.records(_catalog_entry("Class")) == [{"Id": "Class-active-0"}]
+        assert batch.records(_catalog_entry("Invoice")) is None
+        assert len(api.bodies) == 1
+        assert all("STARTPOSITION 1 MAXRESULTS" in item["Query"] for item in api.bodies[0]["BatchItemRequest"])
+
+    def test_inactive_records_are_batched_with_include_deleted(self):
+        batch = _batch(FakeBatchApi({"Term": 1}), ["Term"], include_deleted=True)
+
+        assert batch.records(_catalog_entry("Term")) == [{"Id": "Term-active-0"}, {"Id": "Term-deleted-0"}]
+
+    def test_requests_hold_at_most_the_batch_limit(self):
+        api = FakeBatchApi({})
+        batch = _batch(api, ["Term"])
+        batch._queries = {"Term{}".format(i): ["SELECT * FROM Term"] for i in range(MAX_BATCH_ITEMS + 5)}
+
+        batch.records(_catalog_entry("Term0"))
+
+        assert [len(body["BatchItemRequest"]) for body in api.bodies] == [MAX_BATCH_ITEMS, 5]
+
+    def test_full_or_failed_queries_fall_back_to_paging(self):
+        api = FakeBatchApi({"Term": BATCH_QUERY_MAX_RESULTS, "Class": 1}, failing=("Department",))
+        batch = _batch(api, ["Term", "Class", "Department"])
+
+        assert batch.records(_catalog_entry("Term")) is None
+        assert batch.records(_catalog_entry("Department")) is None
+        assert batch.records(_catalog_entry("Class")) == [{"Id": "Class-active-0"}]
+
+    def test_streams_of_a_failed_batch_request_fall_back_to_paging(self):
+        api = FakeBatchApi({"Term": 1})
+        batch = _batch(api, ["Term", "Class"])
+        batch._queries = {"Class{}".format(i): ["SELECT * FROM Class"] for i in range(MAX_BATCH_ITEMS)}
+        batch._queries["Term"] = ["SELECT * FROM Term"]
+
+        failed = []
+
+        def fail_first_request(*args, **kwargs):
+            if not failed:
+                failed.append(kwargs["body"])
+                raise requests.exceptions.HTTPError("503 Server Error")
+            return api(*args, **kwargs)
+
+        batch.qb._make_request.side_effect = fail_first_request
+
+        assert batch.records(_catalog_entry("Class0")) is None
+        assert batch.records(_catalog_entry("Term")) == [{"Id": "Term-active-0"}]
+
+    def test_rest_query_reads_batched_streams(self):
+        qb = MagicMock()
+        records = [{"Id": "1"}]
+        qb.query_batch.records.return_value = records
+
+        assert Rest(qb).query(_catalog_entry("TaxRate", replication_key=None), {}) is records
+        qb._make_request.assert_not_called()
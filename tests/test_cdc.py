@@ -0,0 +1,117 @@
+"""Unit tests for serving entity streams from change data capture."""
+
+import datetime
+from unittest.mock import MagicMock
+
+import singer.utils as singer_utils
+
+from tap_quickbooks.quickbooks.cdc import CDC_MAX_RESULTS, ChangeFeed
+from tap_quickbooks.quickbooks.rest import Rest
+
+REPLICATION_KEY = "MetaData.LastUpdatedTime"
+
+
+def _days_ago(days):
+    return singer_utils.strftime(singer_utils.now() - datetime.timedelta(days=days))
+
+
+def _catalog_entry(stream, replication_key=REPLICATION_KEY):
+    return {
+        "stream": stream,
+        "tap_stream_id": stream,
+        "metadata": [{"breadcrumb": [], "metadata": {"replication-key": replication_key}}],
+    }
+
+
+def _record(record_id, days_ago, **fields):
+    return {"Id": record_id, "MetaData": {"LastUpdatedTime": _days_ago(days_ago)}, **fields}
+
+
+class FakeCdcApi:
+    """Answers CDC requests with the changes of the requested entities."""
+
+    def __init__(self, changes):
+        self.changes = changes
+        self.requests = []
+
+    def __call__(self, method, url, headers=None, params=None, **kwargs):
+        entities = params["entities"].split(",")
+        self.requests.append(entities)
+        response = MagicMock()
+        response.json.return_value = {"CDCResponse": [{"QueryResponse": [
+            {entity: self.changes[entity]} for entity in entities if self.changes.get(entity)]}]}
+        return response
+
+
+def _feed(api, starts, include_deleted=False):
+    qb = MagicMock()
+    qb.include_deleted = include_deleted
+    qb.instance_url = "https://qbo/v3/company/1"
+    qb._get_standard_headers.return_value = {"Authorization": "Bearer token"}
+    qb._make_request.side_effect = api
+    qb.get_start_date.side_effect = lambda state, catalog_entry: starts[catalog_entry["stream"]]
+    return ChangeFeed(qb, [_catalog_entry(stream) for stream in starts], {})
+
+
+class TestChangeFeed:
+    def test_one_request_serves_every_stream_from_its_own_start(self):
+        api = FakeCdcApi({
+            "Invoice": [_record("1", 5), _record("2", 1)],
+            "Customer": [_record("3", 5)],
+        })
+        feed = _feed(api, {"Invoice": _days_ago(2), "Customer": _days_ago(10)})
+
+        invoices = feed.records(_catalog_entry("Invoice"))
+        customers = feed.records(_catalog_entry("Customer"))
+
+        assert [rec["Id"] for rec in invoices] == ["2"]
+        assert [rec["Id"] for rec in customers] == ["3"]
+        assert api.requests == [["Customer", "Invoice"]]
+
+    def test_truncated_responses_are_split_until_single_entities_fall_back(self):
+        api = FakeCdcApi({
+            "Invoice": [_record(str(i), 1) for i in range(CDC_MAX_RESULTS)],
+            "Customer": [_record("c", 1)],
+            "Vendor": [_record("v", 1)],
+        })
+        feed = _feed(api, {stream: _days_ago(3) for stream in ["Invoice", "Customer", "Vendor"]})
+
+        assert feed.records(_catalog_entry("Invoice")) is None
+        assert [rec["Id"] for rec in feed.records(_catalog_entry("Customer"))] == ["c"]
+        assert [rec["Id"] for rec in feed.records(_catalog_entry("Vendor"))] == ["v"]
+        assert api.requests[0] == ["Customer", "Invoice", "Vendor"]
+        assert ["Invoice"] in api.requests
+
+    def test_streams_outside_the_capture_window_are_not_covered(self):
+        feed = _feed(FakeCdcApi({}), {"Invoice": _days_ago(45), "Customer": _days_ago(3), "TaxRate": _days_ago(3)})
+
+        assert not feed.covers("Invoice")
+        assert not feed.covers("TaxRate")
+        assert feed.covers("Customer")
+
+    def test_deleted_and_inactive_records_need_include_deleted(self):
+        changes = {"Customer": [_record("1", 1), _record("2", 1, Active=False), _record("3", 1, status="Deleted")]}
+
+        kept = _feed(FakeCdcApi(changes), {"Customer": _days_ago(3)}).records(_catalog_entry("Customer"))
+        with_deleted = _feed(FakeCdcApi(changes), {"Customer": _days_ago(3)}, include_deleted=True) \
+            .records(_catalog_entry("Customer"))
+
+        assert [rec["Id"] for rec in kept] == ["1"]
+        assert [(rec["Id"], rec.get("Active")) for rec in with_deleted] == [("1", None), ("2", False), ("3", False)]
+
+    def test_deleted_records_of_entities_without_active_are_dropped(self):
+        changes = {"Invoice": [_record("1", 1), _record("2", 1, status="Deleted")]}
+
+        invoices = _feed(FakeCdcApi(changes), {"Invoice": _days_ago(3)}, include_deleted=True) \
+            .records(_catalog_entry("Invoice"))
+
+        assert [rec["Id"] for rec in invoices] == ["1"]
+
+    def test_rest_query_reads_covered_streams_from_the_feed(self):
+        qb = MagicMock()
+        qb.query_batch = None
+        changes = [_record("1", 1)]
+        qb.change_feed.records.return_value = changes
+
+        assert Rest(qb).query(_catalog_entry("Invoice"), {}) is changes
+        qb._make_request.assert_not_called()
@@ -0,0 +1,111 @@
+"""Unit tests for stitching column-batched report rows."""
+
+import random
+import time
+
+from tap_quickbooks.quickbooks.column_stitcher import ColumnStitcher
+
+IDENTITY = ["Date", "Amount"]
+
+
+def _cell(value):
+    return {"value": value}
+
+
+def _reference_stitch(batches):
+    """The dict based stitching GeneralLedgerReport used before ColumnStitcher."""
+    rows_by_key = {}
+    key_order = []
+    all_columns = []
+    for batch_idx, (metadata, output) in enumerate(batches):
+        if batch_idx == 0:
+            all_columns = metadata.copy()
+        else:
+            all_columns += [col for col in metadata if col not in all_columns]
+        identity_indices = [metadata.index(c) if c in metadata else None for c in IDENTITY]
+        for raw_row in output:
+            row_key = tuple(
+                (raw_row[idx].get("value", "") if isinstance(raw_row[idx], dict) else raw_row[idx] or "")
+                if idx is not None and idx < len(raw_row) - 1 else ""
+                for idx in identity_indices)
+            data = {col: raw_row[i] for i, col in enumerate(metadata) if i < len(raw_row) - 1}
+            categories = set(raw_row[-1]) if raw_row[-1] else set()
+            if batch_idx == 0:
+                if row_key not in rows_by_key:
+                    rows_by_key[row_key] = []
+                    key_order.append(row_key)
+                rows_by_key[row_key].append({"data": data, "categories": categories, "batches": [0]})
+            elif row_key in rows_by_key:
+                for entry in rows_by_key[row_key]:
+                    if batch_idx not in entry["batches"]:
+                        entry["data"].update(data)
+                        entry["categories"].update(categories)
+                        entry["batches"].append(batch_idx)
+                        break
+    stitched = []
+    for row_key in key_order:
+        for entry in rows_by_key[row_key]:
+            stitched.append([entry["data"].get(col) for col in all_columns] + [sorted(entry["categories"])])
+    return all_columns, stitched
+
+
+def _random_batches(rng, rows):
+    keys = [(_cell("2024-01-0{}".format(rng.randint(1, 3))), _cell(str(rng.randint(1, 4)))) for _ in range(rows)]
+    batches = []
+    for batch_idx, extra in enumerate([["Memo", "Name"], ["Class"], ["Memo", "Dept"]]):
+        metadata = IDENTITY + extra
+        order = list(range(rows))
+        if batch_idx:
+            rng.shuffle(order)
+            order = order[:rng.randint(0, rows)]
+        output = []
+        for i in order:
+            values = [_cell("{}-{}-{}".format(col, i, batch_idx)) for col in extra]
+            output.append(list(keys[i]) + values + [rng.choice([[], ["Income"], ["Income", "Sales"]])])
+        batches.append((metadata, output))
+    return batches
+
+
+class TestColumnStitcher:
+    def test_matches_the_reference_stitching(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            batches = _random_batches(rng, rng.randint(0, 25))
+            stitcher = ColumnStitcher(IDENTITY)
+            for batch_idx, (metadata, output) in enumerate(batches):
+                stitcher.add_batch(metadata, output, primary=batch_idx == 0)
+
+            rows = [row[:-1] + [sorted(row[-1])] for row in stitcher.rows()]
+
+            assert (stitcher.columns, rows) == _reference_stitch(batches)
+
+    def test_duplicate_keys_pair_up_in_order(self):
+        stitcher = ColumnStitcher(IDENTITY)
+        stitcher.add_batch(["Date", "Amount", "Memo"], [["d", "1", "first", []], ["d", "1", "second", []]],
+                           primary=True)
+        stitcher.add_batch(["Date", "Amount", "Name"], [["d", "1", "A", ["X"]], ["d", "1", "B", []],
+                                                        ["d", "1", "unmatched", []]])
+
+        assert list(stitcher.rows()) == [["d", "1", "first", "A", ["X"]], ["d", "1", "second", "B", []]]
+
+    def test_rows_can_be_read_more_than_once(self):
+        stitcher = ColumnStitcher(IDENTITY)
+        stitcher.add_batch(["Date", "Amount"], [["d", "1", ["Income"]]], primary=True)
+        stitcher.add_batch(["Date", "Amount", "Name"], [["d", "1", "A", []]])
+
+        assert list(stitcher.rows()) == list(stitcher.rows()) == [["d", "1", "A", ["Income"]]]
+
+    def test_stitches_many_duplicate_rows_in_linear_time(self):
+        rows = 200000
+        primary = [["d", "1", "memo-{}".format(i), []] for i in range(rows)]
+        names = [["d", "1", "name-{}".format(i), []] for i in range(rows)]
+        stitcher = ColumnStitcher(IDENTITY)
+
+        started = time.monotonic()
+        stitcher.add_batch(["Date", "Amount", "Memo"], primary, primary=True)
+        stitcher.add_batch(["Date", "Amount", "Name"], names)
+        stitched = list(stitcher.rows())
+
+        # A quadratic match over one duplicated key would take hours.
+        assert time.monotonic() - started < 10
+        assert stitched[-1] == ["d", "1", "memo-{}".format(rows - 1), "name-{}".format(rows - 1), []]
@@ -0,0 +1,108 @@
+"""Unit tests for the concurrency helpers."""
+
+import threading
+import time
+
+from tap_quickbooks.quickbooks.concurrency import AIMDController, adaptive_ordered_map
+
+
+class TestAIMDController:
+    def test_successes_add_one_slot_per_window(self):
+        controller = AIMDController(4, maximum=8)
+        for _ in range(5):
+            controller.record_success(latency=1)
+
+        assert controller.limit == 5
+
+    def test_limit_never_exceeds_maximum(self):
+        controller = AIMDController(2, maximum=2)
+        for _ in range(10):
+            controller.record_success()
+
+        assert controller.limit == 2
+
+    def test_overload_halves_limit_once_per_epoch(self):
+        controller = AIMDController(8)
+        epochs = [controller.begin() for _ in range(3)]
+        for epoch in epochs:
+            controller.record_overload(epoch)
+
+        assert controller.limit == 4
+
+    def test_slow_response_counts_as_overload(self):
+        controller = AIMDController(8, latency_target=10)
+        controller.record_success(latency=30, epoch=controller.begin())
+
+        assert controller.limit == 4
+
+    def test_limit_never_drops_below_minimum(self):
+        controller = AIMDController(2)
+        for _ in range(5):
+            controller.record_overload()
+
+        assert controller.limit == 1
+
+    def test_overload_defaults_to_epoch_of_calling_thread(self):
+        controller = AIMDController(8)
+        controller.begin()
+        controller.record_overload()
+        controller.record_overload()
+
+        assert controller.limit == 4
+
+
+class TestAdaptiveOrderedMap:
+    def test_results_are_yielded_in_item_order(self):
+        def work(i):
+            time.sleep(0.001 * (10 - i))
+            return i
+
+        assert list(adaptive_ordered_map(work, range(10), AIMDController(4))) == list(range(10))
+
+    def test_slow_item_does_not_stop_later_items_from_starting(self):
+        release = threading.Event()
+        started = []
+
+        def work(i):
+            started.append(i)
+            if i == 0:
+                release.wait(timeout=5)
+            return i
+
+        results = adaptive_ordered_map(work, range(6), AIMDController(2))
+        first = []
+
+        def consume():
+            first.append(next(results))
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        deadline = time.time() + 5
+        while len(started) < 6 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        consumer.join()
+        results.close()
+
+        # Items 1-5 ran on the second worker while item 0 was still running.
+        assert sorted(started) == list(range(6))
+        assert first == [0]
+
+    def test_concurrency_follows_controller_limit(self):
+        controller = AIMDController(3)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(i):
+            with lock:
+                running.append(i)
+                peak.append(len(running))
+            time.sleep(0.005)
+            with lock:
+                running.remove(i)
+            return i
+
+        list(adaptive_ordered_map(work, range(12), controller))
+
+        assert max(peak) <= 3
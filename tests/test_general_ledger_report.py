@@ -0,0 +1,161 @@
+"""Unit tests for GeneralLedgerReport period fetching."""
+
+import datetime
+import threading
+
+import pytest
+
+from tests.fixtures.streams.report import minimal_gl_report_response
+from tap_quickbooks.quickbooks.report_planner import DensityProfile
+from tap_quickbooks.quickbooks.reportstreams.GeneralLedgerAccrualReport import (
+    GeneralLedgerAccrualReport,
+)
+
+TOO_MUCH_DATA = "Too much data for current period"
+
+
+def _months_ago(months):
+    today = datetime.date.today().replace(day=1)
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    return datetime.datetime(year, month + 1, 1)
+
+
+class FakeReportApi:
+    """Answers concurrent_get with one row per period, dated at its start."""
+
+    def __init__(self, too_large=()):
+        self.too_large = set(too_large)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, report_entity, params):
+        with self._lock:
+            self.calls.append((params["start_date"], params["end_date"]))
+        if (params["start_date"], params["end_date"]) in self.too_large:
+            return {"error": TOO_MUCH_DATA, "start_date": params["start_date"], "end_date": params["end_date"]}
+        return minimal_gl_report_response(params["start_date"])
+
+
+@pytest.fixture
+def gl_report(mock_qb):
+    def _build(start_date):
+        return GeneralLedgerAccrualReport(qb=mock_qb, start_date=start_date, report_periods=None, state_passed=False)
+    return _build
+
+
+class TestGeneralLedgerFullSync:
+    def test_periods_are_yielded_in_date_order(self, gl_report, catalog_entry, monkeypatch):
+        report = gl_report(_months_ago(12))
+        api = FakeReportApi()
+        monkeypatch.setattr(report, "concurrent_get", api)
+
+        dates = [row["Date"] for row in report.sync(catalog_entry)]
+
+        assert len(api.calls) == 13
+        assert dates == sorted(dates)
+        assert dates[0] == _months_ago(12).strftime("%Y-%m-%d")
+
+    def test_only_the_dense_period_is_split(self, gl_report, catalog_entry, monkeypatch):
+        start = _months_ago(3)
+        month_end = _months_ago(2) - datetime.timedelta(days=1)
+        report = gl_report(start)
+        api = FakeReportApi(too_large={(start.strftime("%Y-%m-%d"), month_end.strftime("%Y-%m-%d"))})
+        monkeypatch.setattr(report, "concurrent_get", api)
+
+        dates = [row["Date"] for row in report.sync(catalog_entry)]
+
+        # The dense month is fetched once whole and then as two halves; every
+        # other month is fetched exactly once.
+        assert len(api.calls) == 4 + 2
+        halves = [call for call in api.calls if call[0] >= start.strftime("%Y-%m-%d")
+                  and call[1] <= month_end.strftime("%Y-%m-%d")
+                  and call != (start.strftime("%Y-%m-%d"), month_end.strftime("%Y-%m-%d"))]
+        assert len(halves) == 2
+        assert dates == sorted(dates)
+        assert dates[0] == start.strftime("%Y-%m-%d")
+
+    def test_learned_density_avoids_refetching_the_dense_period(self, gl_report, catalog_entry, monkeypatch,
+                                                                 mock_qb, tmp_path):
+        start = _months_ago(3)
+        month_end = _months_ago(2) - datetime.timedelta(days=1)
+        dense = (start.strftime("%Y-%m-%d"), month_end.strftime("%Y-%m-%d"))
+        path = str(tmp_path / "density.json")
+
+        calls = []
+        for _ in range(2):
+            mock_qb.density_profile = DensityProfile(path)
+            report = gl_report(start)
+            api = FakeReportApi(too_large={dense})
+            monkeypatch.setattr(report, "concurrent_get", api)
+            list(report.sync(catalog_entry))
+            calls.append(api.calls)
+
+        assert dense in calls[0]
+        # The second run splits the dense month up front and never fails.
+        assert dense not in calls[1]
+        assert len(calls[1]) == 4 + 1
+
+    def test_dense_single_days_are_fetched_in_column_batches(self, gl_report, catalog_entry, monkeypatch):
+        today = datetime.date.today()
+        yesterday = today - datetime.timedelta(days=1)
+        report = gl_report(datetime.datetime.combine(yesterday, datetime.time.min))
+        days = [(day.strftime("%Y-%m-%d"), day.strftime("%Y-%m-%d")) for day in (yesterday, today)]
+        api = FakeReportApi(too_large={(yesterday.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")), *days})
+
+        # Column batches lead with the identity columns; answer them normally.
+        def get(report_entity, params):
+            if params["columns"].startswith("tx_date,txn_type,"):
+                return minimal_gl_report_response(params["start_date"])
+            return api(report_entity, params)
+        monkeypatch.setattr(report, "concurrent_get", get)
+
+        dates = [row["Date"] for row in report.sync(catalog_entry)]
+
+        assert dates == [day for day, _ in days]
+
+
+class TestGeneralLedgerCheckpoints:
+    def test_interrupted_full_sync_resumes_after_the_last_completed_period(self, mock_qb, catalog_entry,
+                                                                          monkeypatch):
+        start = _months_ago(3)
+        failing_month = _months_ago(1).strftime("%Y-%m-%d")
+        mock_qb.report_concurrency = 1
+        report = GeneralLedgerAccrualReport(qb=mock_qb, start_date=start, report_periods=None, state_passed=False)
+        api = FakeReportApi()
+
+        def get(report_entity, params):
+            if params["start_date"] == failing_month:
+                raise RuntimeError("interrupted")
+            return api(report_entity, params)
+        monkeypatch.setattr(report, "concurrent_get", get)
+
+        with pytest.raises(RuntimeError):
+            list(report.sync(catalog_entry))
+
+        completed = (_months_ago(1) - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        assert report.checkpoint == {"start_date": start.strftime("%Y-%m-%d"), "end_date": completed,
+                                     "granularity": "month"}
+
+        # State has been passed by now, but the unfinished backfill continues.
+        resumed = GeneralLedgerAccrualReport(qb=mock_qb, start_date=start, report_periods=None,
+                                             state_passed=True, checkpoint=report.checkpoint)
+        api = FakeReportApi()
+        monkeypatch.setattr(resumed, "concurrent_get", api)
+
+        dates = [row["Date"] for row in resumed.sync(catalog_entry)]
+
+        assert api.calls[0][0] == failing_month
+        assert dates[0] == failing_month
+        assert resumed.checkpoint["end_date"] == datetime.date.today().strftime("%Y-%m-%d")
+
+    def test_checkpoint_from_another_start_date_is_ignored(self, mock_qb, catalog_entry, monkeypatch):
+        start = _months_ago(2)
+        checkpoint = {"start_date": "2001-01-01", "end_date": "2001-12-31", "granularity": "month"}
+        report = GeneralLedgerAccrualReport(qb=mock_qb, start_date=start, report_periods=None,
+                                            state_passed=True, checkpoint=checkpoint)
+        api = FakeReportApi()
+        monkeypatch.setattr(report, "concurrent_get", api)
+
+        list(report.sync(catalog_entry))
+
+        assert min(call[0] for call in api.calls) == start.strftime("%Y-%m-%d")
@@ -1,11 +1,13 @@
 """Unit tests for shared monthly report parsing and stream wiring."""
 
 import datetime
+import threading
 from unittest.mock import MagicMock, patch
 
 import pytest
 import requests
 
+from tap_quickbooks.quickbooks.report_planner import DateRange
 from tap_quickbooks.quickbooks.reportstreams.BaseReport import BaseReportStream
 from tap_quickbooks.quickbooks.reportstreams.MonthlyBalanceSheetReport import (
     MonthlyBalanceSheetReport,
@@ -63,7 +65,63 @@ class TestGetMonthlyColumnMetadata:
         assert cols == ["Account", "Memo", "Jan2024", "Total", "Categories"]
 
 
-class TestRecursiveRowSearch:
+def _section(name, rows, account_id=None):
+    header = {"value": name}
+    if account_id:
+        header["id"] = account_id
+    return {"type": "Section", "Header": {"ColData": [header]}, "Rows": {"Row": rows}}
+
+
+def _data(value, amount):
+    return {"ColData": [{"value": value, "id": value.lower()}, {"value": amount}]}
+
+
+class TestFlattenRows:
+    rows = [
+        _section("Income", [
+            _section("Sales", [_data("Invoice", "10"), _data("Receipt", "5")], account_id="1"),
+            _data("Other", "1"),
+        ]),
+        _section("Expenses", [_section("Rent", [_data("Bill", "7")], account_id="2")]),
+        {"Rows": {}},
+        _data("Total", "3"),
+    ]
+
+    def test_yields_cell_values_with_category_path(self, base_report):
+        assert list(base_report._flatten_rows(self.rows)) == [
+            ["Invoice", "10", ["Income", "Sales"]],
+            ["Receipt", "5", ["Income", "Sales"]],
+            ["Other", "1", ["Income"]],
+            ["Bill", "7", ["Expenses", "Rent"]],
+            ["Total", "3", []],
+        ]
+
+    def test_rows_of_a_section_share_their_category_path(self, base_report):
+        invoice, receipt = list(base_report._flatten_rows(self.rows))[:2]
+
+        assert invoice[-1] is receipt[-1]
+
+    def test_keeps_cells_and_tracks_account_when_configured(self, base_report, monkeypatch):
+        monkeypatch.setattr(base_report, "row_cell_values", False)
+        monkeypatch.setattr(base_report, "track_current_account", True)
+
+        rows = list(base_report._flatten_rows(self.rows))
+
+        assert rows[0] == [{"value": "Invoice", "id": "invoice"}, {"value": "10"}, ["Income", "Sales"],
+                           {"value": "Sales", "id": "1"}]
+        # The account carries over to rows after its section, as before.
+        assert rows[2][-1] == {"value": "Sales", "id": "1"}
+        assert rows[3][-1] == {"value": "Rent", "id": "2"}
+
+    def test_deep_nesting_does_not_recurse(self, base_report):
+        row = _data("Leaf", "1")
+        for depth in range(5000):
+            row = _section(str(depth), [row])
+
+        (flattened,) = base_report._flatten_rows([row])
+
+        assert len(flattened[-1]) == 5000
+
     def test_flattens_nested_rows_with_category_path(self, base_report):
         row = {
             "Header": {"ColData": [{"value": "Assets"}]},
@@ -86,16 +144,45 @@ class TestRecursiveRowSearch:
             },
         }
         categories = []
-        output = []
-        base_report._recursive_row_search(row, output, categories)
+        output = list(base_report._flatten_rows([row], categories))
         assert output == [["Checking", "100.00", ["Assets", "Bank Accounts"]]]
         assert categories == []
 
     @pytest.mark.parametrize("row", [{"Rows": {}}, {"Rows": None}])
     def test_empty_group_rows_are_no_op(self, base_report, row):
-        output = []
-        base_report._recursive_row_search(row, output, [])
-        assert output == []
+        assert list(base_report._flatten_rows([row], [])) == []
+
+
+class TestGetPeriods:
+    def test_recent_periods_are_calendar_months_newest_first(self, base_report, monkeypatch):
+        monkeypatch.setattr("tap_quickbooks.quickbooks.reportstreams.BaseReport.datetime.date", FixedDate)
+        base_report.number_of_periods = 3
+
+        assert [(p.start, p.end) for p in base_report._recent_periods()] == [
+            (FixedDate(2030, 4, 1), FixedDate(2030, 4, 29)),
+            (FixedDate(2030, 3, 1), FixedDate(2030, 3, 31)),
+            (FixedDate(2030, 2, 1), FixedDate(2030, 2, 28)),
+        ]
+
+    def test_fetches_concurrently_and_yields_in_period_order(self, base_report):
+        periods = [
+            DateRange(datetime.date(2024, 3, 1), datetime.date(2024, 3, 31)),
+            DateRange(datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)),
+            DateRange(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)),
+        ]
+        started = threading.Barrier(3, timeout=5)
+
+        def get(report_entity, params):
+            # Every call waits for the others, so a serial fetch would time out.
+            started.wait()
+            return {"start_date": params["start_date"], "accounting_method": params["accounting_method"]}
+        base_report._get = get
+
+        results = list(base_report._get_periods("ProfitAndLoss", periods, {"accounting_method": "Accrual"}))
+
+        assert [period for period, _ in results] == periods
+        assert [resp["start_date"] for _, resp in results] == ["2024-03-01", "2024-02-01", "2024-01-01"]
+        assert all(resp["accounting_method"] == "Accrual" for _, resp in results)
 
 
 class TestMergeRowIntoDict:
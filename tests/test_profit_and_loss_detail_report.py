@@ -0,0 +1,98 @@
+"""Unit tests for ProfitAndLossDetailReport full sync."""
+
+import datetime
+import threading
+import time
+
+import pytest
+
+from tap_quickbooks.quickbooks.report_planner import TOO_MUCH_DATA
+from tap_quickbooks.quickbooks.reportstreams.ProfitAndLossDetailReport import ProfitAndLossDetailReport
+
+
+def _response(date):
+    return {
+        "Columns": {"Column": [{"ColTitle": "Date"}, {"ColTitle": "Amount"}]},
+        "Rows": {"Row": [{"ColData": [{"value": date}, {"value": "10"}]}]},
+    }
+
+
+class FakeReportApi:
+    """Rejects any request covering dense_day unless it asks for few columns."""
+
+    def __init__(self, dense_day, max_columns):
+        self.dense_day = dense_day
+        self.max_columns = max_columns
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, report_entity, params):
+        with self._lock:
+            self.calls.append(params)
+        covers_dense_day = params["start_date"] <= self.dense_day <= params["end_date"]
+        if covers_dense_day and len(params["columns"].split(",")) > self.max_columns:
+            return {"error": TOO_MUCH_DATA, "start_date": params["start_date"], "end_date": params["end_date"]}
+        return _response(params["start_date"])
+
+
+@pytest.fixture
+def pld_report(mock_qb):
+    start = datetime.datetime.combine(datetime.date.today().replace(day=1), datetime.time.min) \
+        - datetime.timedelta(days=60)
+    return ProfitAndLossDetailReport(qb=mock_qb, start_date=start, report_periods=None, state_passed=False)
+
+
+class TestProfitAndLossDetailFullSync:
+    def test_dense_day_is_refetched_with_basic_columns_only(self, pld_report, catalog_entry, monkeypatch):
+        dense_day = (pld_report.start_date + datetime.timedelta(days=10)).strftime("%Y-%m-%d")
+        api = FakeReportApi(dense_day, max_columns=14)
+        monkeypatch.setattr(pld_report, "concurrent_get", api)
+
+        rows = list(pld_report.sync(catalog_entry))
+
+        basic_calls = [c for c in api.calls if len(c["columns"].split(",")) == 14]
+        assert [(c["start_date"], c["end_date"]) for c in basic_calls] == [(dense_day, dense_day)]
+        dates = [row["Date"] for row in rows]
+        assert dates == sorted(dates)
+        assert dates[0].strftime("%Y-%m-%d") == pld_report.start_date.strftime("%Y-%m-%d")
+
+    def test_dense_day_that_never_fits_fails_the_sync(self, pld_report, catalog_entry, monkeypatch):
+        dense_day = (pld_report.start_date + datetime.timedelta(days=10)).strftime("%Y-%m-%d")
+        monkeypatch.setattr(pld_report, "concurrent_get", FakeReportApi(dense_day, max_columns=1))
+
+        with pytest.raises(Exception, match=TOO_MUCH_DATA):
+            list(pld_report.sync(catalog_entry))
+
+    def test_periods_are_fetched_concurrently_and_emitted_in_order(self, mock_qb, catalog_entry, monkeypatch):
+        start = datetime.datetime.combine(datetime.date.today().replace(day=1), datetime.time.min) \
+            - datetime.timedelta(days=365)
+        report = ProfitAndLossDetailReport(qb=mock_qb, start_date=start, report_periods=None, state_passed=False)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def get(report_entity, params):
+            with lock:
+                in_flight.append(params["start_date"])
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(params["start_date"])
+            # Each period sits under its own account section.
+            return {
+                "Columns": {"Column": [{"ColTitle": "Date"}, {"ColTitle": "Amount"}]},
+                "Rows": {"Row": [{
+                    "type": "Section",
+                    "Header": {"ColData": [{"value": "Account", "id": params["start_date"]}]},
+                    "Rows": {"Row": [{"ColData": [{"value": params["start_date"]}, {"value": "10"}]}]},
+                }]},
+            }
+        monkeypatch.setattr(report, "concurrent_get", get)
+
+        rows = list(report.sync(catalog_entry))
+
+        assert max(peak) > 1
+        dates = [row["Date"].strftime("%Y-%m-%d") for row in rows]
+        assert dates == sorted(dates)
+        assert len(dates) >= 12
+        assert all(row["AccountId"] == row["Date"].strftime("%Y-%m-%d") for row in rows)
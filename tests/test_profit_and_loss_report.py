@@ -0,0 +1,80 @@
+"""Unit tests for ProfitAndLossReport syncs."""
+
+import datetime
+import json
+
+from tap_quickbooks import build_state, do_sync
+from tap_quickbooks.quickbooks import Quickbooks
+from tap_quickbooks.quickbooks.reportstreams.ProfitAndLossReport import ProfitAndLossReport
+
+
+def _response(start_date):
+    return {
+        "Columns": {"Column": [{"ColTitle": ""}, {"ColTitle": "Total"}]},
+        "Rows": {"Row": [
+            {"ColData": [{"value": "Sales", "id": "1"}, {"value": "10.00"}]},
+            {"ColData": [{"value": "Fees {}".format(start_date), "id": "2"}, {"value": "5.00"}]},
+        ]},
+    }
+
+
+class TestProfitAndLossRecentPeriods:
+    def test_state_passed_sync_reads_each_recent_period(self, mock_qb, catalog_entry):
+        start = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+        report = ProfitAndLossReport(qb=mock_qb, start_date=start, report_periods=3, state_passed=True)
+        calls = []
+
+        def get(report_entity, params):
+            calls.append((report_entity, params["start_date"], params["accounting_method"]))
+            return _response(params["start_date"])
+        report._get = get
+
+        rows = list(report.sync(catalog_entry))
+
+        periods = list(report._recent_periods())
+        assert [(entity, start_date) for entity, start_date, _ in calls] == \
+            [("ProfitAndLoss", period.start.strftime("%Y-%m-%d")) for period in periods]
+        assert all(method == "Accrual" for _, _, method in calls)
+        assert len(rows) == 2 * len(periods)
+        assert rows[1]["Account"] == "Fees {}".format(periods[0].start.strftime("%Y-%m-%d"))
+        assert rows[1]["Id"] == "2"
+
+
+class TestProfitAndLossResume:
+    def test_interrupted_full_sync_resumes_from_state_through_do_sync(self, capsys, monkeypatch):
+        start = datetime.date.today() - datetime.timedelta(days=100)
+        checkpoint_end = start + datetime.timedelta(days=30)
+        raw_state = {"bookmarks": {"ProfitAndLossReport": {"checkpoint": {
+            "start_date": start.strftime("%Y-%m-%d"),
+            "end_date": checkpoint_end.strftime("%Y-%m-%d"),
+            "granularity": "31 days",
+            "version": 42,
+        }}}}
+        catalog = {"streams": [{
+            "stream": "ProfitAndLossReport",
+            "tap_stream_id": "ProfitAndLossReport",
+            "schema": {"type": "object", "properties": {
+                "Account": {"type": ["string", "null"]},
+                "Total": {"type": ["string", "null"]},
+            }},
+            "metadata": [{"breadcrumb": [], "metadata": {
+                "selected": True,
+                "table-key-properties": [],
+                "forced-replication-method": {"replication-method": "FULL_TABLE"},
+            }}],
+        }]}
+        qb = Quickbooks(realm_id="1", api_type="REST", report_concurrency=1,
+                        default_start_date=start.strftime("%Y-%m-%dT00:00:00Z"))
+        fetched = []
+
+        def get(self, report_entity, params):
+            fetched.append(params["start_date"])
+            return _response(params["start_date"])
+        monkeypatch.setattr(ProfitAndLossReport, "_get", get)
+
+        do_sync(qb, catalog, build_state(raw_state, catalog), state_passed=True)
+
+        messages = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert fetched[0] == (checkpoint_end + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        assert {m["version"] for m in messages if m["type"] in ("RECORD", "ACTIVATE_VERSION")} == {42}
+        assert "checkpoint" not in messages[-1]["value"]["bookmarks"]["ProfitAndLossReport"]
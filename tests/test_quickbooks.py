@@ -0,0 +1,75 @@
+"""Unit tests for the Quickbooks client's HTTP session and configuration."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tap_quickbooks.quickbooks import Quickbooks
+from tap_quickbooks.quickbooks.exceptions import TapQuickbooksException
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}/v3/company/1/reports/GeneralLedger".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def _quickbooks(**options):
+    return Quickbooks(realm_id="1", default_start_date="2020-01-01T00:00:00Z", **options)
+
+
+class TestSession:
+    def test_pool_holds_a_connection_per_concurrent_request(self):
+        qb = _quickbooks(report_concurrency=4, max_concurrent_streams=2)
+
+        assert qb.session.adapters["https://"]._pool_maxsize == 8
+
+    def test_reuse_stats_count_keep_alive_requests(self, server_url):
+        qb = _quickbooks()
+        for _ in range(3):
+            qb.session.get(server_url)
+
+        assert qb.connection_reuse_stats() == {"requests": 3, "connections": 1, "reused": 2}
+
+    def test_requests_are_sent_with_a_timeout(self, monkeypatch):
+        qb = _quickbooks(request_timeout=30)
+        timeouts = []
+        monkeypatch.setattr(qb.session, "get", lambda url, **kwargs: timeouts.append(kwargs["timeout"]))
+        monkeypatch.setattr(qb.session, "post", lambda url, **kwargs: timeouts.append(kwargs["timeout"]))
+
+        qb._send_request("GET", "https://qbo/query", {}, None, False, {})
+        qb._send_request("POST", "https://qbo/batch", {}, "{}", False, None)
+
+        assert timeouts == [30, 30]
+
+
+class TestStateCheckpoints:
+    @pytest.mark.parametrize("options", [{"query_window_days": 30}, {"keyset_pagination": True},
+                                         {"backfill_windows": 4}])
+    def test_apply_to_queries_with_a_safe_bookmark(self, options):
+        qb = _quickbooks(state_checkpoint_records=500, **options)
+
+        assert qb.state_checkpoint_records == 500
+
+    def test_are_rejected_for_the_default_query(self):
+        with pytest.raises(TapQuickbooksException, match="state_checkpoint_records"):
+            _quickbooks(state_checkpoint_seconds=30)
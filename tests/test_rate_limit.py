@@ -0,0 +1,166 @@
+"""Unit tests for the shared request rate limiter."""
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from tap_quickbooks.quickbooks import Quickbooks
+from tap_quickbooks.quickbooks.rate_limit import DEFAULT_THROTTLE_SECONDS, RateLimiter, retry_after
+
+
+class FakeClock:
+    """A clock that only moves when the limiter sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _limiter(clock, **options):
+    return RateLimiter(clock=clock, sleep=clock.sleep, **options)
+
+
+class TestRateLimiter:
+    def test_burst_is_sent_without_waiting(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_minute=60, burst=5)
+
+        for _ in range(5):
+            with limiter.request():
+                pass
+
+        assert clock.sleeps == []
+
+    def test_requests_past_the_burst_are_paced_to_the_per_minute_budget(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_minute=120, burst=2)
+
+        for _ in range(6):
+            with limiter.request():
+                pass
+
+        # Two free requests, then one every half second.
+        assert clock.sleeps == [0.5, 0.5, 0.5, 0.5]
+        assert clock.now == 2.0
+
+    def test_idle_time_refills_the_bucket(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_minute=60, burst=2)
+        for _ in range(2):
+            with limiter.request():
+                pass
+
+        clock.now += 10
+        for _ in range(2):
+            with limiter.request():
+                pass
+
+        assert clock.sleeps == []
+
+    def test_report_requests_are_limited_to_their_concurrency_budget(self):
+        limiter = RateLimiter(requests_per_minute=10000, max_concurrent_reports=2, burst=100)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def report_request():
+            with limiter.request(report=True):
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.01)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=report_request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max(peak) == 2
+
+    def test_entity_requests_do_not_hold_report_slots(self):
+        limiter = RateLimiter(max_concurrent_reports=1)
+
+        with limiter.request(report=True):
+            with limiter.request():
+                pass
+
+    def test_throttle_holds_back_every_following_request(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_minute=120, burst=5)
+
+        limiter.throttle(30)
+        for _ in range(2):
+            with limiter.request():
+                pass
+
+        # The first request waits out the pause, the next one its own token.
+        assert clock.sleeps == [30.5, 0.5]
+        assert limiter.throttled == 1
+
+    def test_throttle_without_retry_after_uses_the_default_pause(self):
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_minute=60, burst=5)
+
+        limiter.throttle(retry_after(requests.Response()))
+        with limiter.request():
+            pass
+
+        assert clock.sleeps == [DEFAULT_THROTTLE_SECONDS + 1]
+
+    @pytest.mark.parametrize("header,seconds", [("12", 12.0), ("0.5", 0.5), ("-3", 0.0),
+                                                ("Wed, 21 Oct 2026 07:28:00 GMT", None)])
+    def test_retry_after_reads_seconds(self, header, seconds):
+        response = requests.Response()
+        response.headers["Retry-After"] = header
+
+        assert retry_after(response) == seconds
+
+
+class TestThrottledReports:
+    def test_429_throttles_the_shared_limiter_instead_of_sleeping(self, report, monkeypatch):
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = "7"
+        response._content = b"{}"
+        report.qb.session.get.return_value = response
+        report.qb.rate_limiter = MagicMock()
+        monkeypatch.setattr(time, "sleep", lambda seconds: pytest.fail("slept for {}".format(seconds)))
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            report._execute_request("GeneralLedger", {"start_date": "2024-01-01"})
+
+        report.qb.rate_limiter.throttle.assert_called_once_with(7.0)
+
+
+class TestThrottledQueries:
+    def test_429_throttles_and_retries_the_request(self, monkeypatch):
+        qb = Quickbooks(realm_id="1", default_start_date="2024-01-01T00:00:00Z")
+        qb.rate_limiter = MagicMock()
+        throttled = requests.Response()
+        throttled.status_code = 429
+        throttled.headers["Retry-After"] = "7"
+        throttled._content = b"{}"
+        ok = requests.Response()
+        ok.status_code = 200
+        ok._content = b'{"QueryResponse": {}}'
+        responses = [throttled, ok]
+        monkeypatch.setattr(qb, "_send_request", lambda *args: responses.pop(0))
+        monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+        resp = qb._make_request("GET", f"{qb.instance_url}/query", params={})
+
+        assert resp is ok
+        qb.rate_limiter.throttle.assert_called_once_with(7.0)
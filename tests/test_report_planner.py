@@ -0,0 +1,141 @@
+"""Unit tests for the report date range planner."""
+
+import datetime
+import threading
+
+import pytest
+
+from tap_quickbooks.quickbooks.concurrency import AIMDController
+from tap_quickbooks.quickbooks.report_planner import TOO_MUCH_DATA, DateRange, DensityProfile, RangePlanner
+
+
+def _day(offset):
+    return datetime.date(2024, 1, 1) + datetime.timedelta(days=offset)
+
+
+def _ranges(count, days):
+    return [DateRange(_day(i * days), _day(i * days + days - 1)) for i in range(count)]
+
+
+class FakeFetch:
+    """Returns too-much-data for ranges longer than max_days."""
+
+    def __init__(self, max_days=None, dense=()):
+        self.max_days = max_days
+        self.dense = set(dense)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, date_range):
+        with self._lock:
+            self.calls.append(date_range)
+        too_large = any(date_range.start <= day <= date_range.end for day in self.dense) \
+            and date_range.days > (self.max_days or 0)
+        if too_large:
+            return {"error": TOO_MUCH_DATA}
+        return {"range": date_range}
+
+
+class TestDateRange:
+    def test_halves_are_adjacent_and_cover_the_range(self):
+        first, second = DateRange(_day(0), _day(30)).halves()
+
+        assert first.start == _day(0)
+        assert second.end == _day(30)
+        assert first.end + datetime.timedelta(days=1) == second.start
+
+    def test_single_day_cannot_be_split(self):
+        assert DateRange(_day(0), _day(0)).halves() is None
+
+
+class TestRangePlanner:
+    def test_yields_every_range_in_order(self):
+        fetch = FakeFetch()
+        planner = RangePlanner(fetch, AIMDController(4))
+
+        result = [r for r, _ in planner.run(_ranges(10, 7))]
+
+        assert result == _ranges(10, 7)
+
+    def test_dense_range_is_halved_until_it_fits_and_neighbours_are_kept(self):
+        fetch = FakeFetch(max_days=4, dense=[_day(40)])
+        planner = RangePlanner(fetch, AIMDController(4))
+
+        result = [r for r, response in planner.run(_ranges(4, 30))]
+
+        # Neighbouring months are fetched once each.
+        assert [r for r in fetch.calls if r.days == 30].count(_ranges(4, 30)[0]) == 1
+        assert result[0] == _ranges(4, 30)[0]
+        assert result[-1] == _ranges(4, 30)[-1]
+        # The dense month is covered without gaps by pieces that fit.
+        dense_month = [r for r in result if _ranges(4, 30)[1].start <= r.start <= _ranges(4, 30)[1].end]
+        assert dense_month[0].start == _ranges(4, 30)[1].start
+        assert dense_month[-1].end == _ranges(4, 30)[1].end
+        for previous, following in zip(result, result[1:]):
+            assert previous.end + datetime.timedelta(days=1) == following.start
+        assert planner.splits >= 3
+
+    def test_single_dense_day_is_yielded_with_its_error(self):
+        fetch = FakeFetch(max_days=0, dense=[_day(3)])
+        planner = RangePlanner(fetch, AIMDController(2))
+
+        result = dict(planner.run(_ranges(1, 7)))
+
+        assert result[DateRange(_day(3), _day(3))] == {"error": TOO_MUCH_DATA}
+
+    def test_fetch_errors_are_raised_in_order(self):
+        def fetch(date_range):
+            if date_range == _ranges(3, 7)[1]:
+                raise ValueError("boom")
+            return {}
+
+        results = RangePlanner(fetch, AIMDController(3)).run(_ranges(3, 7))
+
+        assert next(results)[0] == _ranges(3, 7)[0]
+        with pytest.raises(ValueError):
+            next(results)
+
+
+class TestDensityProfile:
+    def test_unknown_ranges_are_not_split(self):
+        profile = DensityProfile()
+
+        assert list(profile.plan("GL", _ranges(3, 30))) == _ranges(3, 30)
+
+    def test_dense_range_is_pre_split_below_the_learned_cap(self, tmp_path):
+        path = str(tmp_path / "density.json")
+        profile = DensityProfile(path)
+        dense = DateRange(_day(0), _day(29))
+        profile.record_too_large("GL", dense)
+        profile.record("GL", DateRange(_day(0), _day(14)), 900)
+        profile.record("GL", DateRange(_day(15), _day(29)), 900)
+        profile.record("GL", DateRange(_day(30), _day(59)), 100)
+        profile.save()
+
+        planned = list(DensityProfile(path).plan("GL", [dense, DateRange(_day(30), _day(59))]))
+
+        # 1800 rows failed, so pieces aim for at most 1620 rows each.
+        assert planned == [DateRange(_day(0), _day(26)), DateRange(_day(27), _day(29)),
+                           DateRange(_day(30), _day(59))]
+        assert DensityProfile(path).estimate("GL", DateRange(_day(0), _day(29))) == pytest.approx(1800)
+
+    def test_ranges_into_unseen_months_are_not_estimated(self):
+        profile = DensityProfile()
+        profile.record("GL", DateRange(_day(0), _day(30)), 10)
+
+        assert profile.estimate("GL", DateRange(_day(0), _day(30))) == pytest.approx(10)
+        assert profile.estimate("GL", DateRange(_day(25), _day(35))) is None
+
+    def test_unreadable_profile_is_ignored(self, tmp_path):
+        path = tmp_path / "density.json"
+        path.write_text("{not json")
+
+        assert DensityProfile(str(path)).estimate("GL", DateRange(_day(0), _day(0))) is None
+
+    def test_planner_reports_split_ranges(self):
+        split = []
+        fetch = FakeFetch(max_days=15, dense=[_day(3)])
+
+        list(RangePlanner(fetch, AIMDController(2), on_split=split.append).run(_ranges(1, 30)))
+
+        assert split == [DateRange(_day(0), _day(29))]
@@ -0,0 +1,123 @@
+"""Unit tests for incrementally parsed report responses."""
+
+import io
+import json
+
+import pytest
+import requests
+
+pytest.importorskip("ijson")
+
+from tests.fixtures.streams.report import load_fixture, minimal_gl_report_response  # noqa: E402
+from tap_quickbooks.quickbooks.report_reader import StreamedReport  # noqa: E402
+from tap_quickbooks.quickbooks.rest_reports import RetriableException  # noqa: E402
+
+
+def _streamed(document):
+    body = json.dumps(document).encode("utf-8") if not isinstance(document, bytes) else document
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = io.BytesIO(body)
+    return StreamedReport.from_response(response)
+
+
+class TestStreamedReport:
+    @pytest.mark.parametrize("name", ["gl_report_response.json", "gl_report_empty_rows.json",
+                                      "gl_report_no_amount.json"])
+    def test_answers_like_the_parsed_document(self, name):
+        document = load_fixture(name)
+        report = _streamed(document)
+
+        assert report.get("Header") == document.get("Header")
+        assert report.get("Columns") == document.get("Columns")
+        row_group = report.get("Rows")
+        if document["Rows"].get("Row") is None:
+            assert row_group.get("Row") is None
+        else:
+            assert list(row_group.get("Row")) == document["Rows"]["Row"]
+            # Rows can be iterated again.
+            assert list(row_group.get("Row")) == document["Rows"]["Row"]
+
+    def test_empty_rows_object(self):
+        report = _streamed({"Header": {}, "Columns": {"Column": []}, "Rows": {}})
+
+        assert report.get("Rows") == {}
+
+    def test_contains_searches_the_raw_body(self):
+        report = _streamed({"Rows": {"Row": [{"ColData": [
+            {"value": "Unable to display more data. Please reduce the date range."}]}]}})
+
+        assert report.contains("Unable to display more data")
+        assert not report.contains("Something else")
+
+    @pytest.mark.parametrize("body", [b"null", b"{\"Header\": {", b"[1, 2]"])
+    def test_invalid_documents_raise_value_error(self, body):
+        with pytest.raises(ValueError):
+            _streamed(body)
+
+
+class TestStreamedRequests:
+    def _stream(self, report, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(body)
+        report.qb.session.get.return_value = response
+        report.qb.instance_url = "https://quickbooks.api.intuit.com/v3/company/1"
+
+    def test_general_ledger_rows_match_the_dict_path(self, report, catalog_entry, monkeypatch):
+        document = minimal_gl_report_response(report.start_date.strftime("%Y-%m-%d"))
+        self._stream(report, json.dumps(document).encode("utf-8"))
+
+        rows = list(report.sync(catalog_entry))
+
+        monkeypatch.setattr(report, "concurrent_get", lambda report_entity, params: document)
+        expected = list(report.sync(catalog_entry))
+        for row in rows + expected:
+            row.pop("SyncTimestampUtc")
+        assert rows == expected
+        assert report.qb.session.get.call_args.kwargs["stream"] is True
+
+    def test_invalid_json_is_retriable(self, report):
+        self._stream(report, b"{\"Rows\": ")
+
+        with pytest.raises(RetriableException):
+            report._execute_request("GeneralLedger", {"start_date": "2024-01-01"})
+
+    def test_streamed_reports_are_closed_once_their_rows_are_read(self, report, catalog_entry, monkeypatch):
+        document = minimal_gl_report_response(report.start_date.strftime("%Y-%m-%d"))
+        body = json.dumps(document).encode("utf-8")
+        responses = []
+
+        def get(url, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            response.raw = io.BytesIO(body)
+            responses.append(response)
+            return response
+        report.qb.session.get.side_effect = get
+        report.qb.instance_url = "https://quickbooks.api.intuit.com/v3/company/1"
+        closed = []
+        close = StreamedReport.close
+        monkeypatch.setattr(StreamedReport, "close", lambda self: closed.append(self) or close(self))
+
+        list(report.sync(catalog_entry))
+
+        assert responses
+        assert len(closed) == len(responses)
+        assert all(streamed._body.closed for streamed in closed)
+
+    def test_failed_streamed_responses_are_closed(self, report):
+        response = requests.Response()
+        response.status_code = 503
+        response.raw = io.BytesIO(b"Service Unavailable")
+        closed = []
+        close = response.close
+        response.close = lambda: closed.append(True) or close()
+        report.qb.session.get.return_value = response
+        report.qb.instance_url = "https://quickbooks.api.intuit.com/v3/company/1"
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            report._execute_request("GeneralLedger", {"start_date": "2024-01-01"})
+
+        assert closed
+        assert response.text == "Service Unavailable"
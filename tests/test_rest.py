@@ -0,0 +1,610 @@
+"""Unit tests for entity query paging in Rest."""
+
+import datetime
+import functools
+import random
+import re
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+import singer.utils as singer_utils
+
+from tap_quickbooks.quickbooks import Quickbooks
+from tap_quickbooks.quickbooks.exceptions import RetriableApiError
+from tap_quickbooks.quickbooks.rest import MAX_PAGE_SIZE, MIN_PAGE_SIZE, KeysetQuery, PageCursor, PageSizer, Rest
+
+
+class FakeQuickbooksApi:
+    """Serves QBO query responses for a fixed list of records.
+
+    STARTPOSITION is treated as 1-based, like the real query endpoint.
+    """
+
+    def __init__(self, stream, total):
+        self.stream = stream
+        self.records = [{"Id": str(i)} for i in range(1, total + 1)]
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, headers=None, params=None, **kwargs):
+        query = params["query"]
+        with self._lock:
+            self.queries.append(query)
+
+        response = MagicMock()
+        if query.upper().startswith("SELECT COUNT(*)"):
+            response.json.return_value = {"QueryResponse": {"totalCount": len(self.records)}}
+            return response
+
+        match = re.search(r"STARTPOSITION (\d+) MAXRESULTS (\d+)", query)
+        start, max_results = int(match.group(1)), int(match.group(2))
+        page = self.records[max(start, 1) - 1:max(start, 1) - 1 + max_results]
+        query_response = {"maxResults": len(page)} if page else {}
+        if page:
+            query_response[self.stream] = page
+        response.json.return_value = {"QueryResponse": query_response}
+        return response
+
+
+def _rest(api, **options):
+    qb = MagicMock()
+    qb.include_deleted = False
+    qb.single_pass_deleted = False
+    qb.query_prefetch_pages = 0
+    qb.query_page_size = None
+    qb.adaptive_page_size = False
+    qb.verify_pagination = False
+    qb.backfill_windows = 1
+    qb.query_window_days = None
+    qb.keyset_pagination = False
+    qb.change_feed = None
+    qb.query_batch = None
+    for key, value in options.items():
+        setattr(qb, key, value)
+    qb._get_standard_headers.return_value = {"Authorization": "Bearer token"}
+    qb._make_request.side_effect = api
+    qb._request_once.side_effect = api
+    return Rest(qb)
+
+
+def _client_error(status, body):
+    """Returns the exception Quickbooks._request_once raises for a response
+    with status and body, for fakes to raise in its place."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    qb = MagicMock()
+    qb.instance_url = "https://qbo"
+    qb._send_request.return_value = response
+    with pytest.raises(Exception) as raised:
+        Quickbooks._request_once(qb, "GET", "https://qbo/query", params={})
+    return raised.value
+
+
+QUERY_TIMEOUT_BODY = b'[{"errorCode": "QUERY_TIMEOUT"}]'
+
+
+def _sync(rest, stream):
+    params = {"query": f"SELECT * FROM {stream} WHERE MetaData.LastUpdatedTime > '2024-01-01'"}
+    return list(rest._sync_records("https://qbo/query", {}, params, stream))
+
+
+class TestPrefetch:
+    @pytest.mark.parametrize("total", [0, 1, 99, 100, 101, 250])
+    def test_prefetch_yields_every_record_once_in_offset_order(self, total):
+        api = FakeQuickbooksApi("Invoice", total)
+        records = _sync(_rest(api, query_prefetch_pages=4), "Invoice")
+
+        assert [r["Id"] for r in records] == [str(i) for i in range(1, total + 1)]
+
+    def test_prefetch_probes_total_with_count_query(self):
+        api = FakeQuickbooksApi("Invoice", 250)
+        _sync(_rest(api, query_prefetch_pages=4), "Invoice")
+
+        assert api.queries[0].startswith("SELECT COUNT(*) FROM Invoice WHERE")
+        page_queries = [q for q in api.queries[1:] if "STARTPOSITION" in q]
+        assert len(page_queries) == 3
+
+    def test_prefetch_keeps_paging_when_rows_are_added_after_count(self):
+        api = FakeQuickbooksApi("Invoice", 100)
+        original_call = api.__call__
+
+        def grow_after_count(method, url, headers=None, params=None, **kwargs):
+            response = original_call(method, url, headers=headers, params=params)
+            if params["query"].upper().startswith("SELECT COUNT(*)"):
+                api.records.append({"Id": "101"})
+            return response
+
+        rest = _rest(api, query_prefetch_pages=4)
+        rest.qb._make_request.side_effect = grow_after_count
+        records = _sync(rest, "Invoice")
+
+        assert [r["Id"] for r in records][-1] == "101"
+        assert len(records) == 101
+
+
+def _page_sizes(api):
+    return [
+        int(re.search(r"MAXRESULTS (\d+)", q).group(1))
+        for q in api.queries
+        if "MAXRESULTS" in q
+    ]
+
+
+class TestPageSize:
+    def test_configured_page_size_is_used_for_every_page(self):
+        api = FakeQuickbooksApi("Invoice", 1200)
+        records = _sync(_rest(api, query_page_size=500), "Invoice")
+
+        assert len(records) == 1200
+        assert _page_sizes(api) == [500, 500, 500]
+
+    def test_page_size_is_capped_at_query_endpoint_maximum(self):
+        assert PageSizer(5000).page_size == MAX_PAGE_SIZE
+
+    def test_adaptive_page_size_grows_toward_maximum(self):
+        api = FakeQuickbooksApi("Invoice", 2000)
+        records = _sync(_rest(api, adaptive_page_size=True), "Invoice")
+
+        assert [r["Id"] for r in records] == [str(i) for i in range(1, 2001)]
+        assert _page_sizes(api)[:5] == [100, 200, 400, 800, 1000]
+
+    def test_adaptive_page_size_shrinks_and_refetches_range_on_server_error(self):
+        api = FakeQuickbooksApi("Invoice", 1000)
+        failed = []
+
+        def fail_large_pages(method, url, headers=None, params=None, **kwargs):
+            if "MAXRESULTS 400" in params["query"] and not failed:
+                failed.append(params["query"])
+                response = MagicMock()
+                response.status_code = 503
+                raise requests.exceptions.HTTPError(response=response)
+            return api(method, url, headers=headers, params=params)
+
+        rest = _rest(api, adaptive_page_size=True)
+        rest.qb._request_once.side_effect = fail_large_pages
+        records = _sync(rest, "Invoice")
+
+        assert failed
+        assert [r["Id"] for r in records] == [str(i) for i in range(1, 1001)]
+        # The failed 400-record page is refetched as two 200-record halves,
+        # without first retrying it at full size.
+        assert _page_sizes(api)[2:4] == [200, 200]
+        rest.qb._make_request.assert_not_called()
+
+    def test_adaptive_page_size_only_grows_after_full_pages(self):
+        sizer = PageSizer(100, adaptive=True)
+
+        sizer.record(100, 40, 0.1)
+        assert sizer.page_size == 100
+        sizer.record(100, 100, 0.1)
+        assert sizer.page_size == 200
+
+    @pytest.mark.parametrize("status,shrinks", [(400, False), (429, False), (500, True), (503, True)])
+    def test_only_timeouts_and_server_errors_shrink_the_page(self, status, shrinks):
+        response = requests.Response()
+        response.status_code = status
+        response._content = b"{}"
+
+        assert Rest._is_page_size_error(RetriableApiError("failed", response=response)) == shrinks
+        assert Rest._is_page_size_error(requests.exceptions.HTTPError(response=response)) == shrinks
+        assert Rest._is_page_size_error(requests.exceptions.ReadTimeout())
+
+    def test_query_timeout_shrinks_the_page(self):
+        assert Rest._is_page_size_error(_client_error(400, QUERY_TIMEOUT_BODY))
+
+    def test_adaptive_paging_retries_errors_a_smaller_page_would_not_fix(self):
+        api = FakeQuickbooksApi("Invoice", 10)
+        response = requests.Response()
+        response.status_code = 400
+        response._content = b"{}"
+        rest = _rest(api, adaptive_page_size=True)
+        rest.qb._request_once.side_effect = RetriableApiError("invalid", response=response)
+
+        records = _sync(rest, "Invoice")
+
+        assert len(records) == 10
+        assert rest.page_sizer.page_size == 100
+        assert rest.qb._make_request.called
+
+    def test_errors_are_raised_when_adaptive_paging_is_off(self):
+        response = MagicMock()
+        response.status_code = 503
+        rest = _rest(FakeQuickbooksApi("Invoice", 10))
+        rest.qb._make_request.side_effect = requests.exceptions.HTTPError(response=response)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            _sync(rest, "Invoice")
+
+
+class TestPageCursor:
+    @pytest.mark.parametrize("total", [99, 100, 101, 200])
+    def test_pages_start_at_position_one_and_never_repeat_a_boundary_record(self, total):
+        api = FakeQuickbooksApi("Invoice", total)
+        records = _sync(_rest(api), "Invoice")
+
+        assert [r["Id"] for r in records] == [str(i) for i in range(1, total + 1)]
+        assert "STARTPOSITION 1 MAXRESULTS 100" in api.queries[0]
+
+    def test_reserve_keeps_pages_adjacent_when_page_size_changes(self):
+        cursor = PageCursor("Invoice")
+        assert [cursor.reserve(100), cursor.reserve(200), cursor.reserve(50)] == [1, 101, 301]
+
+    def test_verify_counts_overlapping_ids_between_consecutive_pages(self):
+        cursor = PageCursor("Invoice", verify=True)
+        cursor.check(1, 2, [{"Id": "1"}, {"Id": "2"}])
+        cursor.check(3, 2, [{"Id": "2"}, {"Id": "3"}])
+
+        assert cursor.overlaps == 1
+        assert cursor.gaps == 0
+
+    def test_verify_counts_records_returned_after_a_short_page_as_gap(self):
+        cursor = PageCursor("Invoice", verify=True)
+        cursor.check(1, 2, [{"Id": "1"}])
+        cursor.check(3, 2, [{"Id": "3"}])
+
+        assert cursor.gaps == 1
+
+    def test_verify_reports_records_missing_against_count_probe(self, caplog):
+        api = FakeQuickbooksApi("Invoice", 150)
+        original_call = api.__call__
+
+        def drop_a_record(method, url, headers=None, params=None, **kwargs):
+            response = original_call(method, url, headers=headers, params=params)
+            if params["query"].upper().startswith("SELECT COUNT(*)"):
+                api.records.pop()
+            return response
+
+        rest = _rest(api, verify_pagination=True)
+        rest.qb._make_request.side_effect = drop_a_record
+        with caplog.at_level("INFO"):
+            _sync(rest, "Invoice")
+
+        assert '"metric": "pagination_missing_records", "value": 1' in caplog.text
+
+
+def _catalog_entry_for(stream):
+    return {
+        "stream": stream,
+        "tap_stream_id": stream,
+        "metadata": [{"breadcrumb": [], "metadata": {"replication-key": "MetaData.LastUpdatedTime"}}],
+    }
+
+
+class TestShardedBackfill:
+    def _catalog_entry(self):
+        return _catalog_entry_for("Invoice")
+
+    def test_first_sync_splits_history_into_windows(self):
+        rest = _rest(FakeQuickbooksApi("Invoice", 0), backfill_windows=4, backfill_workers=2)
+        rest.qb.get_start_date.return_value = "2020-01-01T00:00:00Z"
+
+        backfill = rest.query(self._catalog_entry(), {})
+
+        assert backfill.manages_bookmark
+        assert len(backfill.windows) == 4
+        assert backfill.windows[0][0].isoformat().startswith("2020-01-01")
+        for (_, previous_end), (next_start, _) in zip(backfill.windows, backfill.windows[1:]):
+            assert previous_end == next_start
+
+    def test_bookmarked_stream_uses_regular_query(self):
+        rest = _rest(FakeQuickbooksApi("Invoice", 0), backfill_windows=4, backfill_workers=2)
+        rest.qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+        state = {"bookmarks": {"Invoice": {"MetaData.LastUpdatedTime": "2024-01-01T00:00:00Z"}}}
+
+        assert not hasattr(rest.query(self._catalog_entry(), state), "manages_bookmark")
+
+    def test_watermark_only_advances_past_fully_consumed_windows(self):
+        rest = _rest(FakeQuickbooksApi("Invoice", 0), backfill_windows=3, backfill_workers=3)
+        rest.qb.get_start_date.return_value = "2020-01-01T00:00:00Z"
+        backfill = rest.query(self._catalog_entry(), {})
+        first_window_released = threading.Event()
+
+        def query_window(catalog_entry, start_date, end_date):
+            index = [w[0] for w in backfill.windows].index(start_date)
+            if index == 0:
+                first_window_released.wait(timeout=5)
+            yield {"Id": str(index)}
+
+        rest._query_window = query_window
+        seen = []
+        for rec in backfill:
+            seen.append((rec["Id"], backfill.watermark))
+            if len(seen) == 2:
+                # Windows 1 and 2 are done but window 0 is still running.
+                assert backfill.watermark is None
+                first_window_released.set()
+
+        assert sorted(rec_id for rec_id, _ in seen) == ["0", "1", "2"]
+        assert backfill.watermark.startswith(str(backfill.windows[-1][1].year))
+
+
+class TestWindowedQuery:
+    def _catalog_entry(self):
+        return TestShardedBackfill._catalog_entry(None)
+
+    def test_windows_are_consecutive_and_end_now(self):
+        rest = _rest(FakeQuickbooksApi("Invoice", 0), query_window_days=30)
+        rest.qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+        state = {"bookmarks": {"Invoice": {"MetaData.LastUpdatedTime": "2024-01-01T00:00:00Z"}}}
+
+        windowed = rest.query(self._catalog_entry(), state)
+
+        assert windowed.manages_bookmark
+        assert windowed.max_workers == 1
+        assert windowed.windows[0][0].isoformat().startswith("2024-01-01")
+        assert all((end - start).days == 30 for start, end in windowed.windows[:-1])
+        assert (windowed.windows[-1][1] - windowed.windows[-1][0]).days <= 30
+        for (_, previous_end), (next_start, _) in zip(windowed.windows, windowed.windows[1:]):
+            assert previous_end == next_start
+
+    def test_watermark_is_the_end_of_the_last_finished_window(self):
+        rest = _rest(FakeQuickbooksApi("Invoice", 0), query_window_days=30)
+        rest.qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+        windowed = rest.query(self._catalog_entry(), {})
+        starts = [window[0] for window in windowed.windows]
+
+        def query_window(catalog_entry, start_date, end_date):
+            yield {"Id": str(starts.index(start_date))}
+
+        rest._query_window = query_window
+        watermarks = [(rec["Id"], windowed.watermark) for rec in windowed]
+
+        assert [rec_id for rec_id, _ in watermarks] == [str(i) for i in range(len(starts))]
+        assert watermarks[0][1] is None
+        assert watermarks[1][1] == singer_utils.strftime(windowed.windows[0][1])
+
+
+class FakeSortedQuickbooksApi:
+    """Serves QBO query responses that honour the LastUpdatedTime filter and
+    ORDERBY clause. Records sharing a time come back in a different order on
+    every request unless the query orders by Id.
+
+    Every record is active, so queries on Active = false return nothing.
+    Queries whose time range is longer than max_range_days fail with
+    QUERY_TIMEOUT."""
+
+    def __init__(self, times, stream="Invoice", max_range_days=None):
+        self.stream = stream
+        self.records = [{"Id": str(i), "MetaData": {"LastUpdatedTime": value}}
+                        for i, value in enumerate(times, start=1)]
+        self.max_range_days = max_range_days
+        self.queries = []
+        self._rng = random.Random(3)
+
+    def __call__(self, method, url, headers=None, params=None, **kwargs):
+        query = params["query"]
+        self.queries.append(query)
+        match = re.search(r"MetaData.LastUpdatedTime (>=|>|=)\s+'([^']+)'", query)
+        operator, value = match.group(1), match.group(2)
+        bound = singer_utils.strptime_with_tz(value)
+        end_match = re.search(r"MetaData.LastUpdatedTime <= '([^']+)'", query)
+        end = singer_utils.strptime_with_tz(end_match.group(1)) if end_match else singer_utils.now()
+
+        if operator != "=" and self.max_range_days and (end - bound).days > self.max_range_days:
+            raise _client_error(400, QUERY_TIMEOUT_BODY)
+
+        def keep(rec):
+            rec_time = singer_utils.strptime_with_tz(rec["MetaData"]["LastUpdatedTime"])
+            if "Active = false" in query or rec_time > end:
+                return False
+            return {">": rec_time > bound, ">=": rec_time >= bound, "=": rec_time == bound}[operator]
+
+        matching = [rec for rec in self.records if keep(rec)]
+        if "ORDERBY Id" in query:
+            matching.sort(key=lambda rec: int(rec["Id"]))
+        else:
+            self._rng.shuffle(matching)
+            matching.sort(key=lambda rec: rec["MetaData"]["LastUpdatedTime"])
+
+        paging = re.search(r"STARTPOSITION (\d+) MAXRESULTS (\d+)", query)
+        start, max_results = int(paging.group(1)), int(paging.group(2))
+        page = matching[start - 1:start - 1 + max_results]
+        response = MagicMock()
+        response.json.return_value = {"QueryResponse": {self.stream: page} if page else {}}
+        return response
+
+
+class TestKeysetQuery:
+    def _keyset(self, api, page_size=3, start="2024-01-01T00:00:00Z"):
+        rest = _rest(api, keyset_pagination=True, query_page_size=page_size)
+        rest.qb._build_query_string = functools.partial(Quickbooks._build_query_string, rest.qb)
+        rest.qb.get_start_date.return_value = start
+        return rest.query(TestShardedBackfill._catalog_entry(None), {})
+
+    def _times(self):
+        days = [2, 2, 3, 5, 5, 5, 5, 5, 5, 5, 6, 9, 9]
+        return ["2024-01-{:02d}T00:00:00Z".format(day) for day in days]
+
+    def test_every_record_is_yielded_once(self):
+        api = FakeSortedQuickbooksApi(self._times())
+        keyset = self._keyset(api)
+
+        ids = [rec["Id"] for rec in keyset]
+
+        assert isinstance(keyset, KeysetQuery)
+        assert sorted(ids, key=int) == [str(i) for i in range(1, 14)]
+        assert all("ORDERBY MetaData.LastUpdatedTime ASC" in query or "ORDERBY Id" in query
+                   for query in api.queries)
+        # Pages restart from the cursor; only the tie group larger than a page
+        # is paged by position.
+        assert any("ORDERBY Id" in query for query in api.queries)
+        assert all("STARTPOSITION 1 " in query for query in api.queries if "ORDERBY Id" not in query)
+
+    def test_watermark_never_passes_an_unfinished_time(self):
+        times = self._times()
+        keyset = self._keyset(FakeSortedQuickbooksApi(times))
+        yielded = set()
+
+        for rec in keyset:
+            yielded.add(rec["Id"])
+            if keyset.watermark:
+                finished = {str(i) for i, value in enumerate(times, start=1) if value <= keyset.watermark}
+                assert finished <= yielded
+
+        assert keyset.watermark == times[-1]
+
+    def test_resumes_after_the_start_date(self):
+        keyset = self._keyset(FakeSortedQuickbooksApi(self._times()), start="2024-01-05T00:00:00Z")
+
+        assert sorted(rec["Id"] for rec in keyset) == ["11", "12", "13"]
+
+    def test_watermark_covers_every_pass_with_include_deleted(self):
+        times = self._times()
+        api = FakeSortedQuickbooksApi(times, stream="Customer")
+        rest = _rest(api, keyset_pagination=True, query_page_size=3, include_deleted=True)
+        rest.qb._build_query_string = functools.partial(Quickbooks._build_query_string, rest.qb)
+        rest.qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+        keyset = rest.query(_catalog_entry_for("Customer"), {})
+
+        ids = [rec["Id"] for rec in keyset]
+
+        # No inactive records, yet the active pass still moves the bookmark.
+        assert any("Active = false" in query for query in api.queries)
+        assert sorted(ids, key=int) == [str(i) for i in range(1, 14)]
+        assert keyset.watermark == times[-1]
+
+    def test_query_timeout_narrows_the_pages(self):
+        now = singer_utils.now()
+        times = [singer_utils.strftime(now - datetime.timedelta(days=days)) for days in [14, 12, 12, 9, 5, 1]]
+        api = FakeSortedQuickbooksApi(times, max_range_days=3)
+        keyset = self._keyset(api, start=singer_utils.strftime(now - datetime.timedelta(days=20)))
+
+        ids = [rec["Id"] for rec in keyset]
+
+        assert sorted(ids, key=int) == [str(i) for i in range(1, 7)]
+        assert any("<=" in query for query in api.queries)
+        assert keyset.watermark == times[-1]
+
+    def test_query_timeout_raised_as_retriable_error_narrows_the_pages(self):
+        now = singer_utils.now()
+        times = [singer_utils.strftime(now - datetime.timedelta(days=days)) for days in [14, 12, 12, 9, 5, 1]]
+        api = FakeSortedQuickbooksApi(times, max_range_days=3)
+
+        def retriable(*args, **kwargs):
+            try:
+                return api(*args, **kwargs)
+            except requests.exceptions.HTTPError as ex:
+                raise RetriableApiError(ex.response.text, response=ex.response)
+
+        keyset = self._keyset(retriable, start=singer_utils.strftime(now - datetime.timedelta(days=20)))
+
+        assert sorted((rec["Id"] for rec in keyset), key=int) == [str(i) for i in range(1, 7)]
+
+
+class TestQueryTimeout:
+    def _rest(self, api):
+        rest = _rest(api)
+        rest.qb._build_query_string = functools.partial(Quickbooks._build_query_string, rest.qb)
+        return rest
+
+    def _api(self, now, max_range_days=3):
+        times = [singer_utils.strftime(now - datetime.timedelta(days=days)) for days in [14, 12, 12, 9, 5, 1]]
+        return FakeSortedQuickbooksApi(times, max_range_days=max_range_days)
+
+    def test_client_raises_query_timeout_without_retrying(self, monkeypatch):
+        qb = Quickbooks(realm_id="1", default_start_date="2024-01-01T00:00:00Z")
+        response = requests.Response()
+        response.status_code = 400
+        response._content = QUERY_TIMEOUT_BODY
+        sent = []
+        monkeypatch.setattr(qb, "_send_request", lambda *args: sent.append(args) or response)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            qb._make_request("GET", f"{qb.instance_url}/query", params={})
+
+        assert len(sent) == 1
+
+    def test_query_window_is_halved_until_it_answers(self):
+        now = singer_utils.now()
+        api = self._api(now)
+
+        records = list(self._rest(api)._query_window(
+            _catalog_entry_for("Invoice"), now - datetime.timedelta(days=20), now))
+
+        assert sorted(rec["Id"] for rec in records) == [str(i) for i in range(1, 7)]
+        assert any("<=" in query for query in api.queries)
+
+    def test_open_ended_query_is_halved_until_it_answers(self):
+        now = singer_utils.now()
+        api = self._api(now, max_range_days=10)
+        rest = self._rest(api)
+        rest.qb.get_start_date.return_value = singer_utils.strftime(now - datetime.timedelta(days=15))
+        state = {"bookmarks": {"Invoice": {"MetaData.LastUpdatedTime": rest.qb.get_start_date.return_value}}}
+
+        records = list(rest.query(_catalog_entry_for("Invoice"), state))
+
+        assert sorted(rec["Id"] for rec in records) == [str(i) for i in range(1, 7)]
+
+    def test_adaptive_paging_splits_the_range_once_the_page_cannot_shrink(self):
+        now = singer_utils.now()
+        api = self._api(now)
+        rest = _rest(api, adaptive_page_size=True)
+        rest.qb._build_query_string = functools.partial(Quickbooks._build_query_string, rest.qb)
+
+        records = list(rest._query_window(
+            _catalog_entry_for("Invoice"), now - datetime.timedelta(days=20), now))
+
+        assert sorted(rec["Id"] for rec in records) == [str(i) for i in range(1, 7)]
+        assert any("<=" in query for query in api.queries)
+        assert rest.page_sizer.page_size == MIN_PAGE_SIZE
+
+
+class FakeActiveQuickbooksApi(FakeQuickbooksApi):
+    """FakeQuickbooksApi whose records are partly inactive. Like the query
+    endpoint, it returns active records unless the query filters on Active."""
+
+    def __init__(self, stream, active, inactive):
+        super().__init__(stream, active + inactive)
+        for rec in self.records:
+            rec["Active"] = int(rec["Id"]) <= active
+        self.all_records = self.records
+
+    def __call__(self, method, url, headers=None, params=None, **kwargs):
+        query = params["query"]
+        if "Active IN (true, false)" in query:
+            self.records = self.all_records
+        elif "Active = false" in query:
+            self.records = [rec for rec in self.all_records if not rec["Active"]]
+        else:
+            self.records = [rec for rec in self.all_records if rec["Active"]]
+        return super().__call__(method, url, headers=headers, params=params, **kwargs)
+
+
+class TestSinglePassDeleted:
+    # With 100 record pages, each pass pays for its own trailing short (or
+    # empty) page; a single pass only saves it when the two remainders fit on
+    # one page.
+    @pytest.mark.parametrize("active,inactive,saved", [(930, 40, 1), (1000, 0, 1), (0, 300, 1), (950, 250, 0)])
+    def test_single_pass_reads_the_same_records_in_fewer_requests(self, active, inactive, saved):
+        two_pass_api = FakeActiveQuickbooksApi("Customer", active, inactive)
+        two_pass = _sync(_rest(two_pass_api, include_deleted=True), "Customer")
+        single_pass_api = FakeActiveQuickbooksApi("Customer", active, inactive)
+        single_pass = _sync(_rest(single_pass_api, include_deleted=True, single_pass_deleted=True), "Customer")
+
+        assert sorted(rec["Id"] for rec in single_pass) == sorted(rec["Id"] for rec in two_pass)
+        assert len(single_pass) == active + inactive
+        assert len(two_pass_api.queries) - len(single_pass_api.queries) == saved
+        assert all("Active IN (true, false)" in query for query in single_pass_api.queries)
+
+    def test_excluded_entities_keep_a_single_unfiltered_pass(self):
+        api = FakeActiveQuickbooksApi("Invoice", 10, 0)
+
+        _sync(_rest(api, include_deleted=True, single_pass_deleted=True), "Invoice")
+
+        assert not any("Active" in query for query in api.queries)
+
+    def test_keyset_query_checkpoints_from_the_first_page_in_single_pass(self):
+        times = ["2024-01-{:02d}T00:00:00Z".format(day) for day in range(2, 9)]
+        rest = _rest(FakeSortedQuickbooksApi(times, "Customer"), keyset_pagination=True, query_page_size=3,
+                     include_deleted=True, single_pass_deleted=True)
+        rest.qb._build_query_string = functools.partial(Quickbooks._build_query_string, rest.qb)
+        rest.qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+        keyset = rest.query(_catalog_entry_for("Customer"), {})
+
+        watermarks = [keyset.watermark for _ in keyset]
+
+        assert watermarks[3] == times[1]
+        assert all("Active IN (true, false)" in query for query in rest.qb._make_request.side_effect.queries)
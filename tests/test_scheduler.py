@@ -0,0 +1,74 @@
+"""Unit tests for the concurrent stream scheduler."""
+
+import threading
+
+import pytest
+
+from tap_quickbooks.scheduler import StreamScheduler
+
+
+class RecordingWriter:
+    """Collects written state snapshots instead of printing them."""
+
+    def __init__(self):
+        self.states = []
+        self.messages = []
+
+    def write_message(self, message):
+        self.messages.append(message)
+
+    def write_state(self, state):
+        self.states.append({
+            "current_stream": state.get("current_stream"),
+            "bookmarks": {k: dict(v) for k, v in state.get("bookmarks", {}).items()},
+        })
+
+
+def _entries(*names):
+    return [{"tap_stream_id": name, "stream": name} for name in names]
+
+
+class TestStreamScheduler:
+    def test_merges_each_stream_bookmark_into_global_state(self):
+        writer = RecordingWriter()
+        state = {"bookmarks": {"Term": {"MetaData.LastUpdatedTime": "2024-01-01"}}}
+        scheduler = StreamScheduler(writer, state, _entries("Term", "Class"), max_workers=2)
+
+        def sync(catalog_entry, stream_state, stream_writer):
+            stream_state["bookmarks"].setdefault(catalog_entry["tap_stream_id"], {})["version"] = 1
+            stream_writer.write_state(stream_state)
+
+        scheduler.run(sync)
+
+        assert state["bookmarks"]["Term"] == {"MetaData.LastUpdatedTime": "2024-01-01", "version": 1}
+        assert state["bookmarks"]["Class"] == {"version": 1}
+        assert writer.states[-1]["current_stream"] is None
+
+    def test_current_stream_is_first_incomplete_stream_in_catalog_order(self):
+        writer = RecordingWriter()
+        state = {}
+        scheduler = StreamScheduler(writer, state, _entries("Term", "Class"), max_workers=2)
+        class_done = threading.Event()
+
+        def sync(catalog_entry, stream_state, stream_writer):
+            if catalog_entry["tap_stream_id"] == "Term":
+                # Term finishes after Class, so Class completing must not
+                # move current_stream past Term.
+                class_done.wait(timeout=5)
+            else:
+                class_done.set()
+
+        scheduler.run(sync)
+
+        current_streams = [s["current_stream"] for s in writer.states]
+        assert current_streams == ["Term", None]
+
+    def test_reraises_first_stream_failure(self):
+        writer = RecordingWriter()
+        scheduler = StreamScheduler(writer, {}, _entries("Term", "Class"), max_workers=1)
+
+        def sync(catalog_entry, stream_state, stream_writer):
+            raise ValueError(catalog_entry["tap_stream_id"])
+
+        with pytest.raises(ValueError, match="Term"):
+            scheduler.run(sync)
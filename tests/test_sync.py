@@ -0,0 +1,325 @@
+"""Unit tests for record syncing and bookmarking in sync.py."""
+
+import copy
+import datetime
+import json
+import random
+from unittest.mock import MagicMock
+
+import pytest
+from singer import Transformer
+
+from tap_quickbooks import sync
+from tap_quickbooks.quickbooks import QB_OBJECT_DEFINITIONS, field_to_property_schema
+from tap_quickbooks.sync import (
+    compile_transformer,
+    parse_replication_key_value,
+    replication_key_getter,
+    sync_records,
+    transform_data_hook,
+)
+
+REPLICATION_KEY = "MetaData.LastUpdatedTime"
+
+
+class ListWriter:
+    """Collects Singer messages in memory."""
+
+    def __init__(self):
+        self.messages = []
+
+    def write_message(self, message):
+        self.messages.append(message)
+
+    def write_state(self, state):
+        self.messages.append(("STATE", copy.deepcopy(state)))
+
+
+def _catalog_entry(stream="Invoice", replication_key=REPLICATION_KEY):
+    return {
+        "stream": stream,
+        "tap_stream_id": stream,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "Id": {"type": ["string", "null"]},
+                "MetaData": {"type": ["string", "null"]},
+            },
+        },
+        "metadata": [{"breadcrumb": [], "metadata": {"replication-key": replication_key}}],
+    }
+
+
+def _record(record_id, last_updated):
+    return {"Id": record_id, "MetaData": {"CreateTime": last_updated, "LastUpdatedTime": last_updated}}
+
+
+def _sync(records, state=None):
+    qb = MagicMock()
+    qb.get_start_date.return_value = "2020-01-01T00:00:00Z"
+    qb.query.return_value = iter(records)
+    state = state if state is not None else {}
+    writer = ListWriter()
+    sync_records(qb, _catalog_entry(), state, MagicMock(), False, writer)
+    return state, writer
+
+
+class TestReplicationKeyGetter:
+    def test_reads_nested_path_from_raw_record(self):
+        get = replication_key_getter(REPLICATION_KEY)
+        assert get(_record("1", "2024-01-02T03:04:05-08:00")) == "2024-01-02T03:04:05-08:00"
+
+    @pytest.mark.parametrize("rec", [{}, {"MetaData": None}, {"MetaData": "not a dict"}])
+    def test_missing_path_returns_none(self, rec):
+        assert replication_key_getter(REPLICATION_KEY)(rec) is None
+
+
+class TestParseReplicationKeyValue:
+    @pytest.mark.parametrize(
+        "value",
+        ["2024-01-02T03:04:05-08:00", "2024-01-02T11:04:05Z", "2024-01-02T11:04:05"],
+    )
+    def test_returns_aware_datetime(self, value):
+        parsed = parse_replication_key_value(value)
+        assert parsed.tzinfo is not None
+        assert parsed == datetime.datetime(2024, 1, 2, 11, 4, 5, tzinfo=datetime.timezone.utc)
+
+    def test_empty_value_is_none(self):
+        assert parse_replication_key_value("") is None
+
+
+class TestSyncRecordsBookmark:
+    def test_bookmark_is_running_max_in_original_format(self):
+        state, _ = _sync([
+            _record("1", "2024-01-02T00:00:00-08:00"),
+            _record("2", "2024-03-01T00:00:00-08:00"),
+            _record("3", "2024-02-01T00:00:00-08:00"),
+        ])
+
+        assert state["bookmarks"]["Invoice"][REPLICATION_KEY] == "2024-03-01T00:00:00-08:00"
+
+    def test_future_values_do_not_move_bookmark(self):
+        state, _ = _sync([
+            _record("1", "2024-01-02T00:00:00-08:00"),
+            _record("2", "2999-01-01T00:00:00-08:00"),
+        ])
+
+        assert state["bookmarks"]["Invoice"][REPLICATION_KEY] == "2024-01-02T00:00:00-08:00"
+
+    def test_bookmark_is_flushed_to_state_at_batch_boundaries(self, monkeypatch):
+        monkeypatch.setattr(sync, "BOOKMARK_FLUSH_INTERVAL", 2)
+        state = {}
+        seen = []
+
+        def records():
+            yield _record("1", "2024-01-01T00:00:00Z")
+            yield _record("2", "2024-01-02T00:00:00Z")
+            seen.append(state.get("bookmarks", {}).get("Invoice", {}).get(REPLICATION_KEY))
+            yield _record("3", "2024-01-03T00:00:00Z")
+            seen.append(state.get("bookmarks", {}).get("Invoice", {}).get(REPLICATION_KEY))
+
+        _sync(records(), state)
+
+        assert seen == ["2024-01-02T00:00:00Z", "2024-01-02T00:00:00Z"]
+        assert state["bookmarks"]["Invoice"][REPLICATION_KEY] == "2024-01-03T00:00:00Z"
+
+    def test_records_are_written_with_serialized_metadata(self):
+        _, writer = _sync([_record("1", "2024-01-02T00:00:00Z")])
+
+        record = writer.messages[0].record
+        assert record["Id"] == "1"
+        assert isinstance(record["MetaData"], str)
+
+
+class FakeWindowedRecords:
+    """Yields records_per_window records per window and advances watermark
+    to a window's end once all of its records have been yielded."""
+
+    manages_bookmark = True
+
+    def __init__(self, window_ends, records_per_window, fail_at=None):
+        self.window_ends = window_ends
+        self.records_per_window = records_per_window
+        self.fail_at = fail_at
+        self.watermark = None
+
+    def __iter__(self):
+        count = 0
+        for window_end in self.window_ends:
+            for _ in range(self.records_per_window):
+                if count == self.fail_at:
+                    raise RuntimeError("interrupted")
+                count += 1
+                yield _record(str(count), window_end)
+            self.watermark = window_end
+
+
+def _sync_windowed(records, records_interval=2, seconds_interval=3600):
+    qb = MagicMock()
+    qb.get_start_date.return_value = "2020-01-01T00:00:00Z"
+    qb.query.return_value = records
+    qb.state_checkpoint_records = records_interval
+    qb.state_checkpoint_seconds = seconds_interval
+    state = {}
+    writer = ListWriter()
+    try:
+        sync_records(qb, _catalog_entry(), state, MagicMock(), False, writer)
+    except RuntimeError:
+        pass
+    return state, writer
+
+
+def _emitted_bookmarks(writer):
+    return [message[1]["bookmarks"]["Invoice"][REPLICATION_KEY]
+            for message in writer.messages if isinstance(message, tuple)]
+
+
+class TestSyncRecordsStateCheckpoint:
+    def test_safe_watermark_is_emitted_while_syncing(self):
+        ends = ["2024-01-31T00:00:00Z", "2024-02-29T00:00:00Z", "2024-03-31T00:00:00Z"]
+        _, writer = _sync_windowed(FakeWindowedRecords(ends, 3, fail_at=7))
+
+        # The crash lost the third window, but the first two were checkpointed.
+        assert _emitted_bookmarks(writer) == ends[:2]
+
+    def test_state_is_only_emitted_when_the_watermark_advanced(self):
+        _, writer = _sync_windowed(FakeWindowedRecords(["2024-01-31T00:00:00Z"], 10), records_interval=1)
+
+        assert _emitted_bookmarks(writer) == []
+
+    def test_elapsed_time_triggers_emission(self):
+        ends = ["2024-01-31T00:00:00Z", "2024-02-29T00:00:00Z"]
+        _, writer = _sync_windowed(FakeWindowedRecords(ends, 2, fail_at=3),
+                                   records_interval=10 ** 6, seconds_interval=0)
+
+        assert _emitted_bookmarks(writer) == ends[:1]
+
+
+class FakeReportRecords:
+    """Yields one record per period and advances checkpoint after each."""
+
+    def __init__(self, periods, fail_at=None):
+        self.periods = periods
+        self.fail_at = fail_at
+        self.checkpoint = None
+
+    def __iter__(self):
+        for index, end_date in enumerate(self.periods):
+            if index == self.fail_at:
+                raise RuntimeError("interrupted")
+            yield {"Id": end_date, "MetaData": None}
+            self.checkpoint = {"start_date": "2024-01-01", "end_date": end_date, "granularity": "month"}
+
+
+def _sync_report(records, state):
+    qb = MagicMock()
+    qb.get_start_date.return_value = "2024-01-01T00:00:00Z"
+    qb.query_report.return_value = records
+    writer = ListWriter()
+    try:
+        sync_records(qb, _catalog_entry("GeneralLedgerAccrualReport", replication_key=None),
+                     state, MagicMock(), False, writer)
+    except RuntimeError:
+        pass
+    return writer
+
+
+class TestSyncRecordsReportCheckpoint:
+    def test_state_is_written_after_each_completed_period(self):
+        state = {}
+        writer = _sync_report(FakeReportRecords(["2024-01-31", "2024-02-29", "2024-03-31"], fail_at=2), state)
+
+        states = [message[1]["bookmarks"]["GeneralLedgerAccrualReport"]["checkpoint"]["end_date"]
+                  for message in writer.messages if isinstance(message, tuple)]
+        assert states == ["2024-01-31"]
+        # The second period's record was written before the failure, but its
+        # completion was never reported, so it is fetched again on resume.
+        assert [m.record["Id"] for m in writer.messages if not isinstance(m, tuple)] == ["2024-01-31", "2024-02-29"]
+
+    def test_resumed_sync_reuses_the_version_and_clears_the_checkpoint(self):
+        checkpoint = {"start_date": "2024-01-01", "end_date": "2024-01-31", "granularity": "month", "version": 42}
+        state = {"bookmarks": {"GeneralLedgerAccrualReport": {"checkpoint": checkpoint}}}
+
+        writer = _sync_report(FakeReportRecords(["2024-02-29"]), state)
+
+        assert "checkpoint" not in state["bookmarks"]["GeneralLedgerAccrualReport"]
+        versions = {m.version for m in writer.messages if not isinstance(m, tuple)}
+        assert versions == {42}
+
+
+def _stream_schema(stream):
+    properties = {}
+    for field in QB_OBJECT_DEFINITIONS[stream]:
+        properties[field["name"]], _ = field_to_property_schema(field, {})
+    return {"type": "object", "properties": properties}
+
+
+SCALARS = [None, "", "0.0", "1,234.5", "12", "abc", "false", "True", 0, 7, 2.5, True, False,
+           "2024-01-02T03:04:05-08:00", "2024-01-02", "not a date"]
+
+
+def _random_value(schema, rng, depth=0):
+    """Builds a value that usually, but not always, matches schema."""
+    if rng.random() < 0.15 or depth > 4:
+        return rng.choice(SCALARS + [{"nested": "1"}, ["a"]])
+    schema = schema["anyOf"][0] if "anyOf" in schema else schema
+    types = schema.get("type", [])
+    if "object" in types:
+        return {
+            name: _random_value(subschema, rng, depth + 1)
+            for name, subschema in schema.get("properties", {}).items()
+            if rng.random() < 0.7
+        }
+    if "array" in types:
+        return [_random_value(schema["items"], rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return rng.choice(SCALARS)
+
+
+def _singer_transform(rec, schema):
+    with Transformer(pre_hook=transform_data_hook) as transformer:
+        return transformer.transform(rec, schema)
+
+
+def _outcome(transform, rec):
+    try:
+        return json.dumps(transform(copy.deepcopy(rec)))
+    except Exception as ex:  # pylint: disable=broad-except
+        return type(ex).__name__
+
+
+class TestCompileTransformer:
+    @pytest.mark.parametrize("stream", sorted(QB_OBJECT_DEFINITIONS))
+    def test_output_is_identical_to_singer_transformer(self, stream):
+        schema = _stream_schema(stream)
+        transform = compile_transformer(copy.deepcopy(schema))
+        rng = random.Random(stream)
+
+        for _ in range(50):
+            rec = _random_value(schema, rng)
+            expected = _outcome(lambda r: _singer_transform(r, copy.deepcopy(schema)), rec)
+            assert _outcome(transform, rec) == expected
+
+    def test_nested_objects_are_projected_and_serialized(self):
+        schema = _stream_schema("Invoice")
+        rec = {"Id": "1", "Line": [{"Amount": "1,000.5", "Unknown": 1, "SalesItemLineDetail": {"Qty": "0.0"}}],
+               "MetaData": {"CreateTime": "2024-01-02T03:04:05-08:00"}}
+
+        assert compile_transformer(schema)(copy.deepcopy(rec)) == _singer_transform(rec, schema)
+
+    def test_schema_mismatch_raises_singer_error(self):
+        schema = {"type": "object", "properties": {"Amount": {"type": "number"}}}
+
+        with pytest.raises(Exception, match="Amount"):
+            compile_transformer(schema)({"Amount": "abc"})
+
+
+class TestRecordCounter:
+    def test_log_line_includes_records_per_second(self):
+        with sync.record_counter("Invoice") as counter:
+            counter.logger = MagicMock()
+            counter.increment(10)
+
+        point = json.loads(counter.logger.info.call_args[0][1])
+        assert point["value"] == 10
+        assert point["tags"]["endpoint"] == "Invoice"
+        assert point["tags"]["records_per_second"] > 0
@@ -0,0 +1,75 @@
+"""Unit tests for the buffered Singer message writer."""
+
+import decimal
+import io
+import json
+
+import singer
+
+from tap_quickbooks import writer as writer_module
+from tap_quickbooks.writer import MessageWriter, encode_message
+
+
+def _record(record_id):
+    return singer.RecordMessage(stream="Invoice", record={"Id": record_id, "Amount": 1.5}, version=1)
+
+
+def _lines(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+class TestMessageWriter:
+    def test_records_are_held_until_the_buffer_fills(self):
+        output = io.StringIO()
+        writer = MessageWriter(buffer_size=len(encode_message(_record("1"))) * 3, output=output)
+
+        writer.write_message(_record("1"))
+        writer.write_message(_record("2"))
+        assert output.getvalue() == ""
+
+        writer.write_message(_record("3"))
+        assert [line["record"]["Id"] for line in _lines(output)] == ["1", "2", "3"]
+
+    def test_state_flushes_preceding_records_in_order(self):
+        output = io.StringIO()
+        writer = MessageWriter(output=output)
+
+        writer.write_message(_record("1"))
+        writer.write_state({"bookmarks": {"Invoice": {"MetaData.LastUpdatedTime": "2024-01-01"}}})
+
+        assert [line["type"] for line in _lines(output)] == ["RECORD", "STATE"]
+
+    def test_flush_writes_remaining_records(self):
+        output = io.StringIO()
+        writer = MessageWriter(output=output)
+
+        writer.write_message(_record("1"))
+        writer.flush()
+
+        assert len(_lines(output)) == 1
+
+    def test_zero_buffer_size_writes_every_message(self):
+        output = io.StringIO()
+        writer = MessageWriter(buffer_size=0, output=output)
+
+        writer.write_message(_record("1"))
+
+        assert len(_lines(output)) == 1
+
+
+class TestEncodeMessage:
+    def test_matches_singer_encoding(self):
+        message = _record("1")
+
+        assert json.loads(encode_message(message)) == json.loads(singer.format_message(message))
+
+    def test_falls_back_to_singer_encoder_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(writer_module, "orjson", None)
+        message = _record("1")
+
+        assert encode_message(message) == singer.format_message(message) + "\n"
+
+    def test_decimals_are_encoded_as_numbers(self):
+        message = singer.RecordMessage(stream="Invoice", record={"Amount": decimal.Decimal("1.10")})
+
+        assert '"Amount": 1.10' in encode_message(message)